@@ -0,0 +1,105 @@
+"""Benchmark the consumption model on long synthetic routes: the route
+profile, built once per direct route, and the cumulative SoC, computed
+for each car and temperature.
+
+    poetry run python -m benchmarks.consumption
+"""
+
+import timeit
+
+import numpy as np
+
+# offline sets up the environment, before any oufoaler import
+from benchmarks import offline  # noqa: F401
+from oufoaler.models.car import Car
+from oufoaler.models.route import Route
+from oufoaler.services.consumption import ConsumptionModel, route_profile
+
+CAR = Car("bench", "Bench", "Car", "1", 150.0, 77.0, 520.0, 360.0)
+
+
+def synthetic_itinerary(
+    points: int, steps: int, slopes: int, seed: int = 0
+) -> tuple[dict, Route]:
+    """ORS-like itinerary of `points` vertices from Brest eastwards, with
+    `steps` steps of random speeds and `slopes` steepness ranges."""
+    rng = np.random.default_rng(seed)
+    lon = np.linspace(-4.49, 7.26, points)
+    lat = 48.39 + 0.3 * np.sin(np.linspace(0.0, 20.0, points))
+    route = Route(np.column_stack([lon, lat]), "spherical")
+    distances_m = np.diff(route.cumulative_distances) * 1000.0
+
+    def ranges(count: int) -> np.ndarray:
+        cuts = np.sort(rng.choice(np.arange(1, points - 1), count - 1, replace=False))
+        return np.column_stack([np.r_[0, cuts], np.r_[cuts, points - 1]])
+
+    step_list = []
+    for first, last in ranges(steps).tolist():
+        distance = float(distances_m[first:last].sum())
+        speed_kmh = rng.choice([30.0, 50.0, 80.0, 110.0, 130.0])
+        step_list.append(
+            {
+                "distance": round(distance, 1),
+                "duration": round(distance / (speed_kmh / 3.6), 1),
+                "way_points": [first, last],
+            }
+        )
+    steepness = [
+        [first, last, int(rng.integers(-3, 4))]
+        for first, last in ranges(slopes).tolist()
+    ]
+    itinerary = {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {
+                    "segments": [{"steps": step_list}],
+                    "extras": {"steepness": {"values": steepness}},
+                },
+                "geometry": {"type": "LineString", "coordinates": []},
+            }
+        ],
+    }
+    return itinerary, route
+
+
+def main() -> None:
+    model = ConsumptionModel()
+    for points, steps, slopes in ((5_000, 150, 300), (50_000, 1_500, 3_000)):
+        itinerary, route = synthetic_itinerary(points, steps, slopes)
+        cumulative_distances = route.cumulative_distances
+        profile = route_profile(itinerary, cumulative_distances)
+        cumulative_soc = model.cumulative_soc(profile, CAR, 5.0)
+
+        profile_time = (
+            min(
+                timeit.repeat(
+                    lambda: route_profile(itinerary, cumulative_distances),
+                    number=10,
+                    repeat=5,
+                )
+            )
+            / 10
+        )
+        soc_time = (
+            min(
+                timeit.repeat(
+                    lambda: model.cumulative_soc(profile, CAR, 5.0),
+                    number=100,
+                    repeat=5,
+                )
+            )
+            / 100
+        )
+        flat_soc = route.total_distance * model.soc_per_km(CAR, 5.0)
+        print(
+            f"{points} points, {steps} steps, {slopes} slopes: "
+            f"profile {profile_time * 1000:6.3f} ms  "
+            f"cumulative SoC {soc_time * 1000:6.3f} ms  "
+            f"{cumulative_soc[-1]:6.1f}% used, {flat_soc:6.1f}% flat"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark ItineraryController.compute_cumulative_distances against the
+former per-pair geopy loop.
+
+    poetry run python -m benchmarks.cumulative_distances
+"""
+
+import timeit
+
+import numpy as np
+from geopy.distance import geodesic
+
+# offline sets up the environment, before any oufoaler import
+from benchmarks import offline  # noqa: F401
+from oufoaler.controllers.itinerary_controller import ItineraryController
+from oufoaler.models.route import DistanceMode
+
+
+def legacy_cumulative_distances(waypoints) -> tuple[list[float], float]:
+    cumulative_distances = [0.0]
+    total_distance = 0.0
+    for i in range(1, len(waypoints)):
+        distance = geodesic(waypoints[i - 1][::-1], waypoints[i][::-1]).kilometers
+        total_distance += distance
+        cumulative_distances.append(total_distance)
+    return cumulative_distances, total_distance
+
+
+def make_route(n_points: int) -> list[list[float]]:
+    """Zig-zag route from Brest to Nice, as [lon, lat] lists like ORS returns."""
+    t = np.linspace(0.0, 1.0, n_points)
+    lon = -4.49 + (7.26 + 4.49) * t + 0.05 * np.sin(t * 400)
+    lat = 48.39 + (43.70 - 48.39) * t + 0.05 * np.cos(t * 400)
+    return np.column_stack([lon, lat]).tolist()
+
+
+def main() -> None:
+    itinerary_ctrl = ItineraryController()
+
+    for n_points in (1_000, 10_000, 50_000):
+        waypoints = make_route(n_points)
+        legacy, legacy_total = legacy_cumulative_distances(waypoints)
+
+        print(f"{n_points} points")
+        runs = 1 if n_points > 10_000 else 3
+        legacy_time = min(
+            timeit.repeat(
+                lambda: legacy_cumulative_distances(waypoints), number=1, repeat=runs
+            )
+        )
+        print(
+            f"  geopy loop   {legacy_time * 1000:9.2f} ms  total={legacy_total:.3f} km"
+        )
+
+        mode: DistanceMode
+        for mode in ("ellipsoidal", "spherical"):
+            cumulative, total = itinerary_ctrl.compute_cumulative_distances(
+                waypoints, mode=mode
+            )
+            elapsed = min(
+                timeit.repeat(
+                    lambda: itinerary_ctrl.compute_cumulative_distances(
+                        waypoints, mode=mode
+                    ),
+                    number=1,
+                    repeat=10,
+                )
+            )
+            max_error = np.max(np.abs(cumulative - np.asarray(legacy)))
+            print(
+                f"  {mode:<12} {elapsed * 1000:9.2f} ms  total={total:.3f} km  "
+                f"x{legacy_time / elapsed:.0f}  max error={max_error * 1000:.3f} m"
+            )
+
+
+if __name__ == "__main__":
+    main()
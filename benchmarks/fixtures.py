@@ -0,0 +1,385 @@
+"""Upstream fixtures for the offline benchmarks: ORS routes, the Chargetrip
+vehicle catalogue and ODRE charging stations, for short, medium and
+cross-country itineraries.
+
+Fixtures are synthetic unless recorded: `generate` builds them from a
+seeded random model (a meandering route sampled every ~80 m, stations in
+a band around it, denser at service areas and in the cities at both
+ends), which needs no network. `record` replays the app's own requests
+against the real APIs (API keys in the environment) and stores what they
+returned: the ORS routes, the catalogue and every station fetched while
+planning with the most powerful car. Either way they are written to
+benchmarks/fixtures/, which is not versioned, and are generated on first
+use when missing.
+
+    poetry run python -m benchmarks.fixtures generate
+    poetry run python -m benchmarks.fixtures record short medium
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pyproj
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+CARS_FIXTURE = "cars"
+
+# name: (departure, arrival) as (lon, lat)
+ROUTES = {
+    "short": ((2.3522, 48.8566), (1.9093, 47.9030)),  # Paris - Orléans
+    "medium": ((2.3522, 48.8566), (4.8357, 45.7640)),  # Paris - Lyon
+    "cross_country": ((-4.4861, 48.3904), (7.2620, 43.7102)),  # Brest - Nice
+}
+
+GEOD = pyproj.Geod(ellps="WGS84")
+VERTEX_SPACING_M = 80.0
+AVERAGE_SPEED_KMH = 100.0
+BAND_KM = 60.0  # stations are generated this far from the route
+BACKGROUND_DENSITY = 0.05  # charging points per km², about the national average
+SERVICE_AREA_SPACING_KM = 40.0
+CITY_POINTS = 2000
+CITY_RADIUS_KM = 8.0
+
+POWERS = [3.7, 7.4, 11.0, 22.0, 50.0, 150.0]
+POWER_WEIGHTS = [0.05, 0.25, 0.1, 0.45, 0.1, 0.05]
+FAST_POWERS = [50.0, 150.0, 350.0]
+PLUG_TYPES = ["T2", "EF - T2", "CCS - T2", "CCS - T2 - CHAdeMO", "EF"]
+PLUG_WEIGHTS = [0.35, 0.35, 0.15, 0.05, 0.1]
+
+
+def fixture_path(name: str) -> Path:
+    return FIXTURES_DIR / f"{name}.json.gz"
+
+
+def save_fixture(name: str, fixture: dict) -> None:
+    FIXTURES_DIR.mkdir(parents=True, exist_ok=True)
+    with gzip.open(fixture_path(name), "wt", encoding="utf-8") as f:
+        json.dump(fixture, f)
+
+
+def load_fixture(name: str) -> dict:
+    """Load a fixture, generating a synthetic one if none was saved."""
+    path = fixture_path(name)
+    if not path.exists():
+        save_fixture(name, generate_fixture(name))
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def meander(start, end, seed: int = 0) -> np.ndarray:
+    """Road-like [lon, lat] line from `start` to `end`, wandering off the
+    geodesic by up to a few km (less on lines shorter than 50 km)."""
+    _, _, distance = GEOD.inv(*start, *end)
+    n = max(int(distance / VERTEX_SPACING_M), 1)
+    inner = GEOD.npts(start[0], start[1], end[0], end[1], n - 1) if n > 1 else []
+    line = np.array([start, *inner, end], dtype=np.float64)
+    if len(line) > 2:
+        rng = np.random.default_rng(seed)
+        t = np.linspace(0.0, 1.0, len(line))
+        waves = rng.uniform(2.0, 12.0, size=3) * distance / 100_000
+        # in degrees, smaller on short lines, e.g. detours to a station
+        amplitude = min(distance / 50_000, 1.0)
+        wobble = amplitude * sum(
+            rng.uniform(0.005, 0.03) * np.sin(t * wave * np.pi) for wave in waves
+        )
+        line[1:-1, 1] += wobble[1:-1]
+        line[1:-1, 0] += wobble[::-1][1:-1] / np.cos(np.radians(line[1:-1, 1]))
+    return line
+
+
+def line_length_m(coordinates: np.ndarray) -> float:
+    _, _, distances = GEOD.inv(
+        coordinates[:-1, 0], coordinates[:-1, 1], coordinates[1:, 0], coordinates[1:, 1]
+    )
+    return float(np.sum(distances))
+
+
+def ors_response(legs: list[np.ndarray]) -> dict:
+    """ORS GeoJSON directions response made of consecutive legs."""
+    coordinates, way_points, segments = [], [0], []
+    for leg in legs:
+        leg = np.asarray(leg, dtype=np.float64)
+        points = leg.tolist() if not coordinates else leg[1:].tolist()
+        coordinates.extend(points)
+        way_points.append(len(coordinates) - 1)
+        distance = line_length_m(leg) if len(leg) > 1 else 0.0
+        duration = distance / (AVERAGE_SPEED_KMH / 3.6)
+        segments.append(
+            {
+                "distance": round(distance, 1),
+                "duration": round(duration, 1),
+                "steps": [
+                    {
+                        "distance": round(distance, 1),
+                        "duration": round(duration, 1),
+                        "type": 11,
+                        "instruction": "Head on",
+                        "name": "-",
+                        "way_points": [way_points[-2], way_points[-1]],
+                    }
+                ],
+            }
+        )
+    array = np.asarray(coordinates)
+    bbox = [*array.min(axis=0).tolist(), *array.max(axis=0).tolist()]
+    return {
+        "type": "FeatureCollection",
+        "bbox": bbox,
+        "features": [
+            {
+                "bbox": bbox,
+                "type": "Feature",
+                "properties": {
+                    "segments": segments,
+                    "summary": {
+                        "distance": round(sum(s["distance"] for s in segments), 1),
+                        "duration": round(sum(s["duration"] for s in segments), 1),
+                    },
+                    "way_points": way_points,
+                },
+                "geometry": {"type": "LineString", "coordinates": coordinates},
+            }
+        ],
+        "metadata": {"attribution": "synthetic", "service": "routing"},
+    }
+
+
+def synthetic_stations(route: np.ndarray, seed: int) -> list[dict]:
+    """IRVE-like charging points: a uniform band around the route, service
+    areas along it and a cluster in each end city. Points are grouped in
+    stations of 1 to 8, sharing their id_station and coordinates."""
+    rng = np.random.default_rng(seed)
+    length_km = line_length_m(route) / 1000.0
+    lat_scale = 1 / 111.2  # degrees per km
+
+    def around(lon, lat, dx_km, dy_km):
+        return (
+            lon + dx_km * lat_scale / np.cos(np.radians(lat)),
+            lat + dy_km * lat_scale,
+        )
+
+    groups = []  # (lon, lat, powers, plugs)
+
+    def add_stations(lon, lat, fast: bool) -> None:
+        for x, y in zip(np.atleast_1d(lon), np.atleast_1d(lat)):
+            size = int(rng.integers(2, 9) if fast else rng.integers(1, 4))
+            powers = (
+                rng.choice(FAST_POWERS, size=size)
+                if fast
+                else np.full(size, rng.choice(POWERS, p=POWER_WEIGHTS))
+            )
+            plugs = rng.choice(PLUG_TYPES, size=size, p=PLUG_WEIGHTS)
+            groups.append((float(x), float(y), powers, plugs))
+
+    # Band around the route, of stations of two points on average
+    n_stations = int(BACKGROUND_DENSITY * 2 * BAND_KM * length_km / 2)
+    anchors = route[rng.integers(0, len(route), size=n_stations)]
+    lon, lat = around(
+        anchors[:, 0],
+        anchors[:, 1],
+        rng.uniform(-BAND_KM, BAND_KM, size=n_stations),
+        rng.uniform(-BAND_KM, BAND_KM, size=n_stations),
+    )
+    add_stations(lon, lat, fast=False)
+
+    # Service areas right along the route
+    n_areas = int(length_km / SERVICE_AREA_SPACING_KM)
+    anchors = route[np.linspace(0, len(route) - 1, n_areas + 2, dtype=int)[1:-1]]
+    lon, lat = around(
+        anchors[:, 0],
+        anchors[:, 1],
+        rng.uniform(-0.4, 0.4, size=n_areas),
+        rng.uniform(-0.4, 0.4, size=n_areas),
+    )
+    add_stations(lon, lat, fast=True)
+
+    # Cities at both ends
+    for city in (route[0], route[-1]):
+        n_city = CITY_POINTS // 2
+        lon, lat = around(
+            city[0],
+            city[1],
+            rng.normal(0, CITY_RADIUS_KM, size=n_city),
+            rng.normal(0, CITY_RADIUS_KM, size=n_city),
+        )
+        add_stations(lon, lat, fast=False)
+
+    stations = []
+    for i, (lon, lat, powers, plugs) in enumerate(groups):
+        station_id = f"FRSYNS{seed:02d}{i:06d}"
+        for j, (power, plug) in enumerate(zip(powers, plugs)):
+            stations.append(
+                {
+                    "nom_station": f"Synthetic station {i}",
+                    "id_station": station_id,
+                    "id_pdc_itinerance": f"{station_id}P{j}",
+                    "nom_operateur": "Synthetic",
+                    "xlongitude": round(lon, 6),
+                    "ylatitude": round(lat, 6),
+                    "geo_point_borne": {"lon": round(lon, 6), "lat": round(lat, 6)},
+                    "puiss_max": float(power),
+                    "type_prise": str(plug),
+                    "date_maj": "2024-01-01",
+                }
+            )
+    return stations
+
+
+def synthetic_cars(seed: int = 0, count: int = 40) -> dict:
+    """Chargetrip `vehicleList` GraphQL response."""
+    rng = np.random.default_rng(seed)
+    vehicles = []
+    for i in range(count):
+        battery = float(rng.choice([40.0, 52.0, 60.0, 77.0, 82.0, 100.0]))
+        best = round(battery * rng.uniform(5.5, 7.0))
+        vehicles.append(
+            {
+                "id": f"synthetic-car-{i:03d}",
+                "naming": {
+                    "make": f"Make {i % 8}",
+                    "model": f"Model {i}",
+                    "version": None,
+                    "edition": None,
+                    "chargetrip_version": f"{battery:.0f} kWh",
+                },
+                "connectors": [
+                    {"standard": "IEC_62196_T2", "max_electric_power": 11},
+                    {
+                        "standard": "IEC_62196_T2_COMBO",
+                        "max_electric_power": int(rng.choice([50, 100, 150, 250])),
+                    },
+                ],
+                "battery": {"usable_kwh": battery, "full_kwh": battery + 3},
+                "range": {
+                    "chargetrip_range": {"best": best, "worst": round(best * 0.7)}
+                },
+                "media": {"image": {"url": f"https://example.invalid/car/{i}.png"}},
+            }
+        )
+    return {"data": {"vehicleList": vehicles}}
+
+
+def generate_fixture(name: str) -> dict:
+    if name == CARS_FIXTURE:
+        return {"synthetic": True, "response": synthetic_cars()}
+    departure, arrival = ROUTES[name]
+    seed = list(ROUTES).index(name)
+    route = meander(departure, arrival, seed)
+    return {
+        "name": name,
+        "synthetic": True,
+        "departure": list(departure),
+        "arrival": list(arrival),
+        "routes": [
+            {
+                "coordinates": [list(departure), list(arrival)],
+                "response": ors_response([route]),
+            }
+        ],
+        "stations": synthetic_stations(route, seed),
+    }
+
+
+async def record_fixtures(names: list[str]) -> None:
+    """Plan each itinerary against the real APIs, saving their responses."""
+    import httpx
+
+    from oufoaler.config import config
+    from oufoaler.models.api import Coordinates, ItineraryRequest
+    from oufoaler.services.car_catalogue import car_catalogue
+    from oufoaler.services.http_client import HttpClient, set_http_client
+    from oufoaler.services.itinerary_planner import itinerary_planner
+
+    exchanges: list[tuple[httpx.Request, httpx.Response]] = []
+
+    class RecordingTransport(httpx.AsyncHTTPTransport):
+        async def handle_async_request(self, request):
+            response = await super().handle_async_request(request)
+            await response.aread()
+            exchanges.append((request, response))
+            return response
+
+    set_http_client(
+        HttpClient(
+            max_concurrency_per_host=config.http_max_concurrency_per_host,
+            rate_limit_per_host=config.http_rate_limit_per_host,
+            transport=RecordingTransport(),
+        )
+    )
+    await car_catalogue.refresh()
+    cars_response = next(
+        response.json()
+        for request, response in exchanges
+        if request.url.host == "api.chargetrip.io"
+    )
+    save_fixture(CARS_FIXTURE, {"synthetic": False, "response": cars_response})
+    car = max(car_catalogue.cars, key=lambda car: car.power)
+
+    for name in names:
+        exchanges.clear()
+        departure, arrival = ROUTES[name]
+        request = ItineraryRequest(
+            car_id=car.id,
+            soc_start=100,
+            soc_min=10,
+            soc_max=90,
+            departure=Coordinates(lon=departure[0], lat=departure[1]),
+            arrival=Coordinates(lon=arrival[0], lat=arrival[1]),
+        )
+        try:
+            await itinerary_planner.compute(request, car)
+        except Exception as e:
+            print(f"{name}: planning failed ({e}), saving what was fetched")
+
+        routes, stations = [], {}
+        for http_request, response in exchanges:
+            if http_request.url.host == "api.openrouteservice.org":
+                body = json.loads(http_request.content)
+                routes.append(
+                    {"coordinates": body["coordinates"], "response": response.json()}
+                )
+            elif http_request.url.host == "odre.opendatasoft.com":
+                for station in response.json().get("results", []):
+                    key = station.get("id_pdc_itinerance") or station.get("id_station")
+                    stations[key] = station
+        save_fixture(
+            name,
+            {
+                "name": name,
+                "synthetic": False,
+                "departure": list(departure),
+                "arrival": list(arrival),
+                "routes": routes,
+                "stations": list(stations.values()),
+            },
+        )
+        print(f"{name}: {len(routes)} routes, {len(stations)} stations recorded")
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=(__doc__ or "").partition("\n")[0])
+    parser.add_argument("command", choices=["generate", "record"])
+    parser.add_argument("names", nargs="*", default=list(ROUTES))
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        asyncio.run(record_fixtures(args.names))
+        return
+    for name in [CARS_FIXTURE, *args.names]:
+        fixture = generate_fixture(name)
+        save_fixture(name, fixture)
+        if name != CARS_FIXTURE:
+            route = fixture["routes"][0]["response"]["features"][0]["geometry"]
+            print(
+                f"{name}: {len(route['coordinates'])} route points, "
+                f"{len(fixture['stations'])} stations"
+            )
+
+
+if __name__ == "__main__":
+    main()
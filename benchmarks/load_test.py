@@ -0,0 +1,108 @@
+"""Load test of POST /itinerary against the stubbed upstream APIs.
+
+The app and the stub both run in this process, over httpx's ASGI
+transport: the numbers measure the app's own work, not the network.
+
+    poetry run python -m benchmarks.load_test --requests 200 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from typing import Optional
+
+import httpx
+import numpy as np
+
+# offline sets up the environment, before any oufoaler import
+from benchmarks import offline, stub_server  # noqa: F401
+from benchmarks.fixtures import ROUTES
+from oufoaler.app import app
+from oufoaler.services.tracing import STAGE_SECONDS
+
+STAGES = ["route", "stations", "distances", "positions", "planning", "reroute"]
+
+
+def random_request(rng: random.Random, car_ids: list[str], jitter: float) -> dict:
+    name = rng.choice(list(ROUTES))
+    (start_lon, start_lat), (end_lon, end_lat) = ROUTES[name]
+    return {
+        "car_id": rng.choice(car_ids),
+        "soc_start": rng.uniform(50.0, 100.0),
+        "soc_min": rng.choice([10.0, 15.0, 20.0]),
+        "soc_max": rng.choice([80.0, 90.0, 100.0]),
+        "departure": {
+            "lon": start_lon + rng.uniform(-jitter, jitter),
+            "lat": start_lat + rng.uniform(-jitter, jitter),
+        },
+        "arrival": {
+            "lon": end_lon + rng.uniform(-jitter, jitter),
+            "lat": end_lat + rng.uniform(-jitter, jitter),
+        },
+    }
+
+
+async def run(requests: int, concurrency: int, seed: int, jitter: float) -> None:
+    upstream = stub_server.install(list(ROUTES))
+    rng = random.Random(seed)
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app),
+            base_url="http://oufoaler",
+            timeout=None,
+        ) as client:
+            cars = (await client.get("/api/v1/cars")).json()
+            car_ids = [car["id"] for car in cars]
+            bodies = [random_request(rng, car_ids, jitter) for _ in range(requests)]
+
+            semaphore = asyncio.Semaphore(concurrency)
+            latencies: list[float] = []
+            errors = 0
+
+            async def send(body: dict) -> None:
+                nonlocal errors
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.post("/api/v1/itinerary", json=body)
+                    latencies.append(time.perf_counter() - start)
+                    if response.status_code != 200:
+                        errors += 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(send(body) for body in bodies))
+            elapsed = time.perf_counter() - start
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000.0
+    print(
+        f"{requests} requests, concurrency {concurrency}: "
+        f"{requests / elapsed:.1f} req/s, {errors} errors"
+    )
+    print(f"latency  p50={p50:.1f} ms  p95={p95:.1f} ms  p99={p99:.1f} ms")
+    for stage in STAGES:
+        count = STAGE_SECONDS.count(stage=stage)
+        if count:
+            mean = STAGE_SECONDS.value(stage=stage) / count * 1000.0
+            print(f"  {stage:<10} {count:5d} spans  mean {mean:8.2f} ms")
+    counts = sorted(upstream.requests.items())
+    print("upstream requests  " + "  ".join(f"{api}={n}" for api, n in counts))
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=(__doc__ or "").partition("\n")[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.02,
+        help="random offset of the endpoints, in degrees, defeating the caches",
+    )
+    args = parser.parse_args(argv)
+    asyncio.run(run(args.requests, args.concurrency, args.seed, args.jitter))
+
+
+if __name__ == "__main__":
+    main()
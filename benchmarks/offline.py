@@ -0,0 +1,13 @@
+"""Settings for running the app against the stub upstream, without keys,
+disk caches or rate limits. Import it before any oufoaler module, as the
+settings are read on import; variables already set are kept."""
+
+import os
+
+os.environ.setdefault("OUFOALER_OPENROUTESERVICE_API_KEY", "benchmark")
+os.environ.setdefault("OUFOALER_CHARGETRIP_CLIENT_ID", "benchmark")
+os.environ.setdefault("OUFOALER_CHARGETRIP_APP_ID", "benchmark")
+os.environ.setdefault("OUFOALER_CAR_CATALOGUE_SNAPSHOT_PATH", "")
+os.environ.setdefault("OUFOALER_ROUTE_CACHE_PATH", "")
+os.environ.setdefault("OUFOALER_HTTP_RATE_LIMIT_PER_HOST", "1000000")
+os.environ.setdefault("OUFOALER_LOGGING_LEVEL", "WARNING")
@@ -0,0 +1,141 @@
+"""Benchmark ItineraryController.plan_recharge_stops against the former
+DataFrame-filtering planner, checking both pick the same stops.
+
+    poetry run python -m benchmarks.plan_recharge_stops
+"""
+
+import timeit
+
+import numpy as np
+import pandas as pd
+
+# offline sets up the environment, before any oufoaler import
+from benchmarks import offline  # noqa: F401
+from oufoaler.controllers.itinerary_controller import ItineraryController
+from oufoaler.models.route import Route
+
+
+def legacy_plan_recharge_stops(
+    df_route, df_stations, soc_start, soc_min, soc_max, soc_per_km
+):
+    recharge_stops = []
+    current_soc = soc_start
+    total_distance = df_route["cumulative_distance_km"].iloc[-1]
+
+    last_recharge_distance = 0.0
+    current_position = 0.0
+
+    df_stations["puiss_max"] = pd.to_numeric(df_stations["puiss_max"], errors="coerce")
+    df_stations = df_stations.dropna(subset=["puiss_max"])
+    df_stations = df_stations[df_stations["puiss_max"] > 0]
+
+    while current_position < total_distance:
+        max_reachable_distance = (
+            last_recharge_distance + (current_soc - soc_min) / soc_per_km
+        )
+
+        if max_reachable_distance >= total_distance:
+            break
+
+        accessible_stations = df_stations[
+            (df_stations["distance_along_route_km"] > current_position)
+            & (df_stations["distance_along_route_km"] <= max_reachable_distance)
+        ]
+
+        if accessible_stations.empty:
+            raise Exception("No accessible charging station before reaching SoC_min.")
+
+        high_power_stations = accessible_stations[
+            accessible_stations["puiss_max"] >= 50.0
+        ]
+
+        if not high_power_stations.empty:
+            next_stop = high_power_stations.iloc[-1]
+        else:
+            next_stop = accessible_stations.iloc[-1]
+
+        recharge_stops.append(next_stop)
+
+        last_recharge_distance = next_stop["distance_along_route_km"]
+        current_soc = soc_max
+
+        current_position = last_recharge_distance
+
+    return recharge_stops
+
+
+def make_inputs(n_stations: int, total_distance: float, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    # Straight route along the equator, one degree being ~111.32 km
+    lon = np.linspace(0.0, total_distance / 111.32, 1000)
+    route = Route(np.column_stack([lon, np.zeros_like(lon)]))
+    total_distance = route.total_distance
+    df_route = pd.DataFrame({"cumulative_distance_km": route.cumulative_distances})
+    df_stations = pd.DataFrame(
+        {
+            "id_station": [f"S{i}" for i in range(n_stations)],
+            "puiss_max": rng.choice(
+                [3.7, 7.4, 22.0, 50.0, 150.0, np.nan, 0.0],
+                size=n_stations,
+                p=[0.1, 0.3, 0.35, 0.1, 0.1, 0.03, 0.02],
+            ),
+            "distance_along_route_km": np.round(
+                rng.uniform(0.0, total_distance, n_stations), 1
+            ),
+        }
+    )
+    df_stations = df_stations.sort_values(
+        "distance_along_route_km", kind="stable"
+    ).reset_index(drop=True)
+    return route, df_route, df_stations
+
+
+def main() -> None:
+    itinerary_ctrl = ItineraryController()
+    # 90% -> 10% with a 300 km range car, 20% <-> 80% between stops
+    soc_start, soc_min, soc_max, soc_per_km = 90.0, 10.0, 80.0, 100.0 / 300.0
+    soc_args = (soc_start, soc_min, soc_max, soc_per_km)
+
+    for n_stations, total_distance in (
+        (1_000, 1_000.0),
+        (10_000, 2_000.0),
+        (50_000, 3_000.0),
+    ):
+        route, df_route, df_stations = make_inputs(n_stations, total_distance)
+        # Flat consumption, as the legacy planner assumes
+        cumulative_soc = route.cumulative_distances * soc_per_km
+        plan_args = (soc_start, soc_min, soc_max, cumulative_soc)
+
+        legacy = legacy_plan_recharge_stops(df_route, df_stations.copy(), *soc_args)
+        current = itinerary_ctrl.plan_recharge_stops(route, df_stations, *plan_args)
+        identical = [stop.name for stop in legacy] == [stop.name for stop in current]
+        identical &= all(a.equals(b) for a, b in zip(legacy, current))
+
+        legacy_time = min(
+            timeit.repeat(
+                lambda: legacy_plan_recharge_stops(
+                    df_route, df_stations.copy(), *soc_args
+                ),
+                number=1,
+                repeat=5,
+            )
+        )
+        current_time = min(
+            timeit.repeat(
+                lambda: itinerary_ctrl.plan_recharge_stops(
+                    route, df_stations, *plan_args
+                ),
+                number=1,
+                repeat=5,
+            )
+        )
+        print(
+            f"{n_stations} stations, {len(current)} stops: "
+            f"legacy {legacy_time * 1000:8.2f} ms  "
+            f"arrays {current_time * 1000:8.2f} ms  "
+            f"x{legacy_time / current_time:.1f}  identical={identical}"
+        )
+
+
+if __name__ == "__main__":
+    main()
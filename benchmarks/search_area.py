@@ -0,0 +1,81 @@
+"""Benchmark the ways of cutting a route's search area into station queries:
+the former 300 km grid (ChargingStationsController.split_polygon_into_grid),
+the route-following corridor parts and the cached tiles.
+
+    poetry run python -m benchmarks.search_area
+"""
+
+import timeit
+
+# offline sets up the environment, before any oufoaler import
+from benchmarks import offline  # noqa: F401
+from benchmarks.fixtures import ROUTES, load_fixture
+from oufoaler.config import config
+from oufoaler.controllers.charging_station_controller import (
+    SUB_POLYGON_SIZE,
+    ChargingStationsController,
+)
+from oufoaler.controllers.itinerary_controller import ItineraryController
+from oufoaler.services.station_tile_cache import tiles_covering
+
+
+def grid_search_area(charging_stations_ctrl, itinerary_ctrl, buffered_wgs84):
+    buffered_wgs84 = charging_stations_ctrl.simplify_geometry(buffered_wgs84)
+    buffered_wgs84 = charging_stations_ctrl.round_coordinates(buffered_wgs84)
+    buffered_projected = itinerary_ctrl.project_geometry(
+        buffered_wgs84, src_crs="epsg:4326", dst_crs="epsg:3857"
+    )
+    return [
+        itinerary_ctrl.project_geometry(cell, src_crs="epsg:3857", dst_crs="epsg:4326")
+        for cell in charging_stations_ctrl.split_polygon_into_grid(
+            buffered_projected, SUB_POLYGON_SIZE
+        )
+    ]
+
+
+def main() -> None:
+    itinerary_ctrl = ItineraryController()
+    charging_stations_ctrl = ChargingStationsController()
+
+    for name in ROUTES:
+        fixture = load_fixture(name)
+        route = itinerary_ctrl.extract_route_from_geojson(
+            fixture["routes"][0]["response"]
+        )
+        buffered_wgs84 = charging_stations_ctrl.buffer_route(route)
+        print(f"{name} ({route.total_distance:.0f} km)")
+
+        elapsed = min(
+            timeit.repeat(
+                lambda: charging_stations_ctrl.buffer_route(route), number=1, repeat=5
+            )
+        )
+        print(f"  buffer         {elapsed * 1000:8.2f} ms")
+
+        methods = {
+            "grid": lambda: grid_search_area(
+                charging_stations_ctrl, itinerary_ctrl, buffered_wgs84
+            ),
+            "corridor": lambda: [
+                part.area
+                for part in charging_stations_ctrl.split_corridor(
+                    route, buffered_wgs84, config.odre_max_chunk_km
+                )
+            ],
+            "tiles": lambda: [
+                tile.box
+                for tile in tiles_covering(buffered_wgs84, config.station_tile_zoom)
+            ],
+        }
+        for method, split in methods.items():
+            areas = split()
+            elapsed = min(timeit.repeat(split, number=1, repeat=5))
+            wkt_length = sum(len(area.wkt) for area in areas)
+            print(
+                f"  {method:<14} {elapsed * 1000:8.2f} ms  {len(areas):4d} areas  "
+                f"{wkt_length / 1000:8.1f} kB of WKT"
+            )
+
+
+if __name__ == "__main__":
+    main()
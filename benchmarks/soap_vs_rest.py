@@ -0,0 +1,103 @@
+"""Compare the overhead of the SOAP and REST itinerary endpoints.
+
+Both plan through the same planner, against the stubbed upstream APIs.
+After a first request per route, plans come from the itinerary cache, so
+the timings measure each API's own request handling and serialization.
+
+    poetry run python -m benchmarks.soap_vs_rest --requests 50
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Optional
+
+import httpx
+import numpy as np
+
+# offline sets up the environment, before any oufoaler import
+from benchmarks import offline, stub_server  # noqa: F401
+from benchmarks.fixtures import ROUTES
+from oufoaler.app import app
+
+SOAP_ENVELOPE = """<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"
+    xmlns:itin="itinerary" xmlns:mod="oufoaler.soap_api">
+  <soapenv:Body>
+    <itin:get_itinerary>
+      <itin:request>
+        <mod:car_id>{car_id}</mod:car_id>
+        <mod:soc_start>{soc_start}</mod:soc_start>
+        <mod:soc_min>{soc_min}</mod:soc_min>
+        <mod:soc_max>{soc_max}</mod:soc_max>
+        <mod:departure_lat>{departure[lat]}</mod:departure_lat>
+        <mod:departure_lon>{departure[lon]}</mod:departure_lon>
+        <mod:arrival_lat>{arrival[lat]}</mod:arrival_lat>
+        <mod:arrival_lon>{arrival[lon]}</mod:arrival_lon>
+      </itin:request>
+    </itin:get_itinerary>
+  </soapenv:Body>
+</soapenv:Envelope>"""
+
+
+async def rest_call(client: httpx.AsyncClient, body: dict) -> httpx.Response:
+    return await client.post("/api/v1/itinerary", json=body)
+
+
+async def soap_call(client: httpx.AsyncClient, body: dict) -> httpx.Response:
+    return await client.post(
+        "/soap/",
+        content=SOAP_ENVELOPE.format(**body),
+        headers={"Content-Type": "text/xml; charset=utf-8", "SOAPAction": ""},
+    )
+
+
+async def run(requests: int) -> None:
+    upstream = stub_server.install(list(ROUTES))
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app),
+            base_url="http://oufoaler",
+            timeout=None,
+        ) as client:
+            cars = (await client.get("/api/v1/cars")).json()
+            for name, ((start_lon, start_lat), (end_lon, end_lat)) in ROUTES.items():
+                body = {
+                    "car_id": cars[0]["id"],
+                    "soc_start": 80.0,
+                    "soc_min": 15.0,
+                    "soc_max": 90.0,
+                    "departure": {"lon": start_lon, "lat": start_lat},
+                    "arrival": {"lon": end_lon, "lat": end_lat},
+                }
+                # Plan once, then both APIs answer from the itinerary cache
+                await rest_call(client, body)
+                print(name)
+                for api, call in (("rest", rest_call), ("soap", soap_call)):
+                    latencies, size = [], 0
+                    for _ in range(requests):
+                        start = time.perf_counter()
+                        response = await call(client, body)
+                        latencies.append(time.perf_counter() - start)
+                        response.raise_for_status()
+                        size = len(response.content)
+                    p50, p95 = np.percentile(latencies, [50, 95]) * 1000.0
+                    print(
+                        f"  {api:<5} p50={p50:7.2f} ms  p95={p95:7.2f} ms  "
+                        f"{size / 1000:8.1f} kB"
+                    )
+
+    counts = sorted(upstream.requests.items())
+    print("upstream requests  " + "  ".join(f"{api}={n}" for api, n in counts))
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=(__doc__ or "").partition("\n")[0])
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args(argv)
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
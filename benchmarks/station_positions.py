@@ -0,0 +1,40 @@
+"""Benchmark ItineraryController.compute_station_positions_along_route on the
+fixture routes and stations.
+
+    poetry run python -m benchmarks.station_positions
+"""
+
+import timeit
+
+import pandas as pd
+
+# offline sets up the environment, before any oufoaler import
+from benchmarks import offline  # noqa: F401
+from benchmarks.fixtures import ROUTES, load_fixture
+from oufoaler.controllers.itinerary_controller import ItineraryController
+
+
+def main() -> None:
+    itinerary_ctrl = ItineraryController()
+
+    for name in ROUTES:
+        fixture = load_fixture(name)
+        itinerary = fixture["routes"][0]["response"]
+        stations = pd.DataFrame(fixture["stations"])
+
+        def positions():
+            # A fresh route each run, so its projections are not reused
+            route = itinerary_ctrl.extract_route_from_geojson(itinerary)
+            return itinerary_ctrl.compute_station_positions_along_route(stations, route)
+
+        result = positions()
+        elapsed = min(timeit.repeat(positions, number=1, repeat=10))
+        print(
+            f"{name:<14} {len(itinerary['features'][0]['geometry']['coordinates']):6d} "
+            f"points {len(stations):6d} stations  {elapsed * 1000:8.2f} ms  "
+            f"max offset={result['distance_from_route_km'].max():.1f} km"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Local stand-in for the ORS, Chargetrip and ODRE APIs, answering from the
+benchmark fixtures.
+
+The stub is an ASGI app, served in-process to the app's shared HTTP
+client through httpx's ASGI transport, so benchmarks never touch the
+network.
+
+- ORS returns a recorded route when the same coordinates were recorded.
+  Otherwise the legs between the requested points are cut out of the
+  recorded direct route. Isochrones are the app's local estimate.
+- Chargetrip returns the recorded catalogue.
+- ODRE evaluates the app's `where` clause (plug type, `within` polygon,
+  maximum power) against the recorded stations. It pages the results and
+  refuses offsets past 10000, as the real API does.
+"""
+
+import re
+from collections import Counter
+
+import httpx
+import numpy as np
+import shapely
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from shapely.geometry import mapping
+
+from benchmarks.fixtures import CARS_FIXTURE, load_fixture, meander, ors_response
+from oufoaler.config import config
+from oufoaler.services.http_client import HttpClient, set_http_client
+from oufoaler.services.reachability import range_circles
+
+ODRE_MAX_RECORDS = 10000
+SNAP_DISTANCE_DEG = 0.1  # waypoints further off the route get a straight leg
+
+
+class StubUpstream:
+    def __init__(self, names: list[str]) -> None:
+        self.fixtures = [load_fixture(name) for name in names]
+        self.cars = load_fixture(CARS_FIXTURE)["response"]
+        self.routes = {
+            self.route_key(route["coordinates"]): route["response"]
+            for fixture in self.fixtures
+            for route in fixture["routes"]
+        }
+        self.direct_routes = [
+            np.asarray(
+                fixture["routes"][0]["response"]["features"][0]["geometry"][
+                    "coordinates"
+                ]
+            )
+            for fixture in self.fixtures
+        ]
+
+        stations = {}
+        for fixture in self.fixtures:
+            for station in fixture["stations"]:
+                key = station.get("id_pdc_itinerance") or station["id_station"]
+                stations[key] = station
+        self.stations = list(stations.values())
+        self.station_xy = np.array(
+            [
+                [station["geo_point_borne"]["lon"], station["geo_point_borne"]["lat"]]
+                for station in self.stations
+            ]
+        )
+        self.station_power = np.array(
+            [float(station["puiss_max"]) for station in self.stations]
+        )
+        self.station_t2 = np.array(
+            ["T2" in station["type_prise"] for station in self.stations]
+        )
+        self.requests: Counter = Counter()
+
+    @staticmethod
+    def route_key(coordinates) -> tuple:
+        return tuple((round(lon, 5), round(lat, 5)) for lon, lat in coordinates)
+
+    def directions(self, coordinates: list) -> dict:
+        recorded = self.routes.get(self.route_key(coordinates))
+        if recorded is not None:
+            return recorded
+
+        points = np.asarray(coordinates, dtype=np.float64)
+        # The recorded route passing closest to every requested point
+        best = None
+        for route in self.direct_routes:
+            distances = np.hypot(
+                route[None, :, 0] - points[:, None, 0],
+                route[None, :, 1] - points[:, None, 1],
+            )
+            nearest = distances.argmin(axis=1)
+            error = distances[np.arange(len(points)), nearest].max()
+            if best is None or error < best[0]:
+                best = (error, route, nearest)
+
+        legs = []
+        for i in range(len(points) - 1):
+            start, end = points[i], points[i + 1]
+            if best is not None and best[0] <= SNAP_DISTANCE_DEG:
+                _, route, nearest = best
+                if nearest[i] < nearest[i + 1]:
+                    legs.append(
+                        np.vstack([start, route[nearest[i] : nearest[i + 1] + 1], end])
+                    )
+                    continue
+            legs.append(meander(start.tolist(), end.tolist()))
+        return ors_response(legs)
+
+    def records(self, where: str, limit: int, offset: int) -> JSONResponse:
+        if offset + limit > ODRE_MAX_RECORDS:
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "error_code": "InvalidRESTParameterError",
+                    "message": "Invalid value for offset + limit, must be <= 10000",
+                },
+            )
+
+        mask = np.ones(len(self.stations), dtype=bool)
+        if "type_prise like '*T2*'" in where:
+            mask &= self.station_t2
+        area = re.search(r"geom'([^']+)'", where)
+        if area:
+            polygon = shapely.from_wkt(area.group(1))
+            shapely.prepare(polygon)
+            mask &= shapely.contains_xy(
+                polygon, self.station_xy[:, 0], self.station_xy[:, 1]
+            )
+        power = re.search(r"puiss_max <= ([\d.]+)", where)
+        if power:
+            mask &= self.station_power <= float(power.group(1))
+
+        matches = np.flatnonzero(mask)
+        return JSONResponse(
+            content={
+                "total_count": len(matches),
+                "results": [self.stations[i] for i in matches[offset : offset + limit]],
+            }
+        )
+
+
+def create_app(upstream: StubUpstream) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/v2/directions/{profile}/geojson")
+    async def directions(profile: str, request: Request):
+        upstream.requests["ors"] += 1
+        body = await request.json()
+        return JSONResponse(content=upstream.directions(body["coordinates"]))
+
+    @app.post("/v2/isochrones/{profile}")
+    async def isochrones(profile: str, request: Request):
+        upstream.requests["ors"] += 1
+        body = await request.json()
+        locations = [tuple(location) for location in body["locations"]]
+        return JSONResponse(
+            content={
+                "type": "FeatureCollection",
+                "features": [
+                    {
+                        "type": "Feature",
+                        "properties": {"group_index": i, "value": body["range"][0]},
+                        "geometry": mapping(circle),
+                    }
+                    for i, circle in enumerate(
+                        range_circles(locations, body["range"][0] / 1000.0)
+                    )
+                ],
+            }
+        )
+
+    @app.post("/graphql")
+    async def graphql():
+        upstream.requests["chargetrip"] += 1
+        return JSONResponse(content=upstream.cars)
+
+    @app.get("/api/explore/v2.1/catalog/datasets/bornes-irve/records")
+    async def records(where: str, limit: int = 10, offset: int = 0):
+        upstream.requests["odre"] += 1
+        return upstream.records(where, limit, offset)
+
+    return app
+
+
+def install(names: list[str]) -> StubUpstream:
+    """Route the app's shared HTTP client to a stub serving `names` fixtures."""
+    upstream = StubUpstream(names)
+    set_http_client(
+        HttpClient(
+            max_concurrency_per_host=config.http_max_concurrency_per_host,
+            rate_limit_per_host=config.http_rate_limit_per_host,
+            max_retries=0,
+            transport=httpx.ASGITransport(app=create_app(upstream)),
+        )
+    )
+    return upstream
@@ -0,0 +1,52 @@
+"""Benchmark itinerary response serialization: the GeoJSON itinerary
+through the standard JSONResponse against the compact polyline format
+through orjson, with their gzipped sizes.
+
+    poetry run python -m benchmarks.wire_format
+"""
+
+import gzip
+import timeit
+
+from fastapi.responses import JSONResponse
+
+# offline sets up the environment, before any oufoaler import
+from benchmarks import offline  # noqa: F401
+from benchmarks.fixtures import ROUTES, load_fixture
+from oufoaler.models.api import ItineraryResponse
+from oufoaler.services.wire_format import compact_itinerary
+from oufoaler.views.responses import ORJSONResponse
+
+
+def main() -> None:
+    for name in ROUTES:
+        itinerary = load_fixture(name)["routes"][0]["response"]
+        response = ItineraryResponse(itinerary=itinerary)
+        print(name)
+
+        def compact(zoom):
+            content = response.model_dump(exclude={"itinerary"})
+            content["itinerary"] = compact_itinerary(response.itinerary, zoom)
+            return ORJSONResponse(content=content).body
+
+        formats = {
+            "geojson (json)": lambda: JSONResponse(content=response.model_dump()).body,
+            "geojson (orjson)": lambda: (
+                ORJSONResponse(content=response.model_dump()).body
+            ),
+            "polyline": lambda: compact(None),
+            "polyline zoom 8": lambda: compact(8),
+            "polyline zoom 12": lambda: compact(12),
+        }
+        for label, serialize in formats.items():
+            body = serialize()
+            elapsed = min(timeit.repeat(serialize, number=1, repeat=10))
+            print(
+                f"  {label:<18} {elapsed * 1000:8.2f} ms  "
+                f"{len(body) / 1000:8.1f} kB  "
+                f"{len(gzip.compress(body, compresslevel=6)) / 1000:8.1f} kB gzipped"
+            )
+
+
+if __name__ == "__main__":
+    main()
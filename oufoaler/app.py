@@ -1,22 +1,42 @@
 import logging
+from contextlib import asynccontextmanager
 
 import uvicorn
 from fastapi import FastAPI, Request
 from fastapi.middleware.wsgi import WSGIMiddleware
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from markupsafe import Markup
 
 from oufoaler.config import config
 from oufoaler.controllers.car_controller import CarController
+from oufoaler.logger import setup_logger
+from oufoaler.services.car_catalogue import car_catalogue
+from oufoaler.services.http_client import close_http_client
+from oufoaler.services.metrics import render_metrics
+from oufoaler.services.projections import transformers
+from oufoaler.services.worker_pool import worker_pool
 from oufoaler.soap_api import wsgi_app
 from oufoaler.views.api import router as api_router
 
-logging.basicConfig(level=getattr(logging, config.logging_level.upper()))
+setup_logger()
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    transformers.warm(config.prebuilt_utm_zones)
+    await worker_pool.start()
+    await car_catalogue.start()
+    yield
+    await car_catalogue.stop()
+    await close_http_client()
+    worker_pool.stop()
+
+
 # Create FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Include sub-routers
 app.include_router(api_router)
@@ -28,12 +48,27 @@ templates = Jinja2Templates(directory="oufoaler/views/templates")
 # Load controllers
 car_ctrl = CarController()
 
+# Car <option> list, rendered once per catalogue version
+_car_options: tuple[int, Markup] = (-1, Markup(""))
+
+
+def render_car_options() -> Markup:
+    global _car_options
+    catalogue_index = car_ctrl.catalogue.get_index()
+    if _car_options[0] != catalogue_index.version:
+        html = templates.get_template("parts/_car_options.html").render(
+            cars=catalogue_index.cars
+        )
+        _car_options = (catalogue_index.version, Markup(html))
+    return _car_options[1]
+
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
-    cars = [car.__dict__ for car in car_ctrl.get_cars()]
     return templates.TemplateResponse(
-        request=request, name="index.html", context={"cars": cars}
+        request=request,
+        name="index.html",
+        context={"car_options": render_car_options()},
     )
 
 
@@ -46,6 +81,12 @@ async def health():
     return {"status": "ok", "msg": "healthy"}
 
 
+# Metrics Endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return render_metrics()
+
+
 def run():
     uvicorn.run("oufoaler.app:app", host=config.host, port=config.port, reload=False)
 
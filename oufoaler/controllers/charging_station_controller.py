@@ -1,15 +1,71 @@
-import json
+import asyncio
+import logging
 import math
-from typing import List
+from typing import List, NamedTuple, Optional, Set
 
-import requests
-from shapely import Polygon, box, unary_union
+import numpy as np
+import pandas as pd
+import shapely
+from shapely import LineString, Point, Polygon, box, unary_union
+from shapely.geometry.base import BaseGeometry
 
+from oufoaler.config import config
 from oufoaler.controllers.itinerary_controller import ItineraryController
 from oufoaler.models.car import Car
+from oufoaler.models.route import Route
+from oufoaler.services.http_client import HttpClient
+from oufoaler.services.metrics import Counter
+from oufoaler.services.station_index import StationIndex, get_station_index
+from oufoaler.services.station_tile_cache import (
+    MAX_TILE_ZOOM,
+    Tile,
+    station_tile_cache,
+    tile_indices,
+)
+from oufoaler.services.tracing import add_to_span
+from oufoaler.services.worker_pool import worker_pool
+
+ODRE_RECORDS_URL = "https://odre.opendatasoft.com/api/explore/v2.1/catalog/datasets/bornes-irve/records"
+ODRE_PAGE_SIZE = 100
+ODRE_MAX_RECORDS = 10000  # the records API pages no further than this
+
+BUFFER_DISTANCE = 20000  # in meters
+SUB_POLYGON_SIZE = 300000  # in meters
+CELL_MARGIN = 1.5  # route cells reach past the buffer, to cover it once simplified
+MIN_CHUNK_KM = 10.0
+DENSITY_SMOOTHING = 0.2
+MAX_TILES_PER_QUERY = 32
+
+logger = logging.getLogger(__name__)
+
+ODRE_PAGES = Counter(
+    "oufoaler_odre_pages_total", "Station pages fetched from the ODRE API"
+)
+ODRE_RESPONSE_BYTES = Counter(
+    "oufoaler_odre_response_bytes_total", "Bytes of ODRE API responses"
+)
+
+
+class CorridorPart(NamedTuple):
+    """Piece of the search area, with the stretch of route it surrounds."""
+
+    area: BaseGeometry  # in WGS84
+    start_km: float
+    end_km: float
 
 
 class ChargingStationsController:
+    def __init__(self, station_index: Optional[StationIndex] = None) -> None:
+        self._station_index = station_index
+        # Running estimate of matching stations per km of route, sizing queries
+        self.station_density: Optional[float] = None
+        # and per cached tile
+        self.tile_density: Optional[float] = None
+
+    @property
+    def station_index(self) -> Optional[StationIndex]:
+        return self._station_index or get_station_index()
+
     def simplify_geometry(self, area):
         simplified_geom = area.simplify(0.01)
         return simplified_geom
@@ -33,46 +89,56 @@ class ChargingStationsController:
             rounded_geom = area
         return rounded_geom
 
-    def fetch_charging_stations(
-        self, area: str, car: Car, session: requests.Session
-    ) -> List[dict]:
-        """Fetch charging stations from the API for the given search area."""
-        stations = []
-        offset = 0
-        total_count = 1
+    async def fetch_station_page(
+        self, area: str, car: Car, client: HttpClient, offset: int = 0
+    ) -> dict:
         where_clause = (
             f"type_prise like '*T2*' AND "
             f"within(geo_point_borne, geom'{area}') AND "
             f"puiss_max <= {car.power}"
         )
+        params = {
+            "select": "*",
+            "where": where_clause,
+            "limit": ODRE_PAGE_SIZE,
+            "offset": offset,
+        }
+        response = await client.get(ODRE_RECORDS_URL, params=params)
+        ODRE_PAGES.inc()
+        ODRE_RESPONSE_BYTES.inc(len(response.content))
+        add_to_span("odre_pages")
+        add_to_span("odre_bytes", len(response.content))
+        return response.json()
 
-        try:
-            while offset < total_count:
-                params = {
-                    "select": "*",
-                    "where": where_clause,
-                    "limit": 100,
-                    "offset": offset,
-                }
-                response = session.get(
-                    "https://odre.opendatasoft.com/api/explore/v2.1/catalog/datasets/bornes-irve/records",
-                    params=params,
-                    timeout=60,
+    async def fetch_charging_stations(
+        self,
+        area: str,
+        car: Car,
+        client: HttpClient,
+        first_page: Optional[dict] = None,
+    ) -> List[dict]:
+        """Fetch charging stations from the API for the given search area."""
+        # The first page tells how many pages remain, fetch those concurrently
+        if first_page is None:
+            first_page = await self.fetch_station_page(area, car, client)
+        total_count = first_page.get("total_count", 0)
+        if total_count > ODRE_MAX_RECORDS:
+            logger.warning(
+                f"{total_count} stations in a search area, only the first "
+                f"{ODRE_MAX_RECORDS} can be fetched"
+            )
+        pages = await asyncio.gather(
+            *(
+                self.fetch_station_page(area, car, client, offset)
+                for offset in range(
+                    ODRE_PAGE_SIZE, min(total_count, ODRE_MAX_RECORDS), ODRE_PAGE_SIZE
                 )
-                response.raise_for_status()
-                data = response.json()
-                batch = data.get("results", [])
-                stations.extend(batch)
-                total_count = data.get("total_count", 0)
-                offset += 100
-        except requests.exceptions.HTTPError as http_err:
-            raise http_err
-        except requests.exceptions.RequestException as req_err:
-            raise req_err
-        except json.JSONDecodeError as json_err:
-            raise json_err
-        except Exception as e:
-            raise e
+            )
+        )
+
+        stations = list(first_page.get("results", []))
+        for page in pages:
+            stations.extend(page.get("results", []))
         return stations
 
     def split_polygon_into_grid(
@@ -95,21 +161,12 @@ class ChargingStationsController:
                     grid_polygons.append(sub_polygon)
         return grid_polygons
 
-    def find_charging_stations_near_route(
-        self, waypoints: list, car: Car, session: requests.Session
-    ) -> List[dict]:
-        BUFFER_DISTANCE = 20000  # in meters
-        SUB_POLYGON_SIZE = 300000  # in meters
-
+    def buffer_route(self, route: Route) -> Polygon:
+        """Buffer the route into the WGS84 search area for charging stations."""
         itinerary_ctrl = ItineraryController()
 
-        # Step 1: Create LineString from the points
-        line = itinerary_ctrl.create_linestring_from_points(waypoints)
-        if not line:
-            raise ValueError("Failed to create LineString from waypoints.")
-
-        # Step 2: Project to metric CRS (EPSG:3857) for buffering
-        line_proj = itinerary_ctrl.project_geometry(line)
+        # Steps 1-2: LineString of the route, in metric CRS (EPSG:3857)
+        line_proj = route.projected_line("epsg:3857")
         if not line_proj:
             raise ValueError("Failed to project LineString.")
 
@@ -120,50 +177,332 @@ class ChargingStationsController:
         buffered_wgs84 = itinerary_ctrl.project_geometry(
             buffered, src_crs="epsg:3857", dst_crs="epsg:4326"
         )
-        if not buffered_wgs84:
+        if not isinstance(buffered_wgs84, Polygon) or buffered_wgs84.is_empty:
             raise ValueError("Failed to reproject buffered polygon to WGS84.")
 
+        return buffered_wgs84
+
+    def route_cell(self, route: Route, start_km: float, end_km: float) -> BaseGeometry:
+        """Area in EPSG:3857 around the stretch of route between two distances."""
+        distances = route.cumulative_distances
+        first = max(int(np.searchsorted(distances, start_km, side="right")) - 1, 0)
+        last = min(int(np.searchsorted(distances, end_km)), len(route) - 1)
+        coords = route.projected("epsg:3857")[first : last + 1]
+        stretch = LineString(coords) if len(coords) > 1 else Point(coords[0])
+        return stretch.buffer(BUFFER_DISTANCE * CELL_MARGIN, quad_segs=2)
+
+    def partition_area(
+        self, area_projected, route: Route, boundaries_km
+    ) -> List[CorridorPart]:
+        """Cut an EPSG:3857 area into disjoint WGS84 parts, one per stretch of
+        route between consecutive boundaries.
+
+        Each point goes to the first stretch whose cell covers it, so parts
+        share their edges exactly and no station is returned twice.
+        """
+        itinerary_ctrl = ItineraryController()
+
+        pieces, covered = [], None
+        for start_km, end_km in zip(boundaries_km[:-1], boundaries_km[1:]):
+            cell = self.route_cell(route, start_km, end_km)
+            piece = area_projected.intersection(cell)
+            if covered is not None:
+                piece = piece.difference(covered)
+            covered = cell if covered is None else covered.union(cell)
+            pieces.append((piece, float(start_km), float(end_km)))
+
+        # Whatever no cell covers goes with the last stretch
+        leftover = area_projected.difference(covered)
+        if not leftover.is_empty:
+            piece, start_km, end_km = pieces[-1]
+            pieces[-1] = (piece.union(leftover), start_km, end_km)
+
+        parts = []
+        for piece, start_km, end_km in pieces:
+            polygons = [
+                polygon
+                for polygon in shapely.get_parts(piece)
+                if polygon.geom_type == "Polygon"
+            ]
+            if not polygons:
+                continue
+            # Shared edges project and snap the same way in both parts
+            area_wgs84 = shapely.set_precision(
+                itinerary_ctrl.project_geometry(
+                    unary_union(polygons), src_crs="epsg:3857", dst_crs="epsg:4326"
+                ),
+                0.001,
+            )
+            if not area_wgs84.is_empty:
+                parts.append(CorridorPart(area_wgs84, start_km, end_km))
+        return parts
+
+    def chunk_length_km(self) -> float:
+        """Stretch of route expected to hold the target number of stations."""
+        if not self.station_density:
+            return config.odre_max_chunk_km
+        chunk_km = config.odre_target_stations_per_query / self.station_density
+        return min(max(chunk_km, MIN_CHUNK_KM), config.odre_max_chunk_km)
+
+    def observe_station_density(self, total_count: int, length_km: float) -> None:
+        density = total_count / max(length_km, MIN_CHUNK_KM)
+        if self.station_density is None:
+            self.station_density = density
+        else:
+            self.station_density += DENSITY_SMOOTHING * (density - self.station_density)
+
+    def split_corridor(
+        self, route: Route, buffered_wgs84: BaseGeometry, chunk_km: float
+    ) -> List[CorridorPart]:
+        """Split the search area into parts following the route, each
+        surrounding a stretch of about `chunk_km`."""
+        itinerary_ctrl = ItineraryController()
+
         buffered_wgs84 = self.simplify_geometry(buffered_wgs84)
         buffered_wgs84 = self.round_coordinates(buffered_wgs84)
-
-        # Step 5: Project buffered polygon to metric CRS (EPSG:3857)
         buffered_projected = itinerary_ctrl.project_geometry(
             buffered_wgs84, src_crs="epsg:4326", dst_crs="epsg:3857"
         )
         if not buffered_projected:
             raise ValueError("Failed to project buffered polygon to metric CRS.")
 
-        # Step 6: Split buffered polygon into sub-polygons
-        if not isinstance(buffered_projected, Polygon):
-            raise ValueError("Expected a Polygon geometry")
-        sub_polygons_projected = self.split_polygon_into_grid(
-            buffered_projected, SUB_POLYGON_SIZE
+        chunks = max(math.ceil(route.total_distance / chunk_km), 1)
+        boundaries_km = np.linspace(0.0, route.total_distance, chunks + 1)
+        parts = self.partition_area(buffered_projected, route, boundaries_km)
+        if not parts:
+            raise ValueError("No sub-polygons created. Check buffer and chunk size.")
+        return parts
+
+    def split_corridor_part(
+        self, route: Route, part: CorridorPart
+    ) -> List[CorridorPart]:
+        """Halve a part along its stretch of route."""
+        itinerary_ctrl = ItineraryController()
+
+        area_projected = itinerary_ctrl.project_geometry(
+            part.area, src_crs="epsg:4326", dst_crs="epsg:3857"
+        )
+        middle_km = (part.start_km + part.end_km) / 2
+        return self.partition_area(
+            area_projected, route, [part.start_km, middle_km, part.end_km]
         )
 
-        if not sub_polygons_projected:
-            raise ValueError("No sub-polygons created. Check buffer and grid size.")
+    async def fetch_corridor_part(
+        self, route: Route, part: CorridorPart, car: Car, client: HttpClient
+    ) -> List[dict]:
+        """Fetch the stations of a part, halving it first if it holds more
+        than the API can page through."""
+        area = part.area.wkt
+        first_page = await self.fetch_station_page(area, car, client)
+        total_count = first_page.get("total_count", 0)
+        length_km = part.end_km - part.start_km
+        self.observe_station_density(total_count, length_km)
 
-        # Step 7: Re-project sub-polygons back to WGS84
-        sub_polygons_wgs84 = [
-            itinerary_ctrl.project_geometry(
-                sub_poly, src_crs="epsg:3857", dst_crs="epsg:4326"
+        if total_count > ODRE_MAX_RECORDS and length_km > MIN_CHUNK_KM:
+            add_to_span("splits")
+            halves = await worker_pool.run(self.split_corridor_part, route, part)
+            results = await asyncio.gather(
+                *(self.fetch_corridor_part(route, half, car, client) for half in halves)
             )
-            for sub_poly in sub_polygons_projected
-            if sub_poly and not sub_poly.is_empty
+            return [station for stations in results for station in stations]
+        return await self.fetch_charging_stations(area, car, client, first_page)
+
+    def station_column(self, stations: List[dict], name: str) -> np.ndarray:
+        values = pd.Series([station.get(name) for station in stations], dtype=object)
+        return np.asarray(pd.to_numeric(values, errors="coerce"), dtype=np.float64)
+
+    def stations_within(
+        self, stations: List[dict], area: BaseGeometry, max_power: float
+    ) -> List[dict]:
+        """Keep the stations inside `area` that a car of `max_power` kW would
+        have been served."""
+        if not stations:
+            return []
+        lon = self.station_column(stations, "xlongitude")
+        lat = self.station_column(stations, "ylatitude")
+        puiss_max = self.station_column(stations, "puiss_max")
+        shapely.prepare(area)
+        keep = shapely.contains_xy(area, lon, lat) & (puiss_max <= max_power)
+        return [station for station, kept in zip(stations, keep) if kept]
+
+    def observe_tile_density(self, total_count: int, tiles: int) -> None:
+        density = total_count / tiles
+        if self.tile_density is None:
+            self.tile_density = density
+        else:
+            self.tile_density += DENSITY_SMOOTHING * (density - self.tile_density)
+
+    async def fetch_tiles(
+        self,
+        tiles: List[Tile],
+        car: Car,
+        client: HttpClient,
+        incomplete: Optional[Set[Tile]] = None,
+    ) -> List[dict]:
+        """Fetch the stations of tiles queried together, halving the group,
+        or splitting a lone tile into its children, while it holds more than
+        the API can page through. Tiles of MAX_TILE_ZOOM still holding more
+        are fetched truncated, and added to `incomplete`."""
+        area = unary_union([tile.box for tile in tiles]).wkt
+        first_page = await self.fetch_station_page(area, car, client)
+        total_count = first_page.get("total_count", 0)
+        self.observe_tile_density(total_count, len(tiles))
+
+        if total_count > ODRE_MAX_RECORDS:
+            if len(tiles) > 1:
+                groups = [tiles[: len(tiles) // 2], tiles[len(tiles) // 2 :]]
+            elif tiles[0].zoom < MAX_TILE_ZOOM:
+                groups = [[child] for child in tiles[0].children()]
+            else:
+                groups = []
+                if incomplete is not None:
+                    incomplete.add(tiles[0])
+            if groups:
+                add_to_span("splits")
+                results = await asyncio.gather(
+                    *(
+                        self.fetch_tiles(group, car, client, incomplete)
+                        for group in groups
+                    )
+                )
+                return [station for stations in results for station in stations]
+        return await self.fetch_charging_stations(area, car, client, first_page)
+
+    async def fetch_and_cache_tiles(
+        self, tiles: List[Tile], power_class: float, car: Car, client: HttpClient
+    ) -> List[dict]:
+        """Fetch missing tiles, several per query, and cache each one's stations.
+
+        Tiles the API could not return in full are not cached, so that they
+        are not served as complete later on."""
+        group_size = MAX_TILES_PER_QUERY
+        if self.tile_density:
+            group_size = int(config.odre_target_stations_per_query / self.tile_density)
+            group_size = min(max(group_size, 1), MAX_TILES_PER_QUERY)
+        groups = [
+            tiles[start : start + group_size]
+            for start in range(0, len(tiles), group_size)
         ]
+        car = car._replace(power=power_class)
+        incomplete: Set[Tile] = set()
+        results = await asyncio.gather(
+            *(self.fetch_tiles(group, car, client, incomplete) for group in groups)
+        )
+        truncated = {tile.ancestor(station_tile_cache.zoom) for tile in incomplete}
+
+        for group, stations in zip(groups, results):
+            x, y = tile_indices(
+                self.station_column(stations, "xlongitude"),
+                self.station_column(stations, "ylatitude"),
+                station_tile_cache.zoom,
+            )
+            tile_stations: dict[Tile, List[dict]] = {
+                tile: [] for tile in group if tile not in truncated
+            }
+            for station, tile_x, tile_y in zip(stations, x, y):
+                tile = Tile(station_tile_cache.zoom, int(tile_x), int(tile_y))
+                # Stations whose coordinates fall outside the queried tiles
+                # are used for this query only
+                if tile in tile_stations:
+                    tile_stations[tile].append(station)
+            for tile, cached in tile_stations.items():
+                station_tile_cache.set(tile, power_class, cached)
+        return [station for stations in results for station in stations]
 
-        # Step 8: Fetch charging stations for each sub-polygon
-        all_stations = []
-        for sub_poly in sub_polygons_wgs84:
-            wkt = sub_poly.wkt
-            stations = self.fetch_charging_stations(wkt, car, session)
-            all_stations.extend(stations)
+    async def find_charging_stations_in_tiles(
+        self, area: BaseGeometry, car: Car, client: HttpClient
+    ) -> List[dict]:
+        """Stations of the cached tiles covering `area`, filtered to it."""
+        power_class = station_tile_cache.power_class(car.power)
+        stations, missing = [], []
+        tiles = station_tile_cache.tiles_covering(area)
+        for tile in tiles:
+            cached = station_tile_cache.get(tile, power_class)
+            if cached is None:
+                missing.append(tile)
+            else:
+                stations.extend(cached)
+        add_to_span("tiles", len(tiles))
+        add_to_span("tiles_missing", len(missing))
+        if missing:
+            stations.extend(
+                await self.fetch_and_cache_tiles(missing, power_class, car, client)
+            )
+        return self.stations_within(stations, area, car.power)
 
-        # Deduplicate stations based on 'id_station'
+    def query_station_index(self, area: BaseGeometry, max_power: float) -> List[dict]:
+        # Resolved in the calling process, so workers use their own loaded index
+        station_index = self.station_index
+        if station_index is None:
+            return []
+        return station_index.query(area, max_power)
+
+    async def find_charging_stations_near_route(
+        self, route: Route, car: Car, client: HttpClient
+    ) -> List[dict]:
+        # Geometry work is CPU-bound, keep it off the event loop
+        buffered_wgs84 = await worker_pool.run(self.buffer_route, route)
+
+        # Answer from the local station index when one is configured
+        if self.station_index is not None:
+            stations = await worker_pool.run(
+                self.query_station_index, buffered_wgs84, car.power
+            )
+            return self.deduplicate_stations(stations)
+
+        # Then from cached tiles, fetching only the missing ones
+        if station_tile_cache.enabled:
+            stations = await self.find_charging_stations_in_tiles(
+                buffered_wgs84, car, client
+            )
+            return self.deduplicate_stations(stations)
+
+        # Query the corridor in stretches sized from the station density seen
+        # so far: sparse routes take few large queries, dense ones are split
+        parts = await worker_pool.run(
+            self.split_corridor, route, buffered_wgs84, self.chunk_length_km()
+        )
+        add_to_span("parts", len(parts))
+
+        # Step 8: Fetch charging stations for all parts concurrently
+        results = await asyncio.gather(
+            *(self.fetch_corridor_part(route, part, car, client) for part in parts)
+        )
+        all_stations = [station for stations in results for station in stations]
+
+        return self.deduplicate_stations(all_stations)
+
+    async def find_charging_stations_in_area(
+        self, area: BaseGeometry, car: Car, client: HttpClient
+    ) -> List[dict]:
+        """Stations usable by `car` anywhere within a WGS84 area."""
+        if self.station_index is not None:
+            stations = await worker_pool.run(self.query_station_index, area, car.power)
+        elif station_tile_cache.enabled:
+            stations = await self.find_charging_stations_in_tiles(area, car, client)
+        else:
+            # Tile by tile, so that large areas are split as needed
+            tiles = station_tile_cache.tiles_covering(area)
+            add_to_span("tiles", len(tiles))
+            stations = self.stations_within(
+                await self.fetch_tiles(tiles, car, client), area, car.power
+            )
+        return self.deduplicate_stations(stations)
+
+    def filter_by_power(self, df_stations, max_power: float):
+        """Keep the stations a car of `max_power` kW would have been served."""
+        if df_stations.empty:
+            return df_stations
+        puiss_max = np.asarray(
+            pd.to_numeric(df_stations["puiss_max"], errors="coerce"), dtype=np.float64
+        )
+        return df_stations[puiss_max <= max_power].reset_index(drop=True)
+
+    def deduplicate_stations(self, stations: List[dict]) -> List[dict]:
+        """Deduplicate stations based on 'id_station'."""
         unique_stations = {
             station.get("id_station"): station
-            for station in all_stations
+            for station in stations
             if station.get("id_station")
         }
-
         return list(unique_stations.values())
@@ -1,22 +1,61 @@
-import openrouteservice
-import openrouteservice.directions
-import openrouteservice.geocode
+import asyncio
+from typing import Optional
+
+import numpy as np
 import pandas as pd
-import pyproj
-from geopy.distance import geodesic
-from shapely import LineString, Point
-from shapely.ops import transform
+from shapely import LineString
+from shapely.geometry import shape
+from shapely.geometry.base import BaseGeometry
 
 from oufoaler.config import config
 from oufoaler.models.api import Coordinates
 from oufoaler.models.car import Car
+from oufoaler.models.route import DistanceMode, Route, segment_distances
+from oufoaler.services import projections
+from oufoaler.services.charging_optimizer import (
+    ChargingStopOptimizer,
+    PlanningBudgetExceeded,
+)
+from oufoaler.services.http_client import get_http_client
+from oufoaler.services.metrics import Counter
+from oufoaler.services.route_cache import route_cache
+from oufoaler.services.route_splicer import splice_detours, stop_vertices
+
+ORS_DIRECTIONS_URL = "https://api.openrouteservice.org/v2/directions/{profile}/geojson"
+ORS_ISOCHRONES_URL = "https://api.openrouteservice.org/v2/isochrones/{profile}"
+ORS_DIRECTIONS_OPTIONS = {"extra_info": ["steepness"]}
+ORS_ISOCHRONE_MAX_LOCATIONS = 5  # per request
+
+HIGH_POWER_THRESHOLD_KW = 50.0
+ON_ROUTE_KM = 0.05  # charging stops closer to the route need no detour leg
+
+CHARGING_PLANS = Counter(
+    "oufoaler_charging_plans_total",
+    "Optimal charging stop searches, by outcome",
+    ("result",),
+)
+
+REROUTES = Counter(
+    "oufoaler_reroutes_total",
+    "Routes through the charging stops, by method",
+    ("method",),
+)
+
+charging_optimizer = ChargingStopOptimizer(
+    soc_step=config.planning_soc_step,
+    bucket_km=config.planning_bucket_km,
+    detour_speed_kmh=config.planning_detour_speed_kmh,
+    stop_overhead_minutes=config.planning_stop_overhead_minutes,
+    time_budget=config.planning_time_budget,
+)
+
+
+class NoAccessibleStationError(Exception):
+    pass
 
 
 class ItineraryController:
-    def __init__(self) -> None:
-        self.client = openrouteservice.Client(key=config.openrouteservice_api_key)
-
-    def get_driving_route(
+    async def get_driving_route(
         self,
         start: Coordinates,
         end: Coordinates,
@@ -32,14 +71,113 @@ class ItineraryController:
         else:
             coordinates = [start_coords, end_coords]
 
-        print(coordinates)
-        response = openrouteservice.directions.directions(
-            client=self.client,
-            coordinates=coordinates,
-            profile="driving-car",
-            format="geojson",
+        profile = "driving-car"
+        cache_key = route_cache.make_key(profile, coordinates, ORS_DIRECTIONS_OPTIONS)
+        route = await route_cache.get(cache_key)
+        if route is not None:
+            return route
+
+        response = await get_http_client().post(
+            ORS_DIRECTIONS_URL.format(profile=profile),
+            headers={"Authorization": config.openrouteservice_api_key},
+            json={"coordinates": coordinates, **ORS_DIRECTIONS_OPTIONS},
+        )
+        route = response.json()
+        await route_cache.set(cache_key, route)
+        return route
+
+    async def get_isochrones(
+        self, locations: list[tuple[float, float]], range_km: float
+    ) -> list[BaseGeometry]:
+        """Area within `range_km` of driving from each [lon, lat] location."""
+        profile = "driving-car"
+
+        async def fetch(batch: list[tuple[float, float]]) -> list[BaseGeometry]:
+            response = await get_http_client().post(
+                ORS_ISOCHRONES_URL.format(profile=profile),
+                headers={"Authorization": config.openrouteservice_api_key},
+                json={
+                    "locations": [list(location) for location in batch],
+                    "range": [range_km * 1000.0],
+                    "range_type": "distance",
+                },
+            )
+            return [
+                shape(feature["geometry"]) for feature in response.json()["features"]
+            ]
+
+        batches = await asyncio.gather(
+            *(
+                fetch(locations[start : start + ORS_ISOCHRONE_MAX_LOCATIONS])
+                for start in range(0, len(locations), ORS_ISOCHRONE_MAX_LOCATIONS)
+            )
+        )
+        return [area for areas in batches for area in areas if not area.is_empty]
+
+    async def get_route_through_stops(
+        self,
+        itinerary: dict,
+        route: Route,
+        recharge_stops: list,
+        start: Coordinates,
+        end: Coordinates,
+    ) -> dict:
+        """Driving route through the charging stops: the direct `itinerary`
+        with a detour to each station spliced in, or a new route through all
+        of them when splicing is disabled or a detour is too long."""
+        if config.reroute_mode == "splice" and len(itinerary["features"]) == 1:
+            spliced = await self.splice_recharge_stops(itinerary, route, recharge_stops)
+            if spliced is not None:
+                REROUTES.inc(method="spliced")
+                return spliced
+            REROUTES.inc(method="fallback")
+        else:
+            REROUTES.inc(method="full")
+
+        waypoints = [
+            (float(stop["xlongitude"]), float(stop["ylatitude"]))
+            for stop in recharge_stops
+        ]
+        return await self.get_driving_route(start, end, waypoints)
+
+    async def splice_recharge_stops(
+        self, itinerary: dict, route: Route, recharge_stops: list
+    ) -> Optional[dict]:
+        """The direct `itinerary` with, for each charging stop off the route,
+        a leg from the nearest route vertex to the station and back spliced
+        in. None when a detour is longer than config.reroute_max_detour_km."""
+        max_detour_m = config.reroute_max_detour_km * 1000.0
+        offsets_km = [
+            float(stop.get("distance_from_route_km", 0.0)) for stop in recharge_stops
+        ]
+        if any(2000.0 * offset > max_detour_m for offset in offsets_km):
+            return None
+
+        vertices = stop_vertices(
+            route, [stop["distance_along_route_km"] for stop in recharge_stops]
+        ).tolist()
+
+        async def detour(vertex: int, stop, offset_km: float) -> Optional[dict]:
+            if offset_km <= ON_ROUTE_KM:
+                return None
+            lon, lat = route.coordinates[vertex]
+            at_vertex = Coordinates(lon=float(lon), lat=float(lat))
+            station = (float(stop["xlongitude"]), float(stop["ylatitude"]))
+            return await self.get_driving_route(at_vertex, at_vertex, [station])
+
+        legs = await asyncio.gather(
+            *(
+                detour(vertex, stop, offset_km)
+                for vertex, stop, offset_km in zip(vertices, recharge_stops, offsets_km)
+            )
         )
-        return response
+        for leg in legs:
+            if leg is None:
+                continue
+            summary = leg["features"][0]["properties"].get("summary", {})
+            if summary.get("distance", 0.0) > max_detour_m:
+                return None
+        return splice_detours(itinerary, vertices, legs)
 
     def extract_waypoints_from_geojson(self, itinerary) -> list[tuple[float, float]]:
         """Extract waypoints from the GeoJSON itinerary."""
@@ -50,129 +188,249 @@ class ItineraryController:
                 waypoints.extend(geometry["coordinates"])
         return waypoints
 
-    def compute_cumulative_distances(self, waypoints) -> tuple[list[float], float]:
-        cumulative_distances = [0.0]
-        total_distance = 0.0
-        for i in range(1, len(waypoints)):
-            distance = geodesic(waypoints[i - 1][::-1], waypoints[i][::-1]).kilometers
-            total_distance += distance
-            cumulative_distances.append(total_distance)
-        return cumulative_distances, total_distance
+    def extract_route_from_geojson(self, itinerary) -> Route:
+        """Extract the route geometry from the GeoJSON itinerary."""
+        return Route.from_geojson(itinerary, config.distance_mode)
+
+    def compute_segment_distances(
+        self, waypoints, mode: Optional[DistanceMode] = None
+    ) -> np.ndarray:
+        """Distances in km between consecutive [lon, lat] waypoints."""
+        coords = np.asarray(waypoints, dtype=np.float64).reshape(-1, 2)
+        return segment_distances(coords, mode or config.distance_mode)
+
+    def compute_cumulative_distances(
+        self, waypoints, mode: Optional[DistanceMode] = None
+    ) -> tuple[np.ndarray, float]:
+        """Cumulative distances in km along a Route or a list of waypoints."""
+        route = (
+            waypoints
+            if isinstance(waypoints, Route) and mode in (None, waypoints.distance_mode)
+            else Route(waypoints, mode or config.distance_mode)
+        )
+        return route.cumulative_distances, route.total_distance
 
     def create_linestring_from_points(self, waypoints):
         line = LineString(waypoints)
         return line
 
     def project_geometry(self, geom, src_crs="epsg:4326", dst_crs="epsg:3857"):
-        transformer = pyproj.Transformer.from_crs(
-            src_crs, dst_crs, always_xy=True
-        ).transform
-        projected_geom = transform(transformer, geom)
-        return projected_geom
-
-    def compute_station_positions_along_route(self, df_stations, waypoints):
-        route_line = LineString(waypoints)
-
-        # Define UTM zone based on the centroid
-        centroid = route_line.centroid
-        utm_zone = int((centroid.x + 180) / 6) + 1
-        is_northern = centroid.y >= 0
-
-        utm_crs = pyproj.CRS.from_dict(
-            {
-                "proj": "utm",
-                "zone": utm_zone,
-                "south" if not is_northern else "north": True,
-                "ellps": "WGS84",
-                "units": "m",
-                "no_defs": True,
-            }
-        )
-
-        project_to_utm = pyproj.Transformer.from_crs(
-            "epsg:4326", utm_crs, always_xy=True
-        ).transform
-
-        route_line_utm = transform(project_to_utm, route_line)
-
-        valid_stations = []
-        for station in df_stations:
-            try:
-                station_point = Point(
-                    float(station.get("xlongitude")),
-                    float(station.get("ylatitude")),
-                )
-
-                station_point_utm = transform(project_to_utm, station_point)
-
-                distance_along_route_m = route_line_utm.project(station_point_utm)
+        return projections.project(geom, src_crs, dst_crs)
+
+    def compute_station_positions_along_route(self, df_stations, route: Route):
+        df_stations = pd.DataFrame(df_stations)
+        if df_stations.empty:
+            return df_stations.assign(
+                distance_along_route_km=pd.Series(dtype=float),
+                distance_from_route_km=pd.Series(dtype=float),
+            )
 
-                distance_along_route_km = distance_along_route_m / 1000.0
+        # Project every station at once and locate it along the route
+        lon = np.asarray(
+            pd.to_numeric(df_stations["xlongitude"], errors="coerce"), dtype=np.float64
+        )
+        lat = np.asarray(
+            pd.to_numeric(df_stations["ylatitude"], errors="coerce"), dtype=np.float64
+        )
+        valid = ~(np.isnan(lon) | np.isnan(lat))
+        df_stations = df_stations[valid]
 
-                station["distance_along_route_km"] = float(distance_along_route_km)
-                valid_stations.append(station)
-            except Exception as e:
-                print(f"Error computing distance for station: {e}")
+        # in the UTM zone of the route centroid
+        project_to_utm = projections.transformers.get("epsg:4326", route.utm_crs)
+        x, y = project_to_utm.transform(lon[valid], lat[valid])
+        distance_along_route_m, distance_from_route_m = route.locate(x, y)
 
-        df_stations = pd.DataFrame(valid_stations)
-        df_stations = df_stations.dropna(subset=["distance_along_route_km"])
-        df_stations = df_stations.sort_values("distance_along_route_km").reset_index(
-            drop=True
+        df_stations = df_stations.assign(
+            distance_along_route_km=distance_along_route_m / 1000.0,
+            distance_from_route_km=distance_from_route_m / 1000.0,
         )
+        df_stations = df_stations.sort_values(
+            "distance_along_route_km", kind="stable"
+        ).reset_index(drop=True)
 
         return df_stations
 
-    def plan_recharge_stops(
-        self, df_route, df_stations, soc_start, soc_min, soc_max, soc_per_km
-    ):
-        recharge_stops = []
-        current_soc = soc_start
-        total_distance = df_route["cumulative_distance_km"].iloc[-1]
+    def plan_recharge_stop_indices(
+        self,
+        socs_used: np.ndarray,
+        powers: np.ndarray,
+        total_soc_used: float,
+        soc_start: float,
+        soc_min: float,
+        soc_max: float,
+    ) -> list[int]:
+        """Greedy planner core: at each hop, stop at the furthest reachable
+        station, preferring high-power ones.
+
+        Stations are placed by the SoC used along the route to reach them,
+        `socs_used`, which must be sorted; returns indices into the station
+        arrays.
+        """
+        # last_high_power[i]: index of the last high-power station at or before i
+        positions = np.arange(len(powers))
+        last_high_power = np.maximum.accumulate(
+            np.where(powers >= HIGH_POWER_THRESHOLD_KW, positions, -1)
+        )
 
-        last_recharge_distance = 0.0
+        stops = []
+        current_soc = soc_start
+        last_recharge_used = 0.0
         current_position = 0.0
 
-        df_stations["puiss_max"] = pd.to_numeric(
-            df_stations["puiss_max"], errors="coerce"
-        )
-        df_stations = df_stations.dropna(subset=["puiss_max"])
-        df_stations = df_stations[df_stations["puiss_max"] > 0]
-
-        while current_position < total_distance:
-            max_reachable_distance = (
-                last_recharge_distance + (current_soc - soc_min) / soc_per_km
-            )
+        while current_position < total_soc_used:
+            max_reachable_used = last_recharge_used + (current_soc - soc_min)
 
-            if max_reachable_distance >= total_distance:
+            if max_reachable_used >= total_soc_used:
                 break
 
-            accessible_stations = df_stations[
-                (df_stations["distance_along_route_km"] > current_position)
-                & (df_stations["distance_along_route_km"] <= max_reachable_distance)
-            ]
+            # Accessible stations are [first, last] in the sorted arrays
+            first = np.searchsorted(socs_used, current_position, side="right")
+            last = np.searchsorted(socs_used, max_reachable_used, side="right") - 1
 
-            if accessible_stations.empty:
-                raise Exception(
+            if last < first:
+                raise NoAccessibleStationError(
                     "No accessible charging station before reaching SoC_min."
                 )
 
-            high_power_stations = accessible_stations[
-                accessible_stations["puiss_max"] >= 50.0
-            ]
+            next_stop = int(last_high_power[last])
+            if next_stop < first:
+                next_stop = int(last)
+            stops.append(next_stop)
 
-            if not high_power_stations.empty:
-                next_stop = high_power_stations.iloc[-1]
-            else:
-                next_stop = accessible_stations.iloc[-1]
+            last_recharge_used = socs_used[next_stop]
+            current_soc = soc_max
 
-            recharge_stops.append(next_stop)
+            current_position = last_recharge_used
 
-            last_recharge_distance = next_stop["distance_along_route_km"]
-            current_soc = soc_max
+        return stops
+
+    def usable_stations(self, df_stations):
+        """Stations with a known charging power, sorted along the route."""
+        puiss_max = np.asarray(
+            pd.to_numeric(df_stations["puiss_max"], errors="coerce"), dtype=np.float64
+        )
+        usable = puiss_max > 0
+        df_stations = df_stations[usable].assign(puiss_max=puiss_max[usable])
+        if not df_stations["distance_along_route_km"].is_monotonic_increasing:
+            df_stations = df_stations.sort_values(
+                "distance_along_route_km", kind="stable"
+            )
+        return df_stations
+
+    def station_socs_used(
+        self, route: Route, df_stations, cumulative_soc: np.ndarray
+    ) -> np.ndarray:
+        """SoC used along the route up to each station, from the SoC used up
+        to each route vertex."""
+        return np.interp(
+            df_stations["distance_along_route_km"].to_numpy(dtype=np.float64),
+            route.cumulative_distances,
+            cumulative_soc,
+        )
 
-            current_position = last_recharge_distance
+    def plan_recharge_stops(
+        self, route: Route, df_stations, soc_start, soc_min, soc_max, cumulative_soc
+    ):
+        df_stations = self.usable_stations(df_stations)
+
+        stop_indices = self.plan_recharge_stop_indices(
+            self.station_socs_used(route, df_stations, cumulative_soc),
+            df_stations["puiss_max"].to_numpy(dtype=np.float64),
+            float(cumulative_soc[-1]),
+            soc_start,
+            soc_min,
+            soc_max,
+        )
+        return [df_stations.iloc[i] for i in stop_indices]
+
+    def plan_optimal_recharge_stops(
+        self,
+        route: Route,
+        df_stations,
+        car: Car,
+        soc_start,
+        soc_min,
+        soc_max,
+        cumulative_soc,
+        detour_soc_per_km,
+        optimizer: Optional[ChargingStopOptimizer] = None,
+    ) -> tuple[list, int, str]:
+        """Plan the stops minimizing detour and charging time, with partial
+        charging. Falls back to the greedy plan when the search runs out of
+        time or finds nothing better.
+
+        Returns the stops, the total charging time in minutes and the outcome
+        of the search, counted by the caller as this may run in a worker.
+        """
+        optimizer = optimizer or charging_optimizer
+        total_soc_used = float(cumulative_soc[-1])
+        df_stations = self.usable_stations(df_stations)
+
+        distances = df_stations["distance_along_route_km"].to_numpy(dtype=np.float64)
+        socs_used = self.station_socs_used(route, df_stations, cumulative_soc)
+        offsets = (
+            df_stations["distance_from_route_km"].to_numpy(dtype=np.float64)
+            if "distance_from_route_km" in df_stations
+            else np.zeros(len(df_stations))
+        )
+        station_powers = df_stations["puiss_max"].to_numpy(dtype=np.float64)
+        powers = (
+            np.minimum(station_powers, car.power) if car.power > 0 else station_powers
+        )
+
+        greedy_stops = self.plan_recharge_stop_indices(
+            socs_used,
+            station_powers,
+            total_soc_used,
+            soc_start,
+            soc_min,
+            soc_max,
+        )
+        greedy_cost = optimizer.plan_cost_hours(
+            greedy_stops,
+            socs_used,
+            offsets,
+            powers,
+            total_soc_used,
+            soc_start,
+            soc_min,
+            soc_max,
+            detour_soc_per_km,
+            car.battery_capacity,
+        )
+
+        try:
+            plan = optimizer.plan(
+                distances,
+                socs_used,
+                offsets,
+                powers,
+                total_soc_used,
+                soc_start,
+                soc_min,
+                soc_max,
+                detour_soc_per_km,
+                car.battery_capacity,
+                upper_bound=greedy_cost,
+            )
+        except PlanningBudgetExceeded:
+            outcome = "fallback_budget"
+            plan = None
+        else:
+            outcome = "optimal" if plan else "fallback_greedy"
+
+        if plan is None:
+            recharge_stops = [df_stations.iloc[i] for i in greedy_stops]
+            return (
+                recharge_stops,
+                self.calculate_total_charging_time(
+                    recharge_stops, car, soc_min, soc_max
+                ),
+                outcome,
+            )
 
-        return recharge_stops
+        recharge_stops = [df_stations.iloc[i] for i in plan.stops]
+        return recharge_stops, int(round(sum(plan.charging_hours) * 60)), outcome
 
     def calculate_total_charging_time(self, recharge_stops, car: Car, soc_min, soc_max):
         """
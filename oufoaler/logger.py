@@ -1,7 +1,6 @@
 import logging
-from oufoaler.config import Config
 
-config = Config()
+from oufoaler.config import config
 
 
 class CustomFormatter(logging.Formatter):
@@ -19,7 +18,7 @@ class CustomFormatter(logging.Formatter):
 
 
 def setup_logger():
-    logging.basicConfig(level=logging.INFO)
+    logging.basicConfig(level=getattr(logging, config.logging_level.upper()))
     logger = logging.getLogger()
 
     # Set custom formatter
@@ -1,3 +1,5 @@
+from typing import Literal, Optional
+
 from pydantic import BaseModel, Field
 
 
@@ -13,3 +15,35 @@ class ItineraryRequest(BaseModel):
     soc_max: float = Field(...)
     departure: Coordinates
     arrival: Coordinates
+    planning_mode: Optional[Literal["greedy", "optimal"]] = None
+    temperature_c: Optional[float] = None  # outside temperature, in °C
+
+
+class ItineraryBatchRequest(BaseModel):
+    requests: list[ItineraryRequest] = Field(..., min_length=1)
+
+
+class ItineraryResponse(BaseModel):
+    status: str = "ok"
+    itinerary: dict
+    recharge_stops: list[tuple[float, float]] = Field(default_factory=list)
+    total_charging_time_minutes: int = 0
+
+
+class ReachabilityRequest(BaseModel):
+    car_id: str = Field(...)
+    soc_start: float = Field(...)
+    soc_min: float = Field(...)
+    soc_max: float = Field(...)
+    origin: Coordinates
+    temperature_c: Optional[float] = None  # outside temperature, in °C
+
+
+class ReachabilityResponse(BaseModel):
+    status: str = "ok"
+    origin: Coordinates  # centre of the origin tile the areas are computed from
+    range_km: float
+    range_after_charge_km: float
+    reachable: dict  # GeoJSON geometries
+    reachable_with_stop: dict
+    charging_stations: list[tuple[float, float]] = Field(default_factory=list)
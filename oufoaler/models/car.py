@@ -1,19 +1,15 @@
-from typing import Optional
+from typing import NamedTuple, Optional
 
-from pydantic import BaseModel, Field
 
+class Car(NamedTuple):
+    """Read-only vehicle record, kept compact as the catalogue holds thousands."""
 
-class Car(BaseModel):
-    id: str = Field(...)
-    make: str = Field(...)
-    model: str = Field(...)
-    version: str = Field(...)
-    power: float = Field(...)
-    battery_capacity: float = Field(...)
-    range_best: float = Field(...)
-    range_worst: float = Field(...)
-    image: Optional[str] = Field(None)
-
-    class Config:
-        populate_by_name = True
-        str_strip_whitespace = True
+    id: str
+    make: str
+    model: str
+    version: str
+    power: float
+    battery_capacity: float
+    range_best: float
+    range_worst: float
+    image: Optional[str] = None
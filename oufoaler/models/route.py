@@ -0,0 +1,184 @@
+from typing import Literal, Optional
+
+import numpy as np
+import pyproj
+import shapely
+from shapely import LineString
+
+from oufoaler.services import projections
+
+EARTH_RADIUS_KM = 6371.0088
+WGS84_GEOD = pyproj.Geod(ellps="WGS84")
+
+DistanceMode = Literal["ellipsoidal", "spherical"]
+
+CHUNK_SIZE = 64  # route vertices per indexed piece of line
+
+
+def segment_distances(coordinates: np.ndarray, mode: DistanceMode) -> np.ndarray:
+    """Distances in km between consecutive [lon, lat] coordinates.
+
+    "ellipsoidal" solves the WGS84 geodesic problem (as geopy's geodesic),
+    "spherical" uses the haversine formula, faster but off by up to ~0.5%.
+    """
+    lon, lat = coordinates[:, 0], coordinates[:, 1]
+
+    if mode == "ellipsoidal":
+        _, _, distances_m = WGS84_GEOD.inv(lon[:-1], lat[:-1], lon[1:], lat[1:])
+        return np.asarray(distances_m) / 1000.0
+    if mode == "spherical":
+        lon, lat = np.radians(lon), np.radians(lat)
+        a = (
+            np.sin(np.diff(lat) / 2) ** 2
+            + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+        )
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+    raise ValueError(f"Unknown distance mode: {mode}")
+
+
+class Route:
+    """Route geometry, as one contiguous (N, 2) float64 array of [lon, lat].
+
+    Derived data (cumulative distances, shapely line, projections, bounding
+    box) is computed on first use and kept, so every stage of a request
+    shares it instead of rebuilding its own copy.
+    """
+
+    __slots__ = ("coordinates", "distance_mode", "_cumulative_distances", "_cache")
+
+    def __init__(
+        self,
+        coordinates,
+        distance_mode: DistanceMode = "ellipsoidal",
+        cumulative_distances: Optional[np.ndarray] = None,
+    ) -> None:
+        self.coordinates = np.ascontiguousarray(coordinates, dtype=np.float64).reshape(
+            -1, 2
+        )
+        self.distance_mode: DistanceMode = distance_mode
+        self._cumulative_distances = cumulative_distances
+        self._cache: dict = {}
+
+    @classmethod
+    def from_geojson(
+        cls, itinerary: dict, distance_mode: DistanceMode = "ellipsoidal"
+    ) -> "Route":
+        """Route of the LineString features of an ORS GeoJSON itinerary."""
+        lines = [
+            np.asarray(feature["geometry"]["coordinates"], dtype=np.float64)
+            for feature in itinerary["features"]
+            if feature["geometry"]["type"] == "LineString"
+        ]
+        return cls(np.concatenate(lines) if lines else np.empty((0, 2)), distance_mode)
+
+    def __len__(self) -> int:
+        return len(self.coordinates)
+
+    def __reduce__(self):
+        return (
+            Route,
+            (self.coordinates, self.distance_mode, self._cumulative_distances),
+        )
+
+    @property
+    def cumulative_distances(self) -> np.ndarray:
+        """Distance in km from the start to each coordinate."""
+        if self._cumulative_distances is None:
+            cumulative_distances = np.zeros(max(len(self), 1))
+            if len(self) > 1:
+                np.cumsum(
+                    segment_distances(self.coordinates, self.distance_mode),
+                    out=cumulative_distances[1:],
+                )
+            self._cumulative_distances = cumulative_distances
+        return self._cumulative_distances
+
+    @cumulative_distances.setter
+    def cumulative_distances(self, cumulative_distances: np.ndarray) -> None:
+        self._cumulative_distances = cumulative_distances
+
+    @property
+    def total_distance(self) -> float:
+        return float(self.cumulative_distances[-1])
+
+    @property
+    def bbox(self) -> tuple[float, float, float, float]:
+        """(min lon, min lat, max lon, max lat)"""
+        if "bbox" not in self._cache:
+            minx, miny = self.coordinates.min(axis=0)
+            maxx, maxy = self.coordinates.max(axis=0)
+            self._cache["bbox"] = (float(minx), float(miny), float(maxx), float(maxy))
+        return self._cache["bbox"]
+
+    @property
+    def line(self) -> LineString:
+        if "line" not in self._cache:
+            self._cache["line"] = LineString(self.coordinates)
+        return self._cache["line"]
+
+    @property
+    def utm_crs(self) -> str:
+        """UTM zone containing the route centroid, for metric computations."""
+        if "utm_crs" not in self._cache:
+            centroid = self.line.centroid
+            self._cache["utm_crs"] = projections.utm_crs(centroid.x, centroid.y)
+        return self._cache["utm_crs"]
+
+    def projected(self, crs: Optional[str] = None) -> np.ndarray:
+        """Coordinates projected to `crs`, by default the route's UTM zone."""
+        crs = (crs or self.utm_crs).lower()
+        key = ("projected", crs)
+        if key not in self._cache:
+            transformer = projections.transformers.get("epsg:4326", crs)
+            self._cache[key] = projections.transform_coords(
+                transformer, self.coordinates
+            )
+        return self._cache[key]
+
+    def projected_line(self, crs: Optional[str] = None) -> LineString:
+        crs = (crs or self.utm_crs).lower()
+        key = ("projected_line", crs)
+        if key not in self._cache:
+            self._cache[key] = LineString(self.projected(crs))
+        return self._cache[key]
+
+    def projected_offsets(self) -> np.ndarray:
+        """Distance in metres from the start to each coordinate, along the
+        projected route, as measured by `locate`."""
+        if "projected_offsets" not in self._cache:
+            lengths = np.hypot(*np.diff(self.projected(), axis=0).T)
+            self._cache["projected_offsets"] = np.concatenate(
+                ([0.0], np.cumsum(lengths))
+            )
+        return self._cache["projected_offsets"]
+
+    def _chunks(self) -> tuple[np.ndarray, np.ndarray, shapely.STRtree]:
+        """The projected route cut in pieces of CHUNK_SIZE segments, their
+        offsets along the route and a spatial index over them."""
+        if "chunks" not in self._cache:
+            coords = self.projected()
+            starts = np.arange(0, len(coords) - 1, CHUNK_SIZE)
+            sizes = np.minimum(starts + CHUNK_SIZE, len(coords) - 1) - starts + 1
+            first = np.repeat(np.cumsum(sizes) - sizes, sizes)
+            vertices = np.repeat(starts, sizes) + np.arange(sizes.sum()) - first
+            chunks = np.asarray(
+                shapely.linestrings(
+                    coords[vertices], indices=np.repeat(np.arange(len(starts)), sizes)
+                )
+            )
+            offsets = self.projected_offsets()[starts]
+            self._cache["chunks"] = (chunks, offsets, shapely.STRtree(chunks))
+        return self._cache["chunks"]
+
+    def locate(self, x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Distances along the route and from it, in metres, of points given
+        in the route's UTM projection."""
+        chunks, offsets, tree = self._chunks()
+        points = np.asarray(shapely.points(x, y))
+        nearest = np.empty(len(points), dtype=np.intp)
+        point_idx, chunk_idx = tree.query_nearest(points, all_matches=False)
+        nearest[point_idx] = chunk_idx
+        return (
+            offsets[nearest] + shapely.line_locate_point(chunks[nearest], points),
+            shapely.distance(chunks[nearest], points),
+        )
@@ -1,3 +1,5 @@
+from typing import Literal, Optional
+
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -6,9 +8,56 @@ class Settings(BaseSettings):
     host: str = "0.0.0.0"
     port: int = 8000
     logging_level: str = Field("INFO")
+    tracing_enabled: bool = False  # log a JSON span per planning stage
     openrouteservice_api_key: str = Field(...)
     chargetrip_client_id: str = Field(...)
     chargetrip_app_id: str = Field(...)
+    station_index_path: Optional[str] = Field(None)
+    http_max_connections: int = 20
+    http_max_concurrency_per_host: int = 8
+    http_rate_limit_per_host: float = 10.0  # requests per second
+    http_max_retries: int = 3
+    http_backoff_factor: float = 0.5  # in seconds
+    station_tile_zoom: int = 10  # slippy-map zoom, tiles of ~25 km in France
+    station_tile_cache_ttl: int = 86400  # in seconds, 0 disables the cache
+    station_tile_cache_max_stations: int = 500_000
+    station_tile_power_classes: list[float] = [22.0, 50.0, 150.0, 350.0]  # in kW
+    odre_target_stations_per_query: int = 5000
+    odre_max_chunk_km: float = 600.0  # longest stretch of route per query
+    distance_mode: Literal["ellipsoidal", "spherical"] = "ellipsoidal"
+    worker_processes: int = 0  # planning worker processes, 0 runs in threads
+    transformer_cache_size: int = 64
+    prebuilt_utm_zones: list[int] = [30, 31, 32]  # metropolitan France
+    car_catalogue_snapshot_path: Optional[str] = "data/cars.json"
+    car_catalogue_ttl: int = 86400  # in seconds
+    route_cache_path: Optional[str] = Field(None)  # SQLite file, none for memory only
+    route_cache_ttl: int = 7 * 86400  # in seconds
+    route_cache_precision: int = 4  # in decimal degrees, ~11 m
+    route_cache_memory_bytes: int = 64 * 1024 * 1024
+    route_cache_disk_bytes: int = 1024 * 1024 * 1024
+    itinerary_cache_size: int = 1024
+    itinerary_cache_ttl: int = 3600  # in seconds
+    itinerary_cache_soc_step: float = 5.0  # in %, 0 disables bucketing
+    itinerary_cache_temperature_step: float = 5.0  # in °C, 0 disables bucketing
+    itinerary_corridor_cache_size: int = 64  # direct routes, with their profile
+    itinerary_batch_max_size: int = 1000
+    itinerary_batch_concurrency: int = 16
+    planning_mode: Literal["greedy", "optimal"] = "greedy"
+    consumption_temperature_c: float = 20.0  # for requests giving none
+    planning_time_budget: float = 0.5  # in seconds, then falls back to greedy
+    planning_soc_step: float = 5.0  # in %
+    planning_bucket_km: float = 10.0
+    planning_detour_speed_kmh: float = 50.0
+    planning_stop_overhead_minutes: float = 5.0
+    reroute_mode: Literal["splice", "full"] = "splice"
+    reroute_max_detour_km: float = 20.0  # longer detours re-route the whole trip
+    isochrone_source: Literal["ors", "local"] = "ors"
+    ors_isochrone_max_range_km: float = 120.0  # longer ranges are estimated locally
+    reachability_tile_zoom: int = 12  # origins snap to their tile, ~6 km in France
+    reachability_range_step_km: float = 25.0  # car range classes
+    reachability_soc_step: float = 5.0  # in %
+    reachability_cache_size: int = 4096
+    reachability_cache_ttl: int = 3600  # in seconds
 
     model_config = SettingsConfigDict(
         env_prefix="OUFOALER_", case_sensitive=False, extra="forbid"
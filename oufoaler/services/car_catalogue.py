@@ -0,0 +1,230 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Optional
+
+from oufoaler.config import config
+from oufoaler.models.car import Car
+from oufoaler.services.http_client import get_http_client
+from oufoaler.services.metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+CHARGETRIP_URL = "https://api.chargetrip.io/graphql"
+VEHICLE_LIST_QUERY = '{"query":"query vehicleListAll { vehicleList { id naming { make model version edition chargetrip_version } drivetrain { type } connectors { standard power max_electric_power time speed } adapters { standard power max_electric_power time speed } battery { usable_kwh full_kwh } body { seats } availability { status } range { chargetrip_range { best worst } } media { image { id type url height width thumbnail_url thumbnail_height thumbnail_width } brand { id type url height width thumbnail_url thumbnail_height thumbnail_width } video { id url } } routing { fast_charging_support } connect { providers } } }"}'
+EXCLUDED_VEHICLE_IDS = {"63ef773bc7ac42e426e66301", "63d3e0ce44bd322626dd23f8"}
+RETRY_DELAY = 60  # in seconds
+
+
+def _strip(value: Optional[str]) -> str:
+    return (value or "").strip()
+
+
+async def fetch_vehicle_list() -> list[Car]:
+    """Fetch the full vehicle catalogue from the Chargetrip GraphQL API."""
+    headers = {
+        "Content-Type": "application/json",
+        "x-client-id": config.chargetrip_client_id,
+        "x-app-id": config.chargetrip_app_id,
+    }
+
+    try:
+        response = await get_http_client().post(
+            CHARGETRIP_URL, headers=headers, content=VEHICLE_LIST_QUERY
+        )
+        response_data = response.json()
+        if "errors" in response_data:
+            error_message = response_data["errors"][0]["message"]
+            logger.error(f"GraphQL API Error: {error_message}")
+            raise RuntimeError(f"Failed to fetch cars: {error_message}")
+
+        cars = []
+        for car in response_data.get("data", {}).get("vehicleList", []):
+            if car["id"] in EXCLUDED_VEHICLE_IDS:
+                continue
+
+            p_max = 0.0
+            for connector in car["connectors"]:
+                p_max = max(p_max, connector["max_electric_power"])
+
+            cars.append(
+                Car(
+                    id=car["id"],
+                    make=_strip(car["naming"]["make"]),
+                    model=_strip(car["naming"]["model"]),
+                    version=_strip(car["naming"]["chargetrip_version"]),
+                    power=float(p_max),
+                    battery_capacity=float(car["battery"]["usable_kwh"]),
+                    range_best=float(car["range"]["chargetrip_range"]["best"]),
+                    range_worst=float(car["range"]["chargetrip_range"]["worst"]),
+                    image=car["media"]["image"]["url"],
+                )
+            )
+        return cars
+    except Exception as e:
+        raise RuntimeError(f"Failed to fetch cars: {str(e)}") from e
+
+
+class CatalogueIndex:
+    """Immutable view of one catalogue version, indexed by id and by make/model."""
+
+    def __init__(self, cars: list[Car], version: int = 0) -> None:
+        self.version = version
+        self.cars = tuple(cars)
+        self.by_id = {car.id: car for car in cars}
+
+        by_make = defaultdict(list)
+        by_make_model = defaultdict(list)
+        for car in cars:
+            by_make[car.make.lower()].append(car)
+            by_make_model[(car.make.lower(), car.model.lower())].append(car)
+        self.by_make = {make: tuple(cars) for make, cars in by_make.items()}
+        self.by_make_model = {key: tuple(cars) for key, cars in by_make_model.items()}
+
+        # Pre-rendered once per version, served as-is by the API
+        self.json = json.dumps([car._asdict() for car in cars]).encode("utf-8")
+        self.json_gzip = gzip.compress(self.json)
+
+    def find(self, make: str, model: Optional[str] = None) -> tuple[Car, ...]:
+        if model is None:
+            return self.by_make.get(make.lower(), ())
+        return self.by_make_model.get((make.lower(), model.lower()), ())
+
+
+class CarCatalogue:
+    """In-memory vehicle catalogue, persisted to disk and refreshed in the background.
+
+    Reads never wait on Chargetrip: once the TTL expires the current
+    catalogue keeps being served while a refresh runs (stale-while-revalidate).
+    """
+
+    def __init__(self, snapshot_path: Optional[str], ttl: float) -> None:
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else None
+        self.ttl = ttl
+        self.index = CatalogueIndex([])
+        self.updated_at: Optional[float] = None
+        self.attempted_at: Optional[float] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._background_task: Optional[asyncio.Task] = None
+
+    @property
+    def cars(self) -> tuple[Car, ...]:
+        return self.index.cars
+
+    def _set_cars(self, cars: list[Car]) -> None:
+        self.index = CatalogueIndex(cars, self.index.version + 1)
+
+    @property
+    def age(self) -> float:
+        if self.updated_at is None:
+            return float("inf")
+        return time.time() - self.updated_at
+
+    @property
+    def is_stale(self) -> bool:
+        return self.age >= self.ttl
+
+    @property
+    def can_retry(self) -> bool:
+        """Whether a refresh may start, RETRY_DELAY after the last attempt."""
+        if self._refresh_task is not None or self.attempted_at is None:
+            return True
+        return time.time() - self.attempted_at >= RETRY_DELAY
+
+    def load_snapshot(self) -> bool:
+        if self.snapshot_path is None or not self.snapshot_path.exists():
+            return False
+        try:
+            snapshot = json.loads(self.snapshot_path.read_text())
+            self._set_cars([Car(**car) for car in snapshot["cars"]])
+            self.updated_at = snapshot["updated_at"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable car catalogue snapshot: {e}")
+            return False
+        logger.info(f"Loaded {len(self.cars)} cars from {self.snapshot_path}")
+        return True
+
+    def save_snapshot(self) -> None:
+        if self.snapshot_path is None:
+            return
+        self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.snapshot_path.with_suffix(".tmp")
+        tmp_path.write_text(
+            json.dumps(
+                {
+                    "updated_at": self.updated_at,
+                    "cars": [car._asdict() for car in self.cars],
+                }
+            )
+        )
+        os.replace(tmp_path, self.snapshot_path)
+
+    async def _refresh(self) -> None:
+        try:
+            self._set_cars(await fetch_vehicle_list())
+            self.updated_at = time.time()
+            logger.info(f"Refreshed car catalogue, {len(self.cars)} cars")
+            try:
+                await asyncio.to_thread(self.save_snapshot)
+            except OSError as e:
+                # The fetched catalogue is served all the same
+                logger.warning(f"Could not save the car catalogue snapshot: {e}")
+        finally:
+            self._refresh_task = None
+
+    def refresh(self) -> asyncio.Task:
+        """Start a refresh, or join the one already in flight."""
+        if self._refresh_task is None:
+            self.attempted_at = time.time()
+            self._refresh_task = asyncio.create_task(self._refresh())
+            self._refresh_task.add_done_callback(self._log_refresh_failure)
+        return self._refresh_task
+
+    def _log_refresh_failure(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Car catalogue refresh failed: {task.exception()}")
+
+    def get_index(self) -> CatalogueIndex:
+        # Requests only retry a failed refresh once RETRY_DELAY has passed
+        if self.is_stale and self.can_retry:
+            self.refresh()
+        return self.index
+
+    async def _refresh_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(max(0.0, self.ttl - self.age))
+            try:
+                await self.refresh()
+            except Exception:
+                await asyncio.sleep(RETRY_DELAY)
+
+    async def start(self) -> None:
+        """Load the snapshot (or fetch once if there is none) and start refreshing."""
+        if not self.load_snapshot():
+            try:
+                await self.refresh()
+            except Exception:
+                # Already logged, the periodic refresh retries it
+                pass
+        self._background_task = asyncio.create_task(self._refresh_periodically())
+
+    async def stop(self) -> None:
+        for task in (self._background_task, self._refresh_task):
+            if task is not None:
+                task.cancel()
+
+
+car_catalogue = CarCatalogue(
+    config.car_catalogue_snapshot_path, config.car_catalogue_ttl
+)
+
+CAR_CATALOGUE_AGE = Gauge(
+    "oufoaler_car_catalogue_age_seconds",
+    "Age of the in-memory vehicle catalogue snapshot",
+    function=lambda: car_catalogue.age,
+)
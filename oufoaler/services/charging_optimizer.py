@@ -0,0 +1,247 @@
+import math
+import time
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+CHARGE_TAPER_SOC = 80.0  # in %, charging power decreases above this level
+CHARGE_TAPER_END_RATIO = 0.25  # power at 100% SoC, relative to the peak power
+
+
+def charge_curve_integral(soc):
+    """Primitive F of 1 / relative charging power, in % of SoC.
+
+    Charging from `a` to `b` at a peak power P (kW) takes
+    capacity / 100 * (F(b) - F(a)) / P hours. Power is flat up to
+    CHARGE_TAPER_SOC, then decreases linearly to CHARGE_TAPER_END_RATIO of
+    the peak at 100%.
+    """
+    soc = np.clip(np.asarray(soc, dtype=np.float64), 0.0, 100.0)
+    slope = (1.0 - CHARGE_TAPER_END_RATIO) / (100.0 - CHARGE_TAPER_SOC)
+    tapered = np.maximum(soc - CHARGE_TAPER_SOC, 0.0)
+    return np.minimum(soc, CHARGE_TAPER_SOC) - np.log1p(-slope * tapered) / slope
+
+
+def charging_time_hours(soc_from, soc_to, power, battery_capacity):
+    return (
+        battery_capacity
+        / 100.0
+        * (charge_curve_integral(soc_to) - charge_curve_integral(soc_from))
+        / power
+    )
+
+
+class ChargingPlan(NamedTuple):
+    stops: list[int]  # indices into the station arrays, along the route
+    departure_socs: list[float]
+    charging_hours: list[float]
+    total_hours: float  # detours, stop overheads and charging
+
+
+class PlanningBudgetExceeded(Exception):
+    pass
+
+
+class ChargingStopOptimizer:
+    """Minimum-time charging stop search over the stations along a route.
+
+    Dynamic programming over (station, departure SoC) states, stations taken
+    in route order: a state's cost is the time spent off the motorway so far
+    (detours, stop overheads and charging), driving time along the route
+    being the same for every plan. SoC is discretized every `soc_step`
+    percent, arrivals being rounded down so plans stay feasible. Charging
+    may stop at any level up to soc_max and follows a tapering power curve.
+
+    To bound the search, only the stations not dominated (lower power and
+    longer detour) by another one within the same `bucket_km` of route are
+    kept, states dominated by a higher SoC at a lower cost are dropped, and
+    so are states costlier than `upper_bound` (typically the greedy plan).
+    PlanningBudgetExceeded is raised once `time_budget` seconds are spent.
+    """
+
+    def __init__(
+        self,
+        soc_step: float = 5.0,
+        bucket_km: float = 5.0,
+        detour_speed_kmh: float = 50.0,
+        stop_overhead_minutes: float = 5.0,
+        time_budget: float = 0.5,
+    ) -> None:
+        self.soc_step = soc_step
+        self.bucket_km = bucket_km
+        self.detour_speed_kmh = detour_speed_kmh
+        self.stop_overhead_hours = stop_overhead_minutes / 60.0
+        self.time_budget = time_budget
+
+    def stop_cost_hours(self, offset_km, soc_from, soc_to, power, battery_capacity):
+        return (
+            2.0 * offset_km / self.detour_speed_kmh
+            + self.stop_overhead_hours
+            + charging_time_hours(soc_from, soc_to, power, battery_capacity)
+        )
+
+    def plan_cost_hours(
+        self,
+        stops,
+        socs_used,
+        offsets,
+        powers,
+        total_soc_used: float,
+        soc_start: float,
+        soc_min: float,
+        soc_max: float,
+        detour_soc_per_km: float,
+        battery_capacity: float,
+    ) -> float:
+        """Cost of charging to soc_max at each of `stops`, inf if infeasible."""
+        total = 0.0
+        soc, used, offset = soc_start, 0.0, 0.0
+        for stop in stops:
+            soc -= socs_used[stop] - used + (offset + offsets[stop]) * detour_soc_per_km
+            if soc < soc_min:
+                return math.inf
+            total += self.stop_cost_hours(
+                offsets[stop], soc, soc_max, powers[stop], battery_capacity
+            )
+            soc, used, offset = soc_max, socs_used[stop], offsets[stop]
+        soc -= total_soc_used - used + offset * detour_soc_per_km
+        return total if soc >= soc_min else math.inf
+
+    def candidates(self, distances, offsets, powers) -> np.ndarray:
+        """Indices of the stations not dominated within their route bucket."""
+        buckets = np.floor(distances / self.bucket_km)
+        order = np.lexsort((offsets, -powers, buckets))
+        # Running minimum of the detour within each bucket, by decreasing
+        # power: buckets are offset so that they never mix in the minimum
+        keys = offsets[order] - buckets[order] * (offsets.max(initial=0.0) + 1.0)
+        best_before = np.minimum.accumulate(np.concatenate(([np.inf], keys)))[:-1]
+        return np.sort(order[keys < best_before])
+
+    def plan(
+        self,
+        distances,
+        socs_used,
+        offsets,
+        powers,
+        total_soc_used: float,
+        soc_start: float,
+        soc_min: float,
+        soc_max: float,
+        detour_soc_per_km: float,
+        battery_capacity: float,
+        upper_bound: float = math.inf,
+    ) -> Optional[ChargingPlan]:
+        """Find the fastest plan, or None if none is cheaper than `upper_bound`.
+
+        `distances` (along the route, in km), `socs_used` (SoC used along the
+        route up to the station), `offsets` (from the route to the station,
+        in km, driven at `detour_soc_per_km`) and `powers` (effective peak
+        power) are station arrays.
+        """
+        deadline = time.perf_counter() + self.time_budget
+
+        if soc_start - total_soc_used >= soc_min:
+            return ChargingPlan([], [], [], 0.0)
+
+        nodes = self.candidates(distances, offsets, powers)
+        node_socs = socs_used[nodes]
+        node_offsets = offsets[nodes]
+        node_powers = powers[nodes]
+        n = len(nodes)
+
+        levels = np.arange(soc_min, soc_max, self.soc_step)
+        levels = np.append(levels[levels < soc_max], soc_max)
+        n_levels = len(levels)
+        curve = charge_curve_integral(levels)
+        # charge_cost[a, b]: charging from level a to level b, at 1 kW peak
+        charge_cost = battery_capacity / 100.0 * (curve[None, :] - curve[:, None])
+        charge_cost[np.tril_indices(n_levels)] = np.inf
+
+        max_leg = max(soc_max, soc_start) - soc_min  # in SoC used
+        cost = np.full((n, n_levels), np.inf)
+        pred_node = np.full((n, n_levels), -1)
+        pred_level = np.zeros((n, n_levels), dtype=np.intp)
+        arrival_level = np.zeros((n, n_levels), dtype=np.intp)
+
+        for j in range(n):
+            if time.perf_counter() > deadline:
+                raise PlanningBudgetExceeded(
+                    f"Charging stop search exceeded {self.time_budget}s"
+                )
+
+            # Arrivals at j from every state within range, then from the origin
+            lo = np.searchsorted(node_socs, node_socs[j] - max_leg)
+            rows, cols = np.nonzero(np.isfinite(cost[lo:j]))
+            rows += lo
+            needs = (
+                node_socs[j]
+                - node_socs[rows]
+                + (node_offsets[rows] + node_offsets[j]) * detour_soc_per_km
+            )
+            sources = np.append(rows, -1)
+            source_levels = np.append(cols, 0)
+            arrival_socs = np.append(
+                levels[cols] - needs,
+                soc_start - node_socs[j] - node_offsets[j] * detour_soc_per_km,
+            )
+            arrival_costs = np.append(cost[rows, cols], 0.0)
+
+            reached = np.searchsorted(levels, arrival_socs, side="right") - 1
+            feasible = reached >= 0
+            if not feasible.any():
+                continue
+            sources, source_levels = sources[feasible], source_levels[feasible]
+            reached, arrival_costs = reached[feasible], arrival_costs[feasible]
+
+            # Cheapest arrival for each reached level
+            order = np.lexsort((arrival_costs, reached))
+            reached_levels, first = np.unique(reached[order], return_index=True)
+            best = order[first]
+            best_arrival = np.full(n_levels, np.inf)
+            best_arrival[reached_levels] = arrival_costs[best]
+            best_source = np.full(n_levels, -1)
+            best_source[reached_levels] = best
+
+            # Then the cheapest charge up to each departure level
+            departure = best_arrival[:, None] + charge_cost / node_powers[j]
+            chosen = np.argmin(departure, axis=0)
+            departure_cost = departure[chosen, np.arange(n_levels)]
+            departure_cost += (
+                2.0 * node_offsets[j] / self.detour_speed_kmh + self.stop_overhead_hours
+            )
+
+            # Drop states costlier than the bound or than a higher SoC
+            cheaper_above = np.append(
+                np.minimum.accumulate(departure_cost[::-1])[::-1][1:], np.inf
+            )
+            departure_cost[
+                (departure_cost >= upper_bound) | (departure_cost >= cheaper_above)
+            ] = np.inf
+
+            kept = np.isfinite(departure_cost)
+            source = best_source[chosen[kept]]
+            cost[j, kept] = departure_cost[kept]
+            pred_node[j, kept] = sources[source]
+            pred_level[j, kept] = source_levels[source]
+            arrival_level[j, kept] = chosen[kept]
+
+        # Finish from any state that reaches the destination above soc_min
+        remaining = total_soc_used - node_socs + node_offsets * detour_soc_per_km
+        final_socs = levels[None, :] - remaining[:, None]
+        final_costs = np.where(final_socs >= soc_min, cost, np.inf)
+        if n == 0 or not np.isfinite(final_costs).any():
+            return None
+        j, level = np.unravel_index(np.argmin(final_costs), final_costs.shape)
+        total_hours = float(final_costs[j, level])
+
+        stops, departure_socs, charging_hours = [], [], []
+        while j >= 0:
+            stops.append(int(nodes[j]))
+            departure_socs.append(float(levels[level]))
+            charging_hours.append(
+                float(charge_cost[arrival_level[j, level], level] / node_powers[j])
+            )
+            j, level = pred_node[j, level], pred_level[j, level]
+        return ChargingPlan(
+            stops[::-1], departure_socs[::-1], charging_hours[::-1], total_hours
+        )
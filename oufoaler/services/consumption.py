@@ -0,0 +1,158 @@
+"""Energy use along a route, segment by segment.
+
+A car's flat consumption, from the average of its best and worst ranges,
+is scaled on each route segment by
+
+- its speed, taken from the ORS step durations: rolling resistance and
+  auxiliaries are flat, aerodynamic drag grows with the square of speed;
+- its gradient, from the ORS `steepness` extra info: climbing takes the
+  potential energy of the car's estimated mass, descending gives part of
+  it back through regenerative braking;
+- the outside temperature, for cabin heating and battery losses in the
+  cold and air conditioning in the heat.
+
+A segment never gives back more than it uses, so the cumulative SoC used
+along the route never decreases.
+"""
+
+from itertools import chain
+from operator import itemgetter
+from typing import NamedTuple
+
+import numpy as np
+
+from oufoaler.models.car import Car
+
+REFERENCE_SPEED_KMH = 90.0  # speed of the flat consumption
+SPEED_CONSTANT_SHARE = 0.6  # rolling and auxiliaries, the rest is drag
+REFERENCE_TEMPERATURE_C = 20.0
+COLD_FACTOR_PER_DEGREE = 0.01  # below the reference temperature
+HEAT_THRESHOLD_C = 25.0
+HEAT_FACTOR_PER_DEGREE = 0.005  # above the heat threshold
+CURB_MASS_KG = 1400.0  # without the battery
+BATTERY_MASS_KG_PER_KWH = 6.0
+DRIVETRAIN_EFFICIENCY = 0.9
+REGENERATION_EFFICIENCY = 0.6
+GRAVITY = 9.81
+JOULES_PER_KWH = 3.6e6
+
+# Grade of each ORS steepness class, -5 to 5
+STEEPNESS_GRADES = np.array(
+    [-0.16, -0.135, -0.09, -0.05, -0.02, 0.0, 0.02, 0.05, 0.09, 0.135, 0.16]
+)
+
+
+class RouteProfile(NamedTuple):
+    """Per-segment driving conditions of a route, whatever the car."""
+
+    drive_km: np.ndarray  # length, weighted by the speed consumption factor
+    climb_m: np.ndarray  # height climbed, weighted by the drivetrain efficiency
+
+
+def spread(
+    ranges: np.ndarray, values: np.ndarray, segments: int, fill: float
+) -> np.ndarray:
+    """Per-segment array of `values`, each given for a [first, last) range
+    of vertices, in route order, `fill` elsewhere."""
+    first = np.clip(ranges[:, 0], 0, segments)
+    ends = np.maximum.accumulate(np.clip(ranges[:, 1], 0, segments))
+    previous_ends = np.concatenate(([0], ends[:-1]))
+    starts = np.maximum(first, previous_ends)
+    # Alternate runs of `fill` before each range and of its value
+    runs = np.empty(2 * len(ranges) + 1)
+    runs[0:-1:2], runs[1::2], runs[-1] = fill, values, fill
+    sizes = np.empty(2 * len(ranges) + 1, dtype=np.intp)
+    sizes[0:-1:2] = starts - previous_ends
+    sizes[1::2] = np.maximum(ends - starts, 0)
+    sizes[-1] = segments - ends[-1] if len(ranges) else segments
+    return np.repeat(runs, sizes)
+
+
+def speed_factor(speeds_kmh: np.ndarray) -> np.ndarray:
+    """Consumption relative to the flat one at each speed, 1 when unknown."""
+    ratio = speeds_kmh / REFERENCE_SPEED_KMH
+    factor = SPEED_CONSTANT_SHARE + (1 - SPEED_CONSTANT_SHARE) * ratio * ratio
+    return np.nan_to_num(factor, nan=1.0)
+
+
+def route_profile(itinerary: dict, cumulative_distances: np.ndarray) -> RouteProfile:
+    """Profile of a single-feature ORS itinerary, whose vertices are those of
+    the route of `cumulative_distances` (km). Segments without step or
+    steepness data are driven at the reference speed, on the flat."""
+    lengths_km = np.diff(cumulative_distances)
+    segments = len(lengths_km)
+    features = itinerary.get("features", [])
+    properties = features[0].get("properties", {}) if len(features) == 1 else {}
+
+    steps = [
+        step
+        for segment in properties.get("segments", [])
+        for step in segment.get("steps", [])
+    ]
+    step_ranges = np.fromiter(
+        chain.from_iterable(map(itemgetter("way_points"), steps)),
+        dtype=np.intp,
+        count=2 * len(steps),
+    ).reshape(-1, 2)
+    distances, durations = (
+        np.fromiter(
+            chain.from_iterable(map(itemgetter("distance", "duration"), steps)),
+            dtype=np.float64,
+            count=2 * len(steps),
+        )
+        .reshape(-1, 2)
+        .T
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speeds = np.where(durations > 0, distances / durations * 3.6, np.nan)
+    drive_km = spread(step_ranges, speed_factor(speeds), segments, 1.0)
+    drive_km *= lengths_km
+
+    steepness = properties.get("extras", {}).get("steepness", {}).get("values", [])
+    values = np.fromiter(
+        chain.from_iterable(steepness), dtype=np.intp, count=3 * len(steepness)
+    ).reshape(-1, 3)
+    # Weight each range's grade rather than each segment's climb, the sign
+    # of a climb being that of its grade
+    grades = np.take(STEEPNESS_GRADES, values[:, 2] + 5, mode="clip")
+    grades *= np.where(
+        grades > 0, 1000.0 / DRIVETRAIN_EFFICIENCY, 1000.0 * REGENERATION_EFFICIENCY
+    )
+    climb_m = spread(values[:, :2], grades, segments, 0.0)
+    climb_m *= lengths_km
+    return RouteProfile(drive_km, climb_m)
+
+
+class ConsumptionModel:
+    def temperature_factor(self, temperature_c: float) -> float:
+        return (
+            1.0
+            + COLD_FACTOR_PER_DEGREE * max(REFERENCE_TEMPERATURE_C - temperature_c, 0.0)
+            + HEAT_FACTOR_PER_DEGREE * max(temperature_c - HEAT_THRESHOLD_C, 0.0)
+        )
+
+    def soc_per_km(self, car: Car, temperature_c: float) -> float:
+        """Flat SoC use in % per km at the reference speed, 0 for a car of
+        unknown range."""
+        average_range = (car.range_best + car.range_worst) / 2
+        if not average_range > 0:
+            return 0.0
+        return 100.0 / average_range * self.temperature_factor(temperature_c)
+
+    def soc_per_climb_m(self, car: Car) -> float:
+        """SoC in % of the potential energy of one metre of climb."""
+        if not car.battery_capacity > 0:
+            return 0.0
+        mass_kg = CURB_MASS_KG + BATTERY_MASS_KG_PER_KWH * car.battery_capacity
+        return mass_kg * GRAVITY / JOULES_PER_KWH / car.battery_capacity * 100.0
+
+    def cumulative_soc(
+        self, profile: RouteProfile, car: Car, temperature_c: float
+    ) -> np.ndarray:
+        """SoC used in % from the start to each route vertex."""
+        socs = profile.drive_km * self.soc_per_km(car, temperature_c)
+        socs += profile.climb_m * self.soc_per_climb_m(car)
+        np.maximum(socs, 0.0, out=socs)
+        cumulative = np.zeros(len(socs) + 1)
+        np.cumsum(socs, out=cumulative[1:])
+        return cumulative
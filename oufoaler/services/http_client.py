@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import random
+import time
+from collections import defaultdict
+from typing import Optional
+
+import httpx
+
+from oufoaler.config import config
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` requests per second with bursts of `burst`."""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated_at) * self.rate
+                )
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class HttpClient:
+    """Pooled async HTTP client with per-host concurrency, rate limit and retries."""
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_concurrency_per_host: int = 8,
+        rate_limit_per_host: float = 10.0,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        timeout: float = 60.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.max_concurrency_per_host = max_concurrency_per_host
+        self.rate_limit_per_host = rate_limit_per_host
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self._client = httpx.AsyncClient(
+            timeout=timeout,
+            transport=transport,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+        self._semaphores: dict[str, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(self.max_concurrency_per_host)
+        )
+        self._rate_limiters: dict[str, RateLimiter] = defaultdict(
+            lambda: RateLimiter(self.rate_limit_per_host, self.max_concurrency_per_host)
+        )
+
+    def _backoff_delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        if response is not None and "Retry-After" in response.headers:
+            try:
+                return float(response.headers["Retry-After"])
+            except ValueError:
+                pass
+        delay = self.backoff_factor * (2**attempt)
+        return delay + random.uniform(0, delay / 2)
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        host = httpx.URL(url).host
+        attempt = 0
+        while True:
+            response = None
+            async with self._semaphores[host]:
+                await self._rate_limiters[host].acquire()
+                try:
+                    response = await self._client.request(method, url, **kwargs)
+                    if (
+                        response.status_code not in RETRY_STATUS_CODES
+                        or attempt >= self.max_retries
+                    ):
+                        response.raise_for_status()
+                        return response
+                except httpx.TransportError:
+                    if attempt >= self.max_retries:
+                        raise
+
+            delay = self._backoff_delay(attempt, response)
+            logger.warning(
+                f"{method} {host} failed "
+                f"({response.status_code if response is not None else 'transport error'}), "
+                f"retrying in {delay:.2f}s"
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+_http_client: Optional[HttpClient] = None
+
+
+def get_http_client() -> HttpClient:
+    """Return the process-wide HTTP client, shared across requests."""
+    global _http_client
+    if _http_client is None:
+        _http_client = HttpClient(
+            max_connections=config.http_max_connections,
+            max_concurrency_per_host=config.http_max_concurrency_per_host,
+            rate_limit_per_host=config.http_rate_limit_per_host,
+            max_retries=config.http_max_retries,
+            backoff_factor=config.http_backoff_factor,
+        )
+    return _http_client
+
+
+def set_http_client(client: HttpClient) -> None:
+    """Replace the process-wide HTTP client, e.g. with one on a stub transport."""
+    global _http_client
+    _http_client = client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
@@ -0,0 +1,533 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, defaultdict
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    NamedTuple,
+    Optional,
+    Union,
+)
+
+import pandas as pd
+
+from oufoaler.config import config
+from oufoaler.controllers.car_controller import CarController, CarNotFoundError
+from oufoaler.controllers.charging_station_controller import (
+    ChargingStationsController,
+)
+from oufoaler.controllers.itinerary_controller import (
+    CHARGING_PLANS,
+    ItineraryController,
+    NoAccessibleStationError,
+)
+from oufoaler.models.api import Coordinates, ItineraryRequest, ItineraryResponse
+from oufoaler.models.car import Car
+from oufoaler.models.route import Route
+from oufoaler.services.consumption import (
+    ConsumptionModel,
+    RouteProfile,
+    route_profile,
+)
+from oufoaler.services.http_client import get_http_client
+from oufoaler.services.metrics import Counter
+from oufoaler.services.station_index import on_station_index_refresh
+from oufoaler.services.tracing import span
+from oufoaler.services.worker_pool import worker_pool
+
+ITINERARY_CACHE_REQUESTS = Counter(
+    "oufoaler_itinerary_cache_requests_total",
+    "Itinerary plan cache lookups, by result",
+    ("result",),
+)
+
+
+class Corridor(NamedTuple):
+    """Direct route between a departure and an arrival, before any stop."""
+
+    itinerary: dict
+    route: Route
+    profile: RouteProfile
+
+
+class ItineraryPlanner:
+    """Plans itineraries, memoizing results and coalescing identical requests."""
+
+    def __init__(
+        self,
+        cache_size: int,
+        ttl: float,
+        soc_step: float,
+        temperature_step: float,
+        precision: int,
+        batch_concurrency: int = 16,
+        corridor_cache_size: int = 64,
+    ) -> None:
+        self.cache_size = cache_size
+        self.corridor_cache_size = corridor_cache_size
+        self.batch_concurrency = batch_concurrency
+        self.ttl = ttl
+        self.soc_step = soc_step
+        self.temperature_step = temperature_step
+        self.precision = precision
+        # Plans and in-flight computations per bucket, with the request planned
+        self._cache: OrderedDict[
+            tuple, tuple[float, ItineraryRequest, ItineraryResponse]
+        ] = OrderedDict()
+        self._in_flight: dict[tuple, tuple[ItineraryRequest, asyncio.Task]] = {}
+        # Direct routes, with their distances and profile, whatever the car
+        self._corridors: OrderedDict[tuple, tuple[float, asyncio.Task]] = OrderedDict()
+        self._generation = 0
+
+        self.itinerary_ctrl = ItineraryController()
+        self.car_ctrl = CarController()
+        self.charging_stations_ctrl = ChargingStationsController()
+        self.consumption_model = ConsumptionModel()
+
+    def canonicalize(self, request: ItineraryRequest) -> ItineraryRequest:
+        """Quantize a request's coordinates and resolve its defaults. SoC
+        values and the temperature are kept as given: they are only
+        bucketed in the cache key."""
+
+        def quantize(coords: Coordinates) -> Coordinates:
+            return Coordinates(
+                lat=round(coords.lat, self.precision),
+                lon=round(coords.lon, self.precision),
+            )
+
+        return ItineraryRequest(
+            car_id=request.car_id,
+            soc_start=request.soc_start,
+            soc_min=request.soc_min,
+            soc_max=request.soc_max,
+            departure=quantize(request.departure),
+            arrival=quantize(request.arrival),
+            planning_mode=request.planning_mode or config.planning_mode,
+            temperature_c=(
+                config.consumption_temperature_c
+                if request.temperature_c is None
+                else request.temperature_c
+            ),
+        )
+
+    def cache_key(self, request: ItineraryRequest) -> tuple:
+        """Key of a canonical request's bucket: requests whose SoC values
+        and temperature fall in the same steps share their plans, when
+        feasible (see `covers`)."""
+
+        def bucket(value: Optional[float], step: float) -> Optional[float]:
+            if value is None or step <= 0:
+                return value
+            return math.floor(value / step)
+
+        return (
+            request.car_id,
+            bucket(request.soc_start, self.soc_step),
+            bucket(request.soc_min, self.soc_step),
+            bucket(request.soc_max, self.soc_step),
+            request.departure.lon,
+            request.departure.lat,
+            request.arrival.lon,
+            request.arrival.lat,
+            request.planning_mode,
+            bucket(request.temperature_c, self.temperature_step),
+        )
+
+    def covers(self, planned: ItineraryRequest, request: ItineraryRequest) -> bool:
+        """Whether the plan made for `planned` is feasible for `request` of
+        the same bucket: it started with no more charge, kept at least as
+        much in reserve, charged no higher and drove in weather costing at
+        least as much energy (colder below the reference temperature,
+        hotter above the heat threshold)."""
+
+        def temperature_factor(temperature_c: Optional[float]) -> float:
+            if temperature_c is None:
+                temperature_c = config.consumption_temperature_c
+            return self.consumption_model.temperature_factor(temperature_c)
+
+        return (
+            planned.soc_start <= request.soc_start
+            and planned.soc_min >= request.soc_min
+            and planned.soc_max <= request.soc_max
+            and temperature_factor(planned.temperature_c)
+            >= temperature_factor(request.temperature_c)
+        )
+
+    def invalidate(self) -> None:
+        """Drop every memoized plan, e.g. when the station dataset changes."""
+        self._generation += 1
+        self._cache.clear()
+        self._in_flight.clear()
+
+    async def plan(self, request: ItineraryRequest) -> ItineraryResponse:
+        request = self.canonicalize(request)
+        return await self._plan(request, lambda: self.compute(request))
+
+    async def plan_stream(
+        self, request: ItineraryRequest
+    ) -> AsyncIterator[tuple[str, Any]]:
+        """Plan one itinerary, yielding its progress as (event, data) pairs.
+
+        ("route", geojson) is the direct route, ("stop", [lon, lat]) each
+        recharge stop once planned, and ("itinerary", response) comes last.
+        Plans served from the cache, or computed for another identical
+        request, only yield their final itinerary. Errors are raised.
+        """
+        request = self.canonicalize(request)
+        events: asyncio.Queue = asyncio.Queue()
+
+        def progress(event: str, data: Any) -> None:
+            events.put_nowait((event, data))
+
+        task = asyncio.ensure_future(
+            self._plan(request, lambda: self.compute(request, progress=progress))
+        )
+        try:
+            while not task.done():
+                next_event = asyncio.ensure_future(events.get())
+                await asyncio.wait(
+                    {task, next_event}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not next_event.done():
+                    next_event.cancel()
+                    break
+                yield next_event.result()
+            while not events.empty():
+                yield events.get_nowait()
+            yield "itinerary", await task
+        finally:
+            # The shielded computation itself goes on, and is cached
+            task.cancel()
+
+    async def _plan(
+        self,
+        request: ItineraryRequest,
+        compute: Callable[[], Awaitable[ItineraryResponse]],
+    ) -> ItineraryResponse:
+        key = self.cache_key(request)
+
+        cached = self._cache.get(key)
+        if (
+            cached is not None
+            and time.time() - cached[0] < self.ttl
+            and self.covers(cached[1], request)
+        ):
+            self._cache.move_to_end(key)
+            ITINERARY_CACHE_REQUESTS.inc(result="hit")
+            return cached[2]
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None and self.covers(in_flight[0], request):
+            ITINERARY_CACHE_REQUESTS.inc(result="coalesced")
+            task = in_flight[1]
+        else:
+            ITINERARY_CACHE_REQUESTS.inc(result="miss")
+            task = asyncio.create_task(self._compute_and_store(key, request, compute))
+            self._in_flight[key] = (request, task)
+        # Shielded so that one client going away does not cancel the others
+        return await asyncio.shield(task)
+
+    async def _compute_and_store(
+        self,
+        key: tuple,
+        request: ItineraryRequest,
+        compute: Callable[[], Awaitable[ItineraryResponse]],
+    ) -> ItineraryResponse:
+        generation = self._generation
+        try:
+            response = await compute()
+            # Plans computed against a since-invalidated dataset are not kept
+            if generation == self._generation:
+                self._cache[key] = (time.time(), request, response)
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            return response
+        finally:
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None and in_flight[1] is asyncio.current_task():
+                del self._in_flight[key]
+
+    async def plan_batch(
+        self, requests: list[ItineraryRequest]
+    ) -> AsyncIterator[tuple[int, Union[ItineraryResponse, Exception]]]:
+        """Plan many itineraries, yielding (index, response or error) as
+        each completes.
+
+        Cars are looked up once, and requests sharing a corridor (same
+        canonical departure and arrival) share its route and a single
+        station fetch, made for the most powerful car of the group.
+        """
+        requests = [self.canonicalize(request) for request in requests]
+
+        cars: dict[str, Union[Car, Exception]] = {}
+        for car_id in dict.fromkeys(request.car_id for request in requests):
+            try:
+                cars[car_id] = await self.car_ctrl.get_car_by_id(car_id)
+            except (CarNotFoundError, RuntimeError) as e:
+                cars[car_id] = e
+
+        def corridor_key(request: ItineraryRequest) -> tuple:
+            return (
+                request.departure.lon,
+                request.departure.lat,
+                request.arrival.lon,
+                request.arrival.lat,
+            )
+
+        group_power: dict[tuple, float] = defaultdict(float)
+        for request in requests:
+            car = cars[request.car_id]
+            if isinstance(car, Car):
+                key = corridor_key(request)
+                group_power[key] = max(group_power[key], car.power)
+
+        corridors: dict[tuple, asyncio.Future] = {}
+        corridor_stations: dict[tuple, asyncio.Future] = {}
+
+        def shared(tasks: dict, key: tuple, coro) -> asyncio.Future:
+            if key not in tasks:
+                tasks[key] = asyncio.ensure_future(coro())
+            return tasks[key]
+
+        async def plan_one(request: ItineraryRequest, car: Car) -> ItineraryResponse:
+            key = corridor_key(request)
+            corridor = await shared(
+                corridors,
+                key,
+                lambda: self.get_corridor(request.departure, request.arrival),
+            )
+
+            async def get_stations(corridor: Corridor, car: Car) -> pd.DataFrame:
+                stations_df = await shared(
+                    corridor_stations,
+                    key,
+                    lambda: self.get_stations(
+                        corridor, car._replace(power=group_power[key])
+                    ),
+                )
+                return self.charging_stations_ctrl.filter_by_power(
+                    stations_df, car.power
+                )
+
+            return await self.compute(request, car, corridor, get_stations)
+
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+        async def run(index: int, request: ItineraryRequest):
+            car = cars[request.car_id]
+            if isinstance(car, Exception):
+                return index, car
+            async with semaphore:
+                try:
+                    return index, await self._plan(
+                        request, lambda: plan_one(request, car)
+                    )
+                except Exception as e:
+                    return index, e
+
+        tasks = [asyncio.ensure_future(run(i, r)) for i, r in enumerate(requests)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def get_corridor(
+        self, departure: Coordinates, arrival: Coordinates
+    ) -> Corridor:
+        """Direct route between two canonical points, kept for the cache TTL
+        so that only the car-dependent steps run again for the next request
+        along it. Concurrent requests share a single computation."""
+        key = (departure.lon, departure.lat, arrival.lon, arrival.lat)
+        cached = self._corridors.get(key)
+        if cached is not None and time.time() - cached[0] < self.ttl:
+            self._corridors.move_to_end(key)
+            task = cached[1]
+        else:
+            task = asyncio.create_task(self._get_corridor(departure, arrival))
+            self._corridors[key] = (time.time(), task)
+            while len(self._corridors) > self.corridor_cache_size:
+                self._corridors.popitem(last=False)
+            task.add_done_callback(lambda task: self._forget_corridor(key, task))
+        return await asyncio.shield(task)
+
+    def _forget_corridor(self, key: tuple, task: asyncio.Task) -> None:
+        """Drop a failed corridor, so that the next request tries again."""
+        cached = self._corridors.get(key)
+        if cached is not None and cached[1] is task:
+            if task.cancelled() or task.exception() is not None:
+                del self._corridors[key]
+
+    async def _get_corridor(
+        self, departure: Coordinates, arrival: Coordinates
+    ) -> Corridor:
+        itinerary_ctrl = self.itinerary_ctrl
+
+        # Step 1: Calculate itinerary
+        with span("route"):
+            initial_itinerary = await itinerary_ctrl.get_driving_route(
+                departure, arrival
+            )
+
+        # Step 2: Fetch route details
+        route = itinerary_ctrl.extract_route_from_geojson(initial_itinerary)
+
+        # Step 3: Fetch route distance
+        with span("distances", points=len(route)):
+            route.cumulative_distances, _ = await worker_pool.run(
+                itinerary_ctrl.compute_cumulative_distances, route
+            )
+            # and the driving conditions along it
+            profile = route_profile(initial_itinerary, route.cumulative_distances)
+        return Corridor(initial_itinerary, route, profile)
+
+    async def get_stations(self, corridor: Corridor, car: Car) -> pd.DataFrame:
+        """Charging stations usable by `car`, positioned along the corridor."""
+        charging_stations_ctrl = self.charging_stations_ctrl
+        with span("stations") as stations_span:
+            stations = await charging_stations_ctrl.find_charging_stations_near_route(
+                corridor.route, car, get_http_client()
+            )
+            stations_span.set_attribute("stations", len(stations))
+        with span("positions", stations=len(stations)):
+            return await worker_pool.run(
+                self.itinerary_ctrl.compute_station_positions_along_route,
+                stations,
+                corridor.route,
+            )
+
+    async def compute(
+        self,
+        request: ItineraryRequest,
+        car: Optional[Car] = None,
+        corridor: Optional[Corridor] = None,
+        get_stations: Optional[
+            Callable[[Corridor, Car], Awaitable[pd.DataFrame]]
+        ] = None,
+        progress: Optional[Callable[[str, Any], None]] = None,
+    ) -> ItineraryResponse:
+        """Plan one itinerary; the batch planner passes in its shared car,
+        corridor and station lookups, the streaming one a `progress`
+        callback, told of the direct route and of each stop."""
+        with span(
+            "itinerary", car_id=request.car_id, planning_mode=request.planning_mode
+        ):
+            return await self._compute(request, car, corridor, get_stations, progress)
+
+    async def _compute(
+        self,
+        request: ItineraryRequest,
+        car: Optional[Car],
+        corridor: Optional[Corridor],
+        get_stations: Optional[Callable[[Corridor, Car], Awaitable[pd.DataFrame]]],
+        progress: Optional[Callable[[str, Any], None]],
+    ) -> ItineraryResponse:
+        itinerary_ctrl = self.itinerary_ctrl
+        car_ctrl = self.car_ctrl
+
+        if car is None:
+            car = await car_ctrl.get_car_by_id(request.car_id)
+        if corridor is None:
+            corridor = await self.get_corridor(request.departure, request.arrival)
+        initial_itinerary = corridor.itinerary
+        if progress is not None:
+            progress("route", initial_itinerary)
+
+        # Step 5: Calculate the SoC used along the route, and off it
+        consumption_model = self.consumption_model
+        temperature_c = (
+            config.consumption_temperature_c
+            if request.temperature_c is None
+            else request.temperature_c
+        )
+        soc_per_km = consumption_model.soc_per_km(car, temperature_c)
+        if soc_per_km <= 0:
+            raise NoAccessibleStationError(
+                "No accessible charging stations found before reaching minimum battery level."
+            )
+        cumulative_soc = consumption_model.cumulative_soc(
+            corridor.profile, car, temperature_c
+        )
+
+        # Step 6: Check if charging is necessary
+        if request.soc_start - cumulative_soc[-1] >= request.soc_min:
+            return ItineraryResponse(itinerary=initial_itinerary)
+
+        # Fetch charging stations near the route, positioned along it
+        stations_df = await (get_stations or self.get_stations)(corridor, car)
+
+        # Plan recharge stops
+        try:
+            with span("planning", stations=len(stations_df)):
+                if request.planning_mode == "optimal":
+                    (
+                        recharge_stops,
+                        total_charging_time,
+                        outcome,
+                    ) = await worker_pool.run(
+                        itinerary_ctrl.plan_optimal_recharge_stops,
+                        corridor.route,
+                        stations_df,
+                        car,
+                        request.soc_start,
+                        request.soc_min,
+                        request.soc_max,
+                        cumulative_soc,
+                        soc_per_km,
+                    )
+                    CHARGING_PLANS.inc(result=outcome)
+                else:
+                    recharge_stops = await worker_pool.run(
+                        itinerary_ctrl.plan_recharge_stops,
+                        corridor.route,
+                        stations_df,
+                        request.soc_start,
+                        request.soc_min,
+                        request.soc_max,
+                        cumulative_soc,
+                    )
+                    total_charging_time = itinerary_ctrl.calculate_total_charging_time(
+                        recharge_stops, car, request.soc_min, request.soc_max
+                    )
+        except Exception as e:
+            raise NoAccessibleStationError(
+                "No accessible charging stations found before reaching minimum battery level."
+            ) from e
+        charging_stations_waypoints = [
+            (float(station["xlongitude"]), float(station["ylatitude"]))
+            for station in recharge_stops
+        ]
+        if progress is not None:
+            for waypoint in charging_stations_waypoints:
+                progress("stop", list(waypoint))
+
+        with span("reroute", stops=len(charging_stations_waypoints)):
+            final_itinerary = await itinerary_ctrl.get_route_through_stops(
+                initial_itinerary,
+                corridor.route,
+                recharge_stops,
+                request.departure,
+                request.arrival,
+            )
+        return ItineraryResponse(
+            itinerary=final_itinerary,
+            recharge_stops=charging_stations_waypoints,
+            total_charging_time_minutes=total_charging_time,
+        )
+
+
+itinerary_planner = ItineraryPlanner(
+    cache_size=config.itinerary_cache_size,
+    ttl=config.itinerary_cache_ttl,
+    soc_step=config.itinerary_cache_soc_step,
+    temperature_step=config.itinerary_cache_temperature_step,
+    precision=config.route_cache_precision,
+    batch_concurrency=config.itinerary_batch_concurrency,
+    corridor_cache_size=config.itinerary_corridor_cache_size,
+)
+on_station_index_refresh(itinerary_planner.invalidate)
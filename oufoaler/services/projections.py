@@ -0,0 +1,84 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pyproj
+import shapely
+from shapely.geometry.base import BaseGeometry
+
+from oufoaler.config import config
+from oufoaler.services.metrics import Counter
+
+TRANSFORMER_CACHE_REQUESTS = Counter(
+    "oufoaler_transformer_cache_requests_total",
+    "Lookups in the pyproj transformer registry of the serving process, by result"
+    " (worker pool processes keep their own registry)",
+    ("result",),
+)
+
+
+def utm_crs(lon: float, lat: float) -> str:
+    """WGS84 UTM zone CRS containing the given point."""
+    zone = int((lon + 180) / 6) + 1
+    return f"epsg:{32600 + zone if lat >= 0 else 32700 + zone}"
+
+
+class TransformerRegistry:
+    """Process-wide, thread-safe LRU of pyproj transformers keyed by (src, dst)."""
+
+    def __init__(self, maxsize: int = 64) -> None:
+        self.maxsize = maxsize
+        self._transformers: OrderedDict[tuple[str, str], pyproj.Transformer] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def get(self, src_crs: str, dst_crs: str) -> pyproj.Transformer:
+        key = (src_crs.lower(), dst_crs.lower())
+        with self._lock:
+            transformer = self._transformers.get(key)
+            if transformer is not None:
+                self._transformers.move_to_end(key)
+                TRANSFORMER_CACHE_REQUESTS.inc(result="hit")
+                return transformer
+
+        # Build outside the lock, this is the slow part (proj.db lookups)
+        transformer = pyproj.Transformer.from_crs(*key, always_xy=True)
+        with self._lock:
+            TRANSFORMER_CACHE_REQUESTS.inc(result="miss")
+            self._transformers[key] = transformer
+            self._transformers.move_to_end(key)
+            while len(self._transformers) > self.maxsize:
+                self._transformers.popitem(last=False)
+        return transformer
+
+    def warm(self, utm_zones: list[int]) -> None:
+        """Pre-build the web mercator and the given northern UTM zone transformers."""
+        self.get("epsg:4326", "epsg:3857")
+        self.get("epsg:3857", "epsg:4326")
+        for zone in utm_zones:
+            self.get("epsg:4326", f"epsg:{32600 + zone}")
+
+    @property
+    def hit_rate(self) -> float:
+        """Hit rate of the lookups made in this process."""
+        hits = TRANSFORMER_CACHE_REQUESTS.value(result="hit")
+        total = hits + TRANSFORMER_CACHE_REQUESTS.value(result="miss")
+        return hits / total if total else 0.0
+
+
+transformers = TransformerRegistry(maxsize=config.transformer_cache_size)
+
+
+def transform_coords(transformer: pyproj.Transformer, coords: np.ndarray) -> np.ndarray:
+    """Transform an (N, 2) array of x/y coordinates in one call."""
+    x, y = transformer.transform(coords[:, 0], coords[:, 1])
+    return np.column_stack((x, y))
+
+
+def project(
+    geom: BaseGeometry, src_crs: str = "epsg:4326", dst_crs: str = "epsg:3857"
+) -> BaseGeometry:
+    """Reproject a geometry through its whole coordinate array at once."""
+    transformer = transformers.get(src_crs, dst_crs)
+    return shapely.transform(geom, lambda coords: transform_coords(transformer, coords))
@@ -0,0 +1,304 @@
+"""Reachable areas from an origin, with and without one charging stop.
+
+Ranges come from the consumption model of itinerary planning, at its
+reference speed and on the flat as no route is known yet. The area
+reachable on the charge left is an ORS distance isochrone, or a local
+estimate past the ORS range limit. The area reachable with one stop adds
+the isochrones of the range after a full charge around a few fast
+charging hubs within the first area, the furthest one of each grid cell.
+
+Areas are memoized per origin tile, car range class, station power class
+and SoC bucket, all rounded down. They are computed from the centre of the
+origin tile, with the range on the charge left shortened by the longest
+way from the tile to its centre, so that they stay reachable for every
+request sharing them.
+"""
+
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely import Point, unary_union
+from shapely.geometry import mapping
+from shapely.geometry.base import BaseGeometry
+
+from oufoaler.config import config
+from oufoaler.controllers.car_controller import CarController
+from oufoaler.controllers.charging_station_controller import (
+    ChargingStationsController,
+)
+from oufoaler.controllers.itinerary_controller import (
+    HIGH_POWER_THRESHOLD_KW,
+    ItineraryController,
+)
+from oufoaler.models.api import Coordinates, ReachabilityRequest, ReachabilityResponse
+from oufoaler.models.car import Car
+from oufoaler.models.route import WGS84_GEOD
+from oufoaler.services import projections
+from oufoaler.services.consumption import ConsumptionModel
+from oufoaler.services.http_client import get_http_client
+from oufoaler.services.metrics import Counter
+from oufoaler.services.station_index import on_station_index_refresh
+from oufoaler.services.station_tile_cache import Tile, station_tile_cache, tile_indices
+from oufoaler.services.tracing import span
+from oufoaler.services.worker_pool import worker_pool
+
+ROAD_DETOUR_FACTOR = 1.25  # road distance over straight-line distance
+HUB_CELL_FRACTION = 0.25  # hub grid cells, in ranges after charging
+MAX_HUBS = 64
+AREA_TOLERANCE_DEG = 0.005  # simplification of the returned areas, ~500 m
+AREA_PRECISION_DEG = 0.0001
+
+REACHABILITY_CACHE_REQUESTS = Counter(
+    "oufoaler_reachability_cache_requests_total",
+    "Reachable area cache lookups, by result",
+    ("result",),
+)
+ISOCHRONES = Counter(
+    "oufoaler_isochrones_total",
+    "Isochrones computed, by source",
+    ("source",),
+)
+
+
+class ReachabilityKey(NamedTuple):
+    tile: Tile
+    range_class_km: float
+    power_class: float
+    soc_start: float
+    soc_min: float
+    soc_max: float
+
+
+def range_circles(
+    locations: list[tuple[float, float]], range_km: float
+) -> list[BaseGeometry]:
+    """Local stand-in for isochrones: the disc around each [lon, lat]
+    location whose radius is `range_km` of road, in a straight line."""
+    radius_m = range_km * 1000.0 / ROAD_DETOUR_FACTOR
+    circles = []
+    for lon, lat in locations:
+        crs = projections.utm_crs(lon, lat)
+        center = projections.project(Point(lon, lat), "epsg:4326", crs)
+        circles.append(projections.project(center.buffer(radius_m), crs, "epsg:4326"))
+    return circles
+
+
+def snapping_error_km(tile: Tile) -> float:
+    """Road distance, at most, from a point of `tile` to its centre."""
+    west, south, east, north = tile.bounds
+    center_lon, center_lat = (west + east) / 2, (south + north) / 2
+    _, _, distances_m = WGS84_GEOD.inv(
+        [center_lon] * 4,
+        [center_lat] * 4,
+        [west, east, west, east],
+        [south, south, north, north],
+    )
+    return max(distances_m) / 1000.0 * ROAD_DETOUR_FACTOR
+
+
+def select_hubs(
+    stations: list[dict], origin: tuple[float, float], cell_km: float
+) -> list[tuple[float, float]]:
+    """[lon, lat] of the charging stations furthest from `origin` in each
+    `cell_km` grid cell, fast chargers only when there are any, furthest
+    first and at most MAX_HUBS."""
+    if not stations or cell_km <= 0:
+        return []
+
+    def column(name: str) -> np.ndarray:
+        values = pd.Series([station.get(name) for station in stations], dtype=object)
+        return np.asarray(pd.to_numeric(values, errors="coerce"), dtype=np.float64)
+
+    lon, lat = column("xlongitude"), column("ylatitude")
+    power = column("puiss_max")
+    usable = np.isfinite(lon) & np.isfinite(lat)
+    fast = usable & (power >= HIGH_POWER_THRESHOLD_KW)
+    if fast.any():
+        usable = fast
+    lon, lat = lon[usable], lat[usable]
+    if len(lon) == 0:
+        return []
+
+    to_utm = projections.transformers.get("epsg:4326", projections.utm_crs(*origin))
+    x, y = to_utm.transform(lon, lat)
+    origin_x, origin_y = to_utm.transform(*origin)
+    distance = np.hypot(x - origin_x, y - origin_y)
+    cell_m = cell_km * 1000.0
+    cells = np.column_stack((np.floor(x / cell_m), np.floor(y / cell_m)))
+
+    furthest_first = np.argsort(-distance, kind="stable")
+    _, first = np.unique(cells[furthest_first], axis=0, return_index=True)
+    hubs = np.sort(first)[:MAX_HUBS]
+    return [(float(lon[i]), float(lat[i])) for i in furthest_first[hubs]]
+
+
+def merge_areas(areas: list[BaseGeometry]) -> dict:
+    """GeoJSON geometry of the union of WGS84 areas, simplified."""
+    if not areas:
+        return mapping(shapely.Polygon())
+    merged = unary_union(areas).simplify(AREA_TOLERANCE_DEG)
+    return mapping(shapely.set_precision(merged, AREA_PRECISION_DEG))
+
+
+class ReachabilityService:
+    """Computes reachable areas, memoizing results and coalescing identical
+    requests."""
+
+    def __init__(
+        self,
+        cache_size: int,
+        ttl: float,
+        tile_zoom: int,
+        range_step_km: float,
+        soc_step: float,
+    ) -> None:
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.tile_zoom = tile_zoom
+        self.range_step_km = range_step_km
+        self.soc_step = soc_step
+        self._cache: OrderedDict[
+            ReachabilityKey, tuple[float, ReachabilityResponse]
+        ] = OrderedDict()
+        self._in_flight: dict[ReachabilityKey, asyncio.Task] = {}
+        self._generation = 0
+
+        self.itinerary_ctrl = ItineraryController()
+        self.car_ctrl = CarController()
+        self.charging_stations_ctrl = ChargingStationsController()
+        self.consumption_model = ConsumptionModel()
+
+    def cache_key(self, request: ReachabilityRequest, car: Car) -> ReachabilityKey:
+        """Snap a request onto its cache bucket: the range class and SoC are
+        rounded conservatively, like itinerary requests. The temperature
+        only changes the range, so the range class covers it."""
+        temperature_c = (
+            config.consumption_temperature_c
+            if request.temperature_c is None
+            else request.temperature_c
+        )
+        soc_per_km = self.consumption_model.soc_per_km(car, temperature_c)
+        average_range_km = 100.0 / soc_per_km if soc_per_km > 0 else 0.0
+
+        def snap(value: float, step: float, rounding) -> float:
+            if step <= 0:
+                return value
+            return rounding(value / step) * step
+
+        x, y = tile_indices(request.origin.lon, request.origin.lat, self.tile_zoom)
+        return ReachabilityKey(
+            tile=Tile(self.tile_zoom, int(x), int(y)),
+            range_class_km=snap(average_range_km, self.range_step_km, math.floor),
+            power_class=station_tile_cache.power_class(car.power),
+            soc_start=snap(request.soc_start, self.soc_step, math.floor),
+            soc_min=snap(request.soc_min, self.soc_step, math.ceil),
+            soc_max=snap(request.soc_max, self.soc_step, math.floor),
+        )
+
+    def invalidate(self) -> None:
+        """Drop every memoized area, e.g. when the station dataset changes."""
+        self._generation += 1
+        self._cache.clear()
+        self._in_flight.clear()
+
+    async def reachable(self, request: ReachabilityRequest) -> ReachabilityResponse:
+        car = await self.car_ctrl.get_car_by_id(request.car_id)
+        key = self.cache_key(request, car)
+
+        cached = self._cache.get(key)
+        if cached is not None and time.time() - cached[0] < self.ttl:
+            self._cache.move_to_end(key)
+            REACHABILITY_CACHE_REQUESTS.inc(result="hit")
+            return cached[1]
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            REACHABILITY_CACHE_REQUESTS.inc(result="coalesced")
+        else:
+            REACHABILITY_CACHE_REQUESTS.inc(result="miss")
+            task = asyncio.create_task(self._compute_and_store(key, car))
+            self._in_flight[key] = task
+        # Shielded so that one client going away does not cancel the others
+        return await asyncio.shield(task)
+
+    async def _compute_and_store(
+        self, key: ReachabilityKey, car: Car
+    ) -> ReachabilityResponse:
+        generation = self._generation
+        try:
+            with span("reachability", car_id=car.id):
+                response = await self.compute(key, car)
+            # Areas computed against a since-invalidated dataset are not kept
+            if generation == self._generation:
+                self._cache[key] = (time.time(), response)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            return response
+        finally:
+            if self._in_flight.get(key) is asyncio.current_task():
+                del self._in_flight[key]
+
+    async def isochrones(
+        self, locations: list[tuple[float, float]], range_km: float
+    ) -> list[BaseGeometry]:
+        if not locations or range_km <= 0:
+            return []
+        with span("isochrones", locations=len(locations)):
+            if (
+                config.isochrone_source == "ors"
+                and range_km <= config.ors_isochrone_max_range_km
+            ):
+                ISOCHRONES.inc(len(locations), source="ors")
+                return await self.itinerary_ctrl.get_isochrones(locations, range_km)
+            ISOCHRONES.inc(len(locations), source="local")
+            return await worker_pool.run(range_circles, locations, range_km)
+
+    async def compute(self, key: ReachabilityKey, car: Car) -> ReachabilityResponse:
+        west, south, east, north = key.tile.bounds
+        origin = ((west + east) / 2, (south + north) / 2)
+        range_km = max(key.soc_start - key.soc_min, 0.0) / 100.0 * key.range_class_km
+        # From the tile centre, for an origin anywhere in the tile
+        range_km = max(range_km - snapping_error_km(key.tile), 0.0)
+        charged_km = max(key.soc_max - key.soc_min, 0.0) / 100.0 * key.range_class_km
+
+        areas = await self.isochrones([origin], range_km)
+        hubs: list[tuple[float, float]] = []
+        if areas and charged_km > 0:
+            with span("stations") as stations_span:
+                # Stations of the whole power class, as it shares the result
+                ctrl = self.charging_stations_ctrl
+                stations = await ctrl.find_charging_stations_in_area(
+                    unary_union(areas),
+                    car._replace(power=key.power_class),
+                    get_http_client(),
+                )
+                stations_span.set_attribute("stations", len(stations))
+            hubs = await worker_pool.run(
+                select_hubs, stations, origin, charged_km * HUB_CELL_FRACTION
+            )
+        hub_areas = await self.isochrones(hubs, charged_km)
+
+        return ReachabilityResponse(
+            origin=Coordinates(lon=origin[0], lat=origin[1]),
+            range_km=round(range_km, 1),
+            range_after_charge_km=round(charged_km, 1),
+            reachable=await worker_pool.run(merge_areas, areas),
+            reachable_with_stop=await worker_pool.run(merge_areas, areas + hub_areas),
+            charging_stations=hubs,
+        )
+
+
+reachability_service = ReachabilityService(
+    cache_size=config.reachability_cache_size,
+    ttl=config.reachability_cache_ttl,
+    tile_zoom=config.reachability_tile_zoom,
+    range_step_km=config.reachability_range_step_km,
+    soc_step=config.reachability_soc_step,
+)
+on_station_index_refresh(reachability_service.invalidate)
@@ -0,0 +1,257 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from oufoaler.config import config
+from oufoaler.services.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+COORDINATE_SCALE = 1e6  # ORS geometries carry at most 6 decimals
+
+ROUTE_CACHE_REQUESTS = Counter(
+    "oufoaler_route_cache_requests_total",
+    "Route cache lookups, by tier and result",
+    ("tier", "result"),
+)
+
+
+class CachedRoute(NamedTuple):
+    """ORS GeoJSON route, stored as int32 coordinates and compressed properties."""
+
+    created_at: float
+    coordinates: bytes
+    properties: bytes
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.coordinates) + len(self.properties)
+
+    @classmethod
+    def from_geojson(cls, route: dict) -> Optional["CachedRoute"]:
+        features = route.get("features", [])
+        if len(features) != 1 or features[0]["geometry"]["type"] != "LineString":
+            return None
+        geometry = features[0]["geometry"]
+        coordinates = np.rint(
+            np.asarray(geometry["coordinates"], dtype=np.float64) * COORDINATE_SCALE
+        ).astype(np.int32)
+        rest = {
+            **route,
+            "features": [{**features[0], "geometry": {"type": "LineString"}}],
+        }
+        return cls(
+            time.time(),
+            coordinates.tobytes(),
+            zlib.compress(json.dumps(rest).encode("utf-8")),
+        )
+
+    def to_geojson(self) -> dict:
+        route = json.loads(zlib.decompress(self.properties))
+        coordinates = np.frombuffer(self.coordinates, dtype=np.int32).reshape(-1, 2)
+        route["features"][0]["geometry"]["coordinates"] = (
+            coordinates / COORDINATE_SCALE
+        ).tolist()
+        return route
+
+
+class RouteCache:
+    """Two-tier (memory LRU, then SQLite on disk) cache of ORS directions.
+
+    The SQLite database is opened on first use; if it cannot be opened or
+    written, the cache carries on in memory only.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str],
+        ttl: float,
+        precision: int,
+        max_memory_bytes: int,
+        max_disk_bytes: int,
+    ) -> None:
+        self.ttl = ttl
+        self.precision = precision
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: OrderedDict[str, CachedRoute] = OrderedDict()
+        self.memory_bytes = 0
+        self._lock = threading.Lock()
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+
+    @property
+    def disk_enabled(self) -> bool:
+        return bool(self.path)
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """The SQLite database, opened on first use. Call with the lock held."""
+        if self._db is None and self.path:
+            try:
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+                db = sqlite3.connect(self.path, check_same_thread=False)
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS routes ("
+                    "key TEXT PRIMARY KEY, created_at REAL, accessed_at REAL, "
+                    "size INTEGER, coordinates BLOB, properties BLOB)"
+                )
+                db.commit()
+                self._db = db
+            except (OSError, sqlite3.Error) as e:
+                self._disable(e)
+        return self._db
+
+    def _disable(self, error: Exception) -> None:
+        """Fall back to memory only. Call with the lock held."""
+        logger.warning(
+            f"Route cache database {self.path} unavailable, caching in memory only: "
+            f"{error}"
+        )
+        self.path = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def make_key(self, profile: str, coordinates: list, options: dict) -> str:
+        """Quantize coordinates so that nearby requests share an entry. The
+        other request options are part of the key, as they change the route
+        returned."""
+        quantized = ";".join(
+            f"{lon:.{self.precision}f},{lat:.{self.precision}f}"
+            for lon, lat in coordinates
+        )
+        encoded_options = json.dumps(options, sort_keys=True, separators=(",", ":"))
+        return f"{profile}|{encoded_options}|{quantized}"
+
+    @property
+    def disk_bytes(self) -> int:
+        with self._lock:
+            # Reported once the database is in use, without opening it
+            if self._db is None:
+                return 0
+            try:
+                return self._db.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM routes"
+                ).fetchone()[0]
+            except sqlite3.Error as e:
+                self._disable(e)
+                return 0
+
+    def _is_fresh(self, entry: CachedRoute) -> bool:
+        return time.time() - entry.created_at < self.ttl
+
+    def _remember(self, key: str, entry: CachedRoute) -> None:
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self.memory_bytes -= previous.nbytes
+            self._memory[key] = entry
+            self.memory_bytes += entry.nbytes
+            while self.memory_bytes > self.max_memory_bytes and self._memory:
+                _, evicted = self._memory.popitem(last=False)
+                self.memory_bytes -= evicted.nbytes
+
+    def _get_from_disk(self, key: str) -> Optional[CachedRoute]:
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return None
+            try:
+                row = db.execute(
+                    "SELECT created_at, coordinates, properties FROM routes "
+                    "WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                if row is None:
+                    return None
+                db.execute(
+                    "UPDATE routes SET accessed_at = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+                db.commit()
+            except sqlite3.Error as e:
+                self._disable(e)
+                return None
+        return CachedRoute(*row)
+
+    def _set_on_disk(self, key: str, entry: CachedRoute) -> None:
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO routes VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, entry.created_at, time.time(), entry.nbytes, *entry[1:]),
+                )
+                # Evict expired entries, then least recently used ones above
+                # the limit
+                db.execute(
+                    "DELETE FROM routes WHERE created_at < ?",
+                    (time.time() - self.ttl,),
+                )
+                db.execute(
+                    "DELETE FROM routes WHERE key IN ("
+                    "  SELECT key FROM ("
+                    "    SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC) AS total"
+                    "    FROM routes"
+                    "  ) WHERE total > ?"
+                    ")",
+                    (self.max_disk_bytes,),
+                )
+                db.commit()
+            except sqlite3.Error as e:
+                self._disable(e)
+
+    async def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+        if entry is not None and self._is_fresh(entry):
+            ROUTE_CACHE_REQUESTS.inc(tier="memory", result="hit")
+            return entry.to_geojson()
+        ROUTE_CACHE_REQUESTS.inc(tier="memory", result="miss")
+
+        if self.disk_enabled:
+            entry = await asyncio.to_thread(self._get_from_disk, key)
+            if entry is not None and self._is_fresh(entry):
+                ROUTE_CACHE_REQUESTS.inc(tier="disk", result="hit")
+                self._remember(key, entry)
+                return entry.to_geojson()
+            ROUTE_CACHE_REQUESTS.inc(tier="disk", result="miss")
+        return None
+
+    async def set(self, key: str, route: dict) -> None:
+        entry = CachedRoute.from_geojson(route)
+        if entry is None:
+            return
+        self._remember(key, entry)
+        if self.disk_enabled:
+            await asyncio.to_thread(self._set_on_disk, key, entry)
+
+
+route_cache = RouteCache(
+    config.route_cache_path,
+    ttl=config.route_cache_ttl,
+    precision=config.route_cache_precision,
+    max_memory_bytes=config.route_cache_memory_bytes,
+    max_disk_bytes=config.route_cache_disk_bytes,
+)
+
+ROUTE_CACHE_BYTES = Gauge(
+    "oufoaler_route_cache_bytes",
+    "Size of the cached route payloads, by tier",
+    ("tier",),
+)
+ROUTE_CACHE_BYTES.set_function(lambda: route_cache.memory_bytes, tier="memory")
+ROUTE_CACHE_BYTES.set_function(lambda: route_cache.disk_bytes, tier="disk")
@@ -0,0 +1,180 @@
+"""Splicing of charging detours into an ORS GeoJSON itinerary.
+
+Instead of routing the whole trip again through its charging stops, each
+stop gets a detour leg from the nearest vertex of the direct route to the
+station and back, spliced into the direct route at that vertex. The
+result has the shape of a directions response through the stops: one
+segment per leg of the trip, `way_points` at the departure, stations and
+arrival, and steps, distances and durations adjusted to match.
+"""
+
+from typing import Optional
+
+import numpy as np
+
+from oufoaler.models.route import Route, segment_distances
+
+
+def stop_vertices(route: Route, distances_along_km) -> np.ndarray:
+    """Index of the route vertex nearest to each position along the route,
+    in km as given by Route.locate."""
+    offsets = route.projected_offsets()
+    distances_m = np.asarray(distances_along_km, dtype=np.float64) * 1000.0
+    after = np.clip(np.searchsorted(offsets, distances_m), 1, len(offsets) - 1)
+    before = after - 1
+    nearer_before = distances_m - offsets[before] <= offsets[after] - distances_m
+    return np.where(nearer_before, before, after)
+
+
+def vertex_progress(
+    coordinates: np.ndarray, steps: list[dict]
+) -> tuple[np.ndarray, np.ndarray]:
+    """Distance (m) and duration (s) from the start to each vertex, each
+    step's totals spread over its vertices in proportion to their spacing."""
+    lengths = np.concatenate(([0.0], segment_distances(coordinates, "spherical")))
+    distances = np.zeros(len(coordinates))
+    durations = np.zeros(len(coordinates))
+    for step in steps:
+        first, last = step["way_points"]
+        if last <= first:
+            continue
+        spacing = np.cumsum(lengths[first + 1 : last + 1])
+        share = (
+            spacing / spacing[-1]
+            if spacing[-1] > 0
+            else np.linspace(1.0 / (last - first), 1.0, last - first)
+        )
+        distances[first + 1 : last + 1] = distances[first] + step["distance"] * share
+        durations[first + 1 : last + 1] = durations[first] + step["duration"] * share
+    return distances, durations
+
+
+class _Splice:
+    """Itinerary being assembled piece by piece, each piece starting at the
+    last point of the previous one."""
+
+    def __init__(self, start: list) -> None:
+        self.coordinates = [start]
+        self.segments: list[dict] = []
+        self.way_points = [0]
+        self.steps: list[dict] = []
+        self.distance = 0.0
+        self.duration = 0.0
+
+    def append(self, points: list, steps: list[dict], origin: int = 0) -> None:
+        """Add `points` and their steps, whose way points index the line
+        `points` were cut from at `origin`."""
+        offset = len(self.coordinates) - 1 - origin
+        self.coordinates.extend(points[1:])
+        for step in steps:
+            first, last = step["way_points"]
+            self.steps.append({**step, "way_points": [first + offset, last + offset]})
+            self.distance += step["distance"]
+            self.duration += step["duration"]
+
+    def end_segment(self) -> None:
+        self.segments.append(
+            {
+                "distance": round(self.distance, 1),
+                "duration": round(self.duration, 1),
+                "steps": self.steps,
+            }
+        )
+        self.way_points.append(len(self.coordinates) - 1)
+        self.steps = []
+        self.distance = self.duration = 0.0
+
+
+def route_steps(
+    steps: list[dict], distances: np.ndarray, durations: np.ndarray, lo: int, hi: int
+) -> list[dict]:
+    """The steps of the direct route between vertices `lo` and `hi`, cut at
+    both ends."""
+    clipped = []
+    for step in steps:
+        first, last = max(step["way_points"][0], lo), min(step["way_points"][1], hi)
+        if last <= first:
+            continue
+        clipped.append(
+            {
+                **step,
+                "distance": round(float(distances[last] - distances[first]), 1),
+                "duration": round(float(durations[last] - durations[first]), 1),
+                "way_points": [first, last],
+            }
+        )
+    return clipped
+
+
+def splice_detours(
+    itinerary: dict, vertices: list[int], legs: list[Optional[dict]]
+) -> dict:
+    """`itinerary` through the charging stops: each stop's detour leg, an
+    ORS itinerary vertex -> station -> vertex (None for a stop on the
+    route), spliced in at its route vertex. Vertices must be in route
+    order."""
+    feature = itinerary["features"][0]
+    properties = feature["properties"]
+    coordinates = np.asarray(feature["geometry"]["coordinates"], dtype=np.float64)
+    steps = [step for segment in properties["segments"] for step in segment["steps"]]
+    distances, durations = vertex_progress(coordinates, steps)
+    points = coordinates.tolist()
+
+    splice = _Splice(points[0])
+    lo = 0
+    for vertex, leg in zip(vertices, legs):
+        splice.append(
+            points[lo : vertex + 1],
+            route_steps(steps, distances, durations, lo, vertex),
+            origin=lo,
+        )
+        lo = vertex
+        if leg is None:
+            splice.end_segment()
+            continue
+        # The leg, its ends snapped to the route vertex
+        leg_feature = leg["features"][0]
+        leg_points = leg_feature["geometry"]["coordinates"]
+        leg_points = [points[vertex], *leg_points[1:-1], points[vertex]]
+        outward, back = leg_feature["properties"]["segments"]
+        station = leg_feature["properties"]["way_points"][1]
+        splice.append(leg_points[: station + 1], outward["steps"])
+        splice.end_segment()
+        splice.append(leg_points[station:], back["steps"], origin=station)
+    splice.append(
+        points[lo:],
+        route_steps(steps, distances, durations, lo, len(points) - 1),
+        origin=lo,
+    )
+    splice.end_segment()
+
+    array = np.asarray(splice.coordinates)
+    bbox = [*array.min(axis=0).tolist(), *array.max(axis=0).tolist()]
+    # Extra info is indexed on the direct route's vertices, so it is dropped
+    spliced_properties = {
+        key: value for key, value in properties.items() if key != "extras"
+    }
+    spliced_properties.update(
+        segments=splice.segments,
+        summary={
+            **properties.get("summary", {}),
+            "distance": round(sum(s["distance"] for s in splice.segments), 1),
+            "duration": round(sum(s["duration"] for s in splice.segments), 1),
+        },
+        way_points=splice.way_points,
+    )
+    return {
+        **itinerary,
+        "bbox": bbox,
+        "features": [
+            {
+                **feature,
+                "bbox": bbox,
+                "properties": spliced_properties,
+                "geometry": {
+                    **feature["geometry"],
+                    "coordinates": splice.coordinates,
+                },
+            }
+        ],
+    }
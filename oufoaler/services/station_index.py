@@ -0,0 +1,395 @@
+import argparse
+import csv
+import hashlib
+import io
+import json
+import logging
+import mmap
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+
+import numpy as np
+import requests
+import shapely
+from shapely import STRtree
+from shapely.geometry.base import BaseGeometry
+
+from oufoaler.config import config
+
+logger = logging.getLogger(__name__)
+
+IRVE_EXPORT_URL = "https://odre.opendatasoft.com/api/explore/v2.1/catalog/datasets/bornes-irve/exports/{format}"
+
+MANIFEST_FILE = "manifest.json"
+RECORDS_FILE = "records.jsonl"
+OFFSETS_FILE = "offsets.npy"
+COORDS_FILE = "coords.npy"
+POWER_FILE = "power.npy"
+T2_FILE = "t2.npy"
+KEYS_FILE = "keys.json"
+HASHES_FILE = "hashes.npy"
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def _row_key(row: dict) -> Optional[str]:
+    return row.get("id_pdc_itinerance") or row.get("id_pdc") or row.get("id_station")
+
+
+def _row_coordinates(row: dict) -> tuple[float, float]:
+    lon = _to_float(row.get("xlongitude"))
+    lat = _to_float(row.get("ylatitude"))
+    if np.isnan(lon) or np.isnan(lat):
+        geo_point = row.get("geo_point_borne")
+        if isinstance(geo_point, dict):
+            lon = _to_float(geo_point.get("lon"))
+            lat = _to_float(geo_point.get("lat"))
+        elif isinstance(geo_point, str) and "," in geo_point:
+            lat_str, lon_str = geo_point.split(",", 1)
+            lon, lat = _to_float(lon_str), _to_float(lat_str)
+    return lon, lat
+
+
+def _row_hash(line: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(line, digest_size=8).digest(), "little")
+
+
+def _encode_row(row: dict) -> bytes:
+    return json.dumps(row, sort_keys=True, ensure_ascii=False).encode("utf-8")
+
+
+def read_irve_rows(source: str) -> Iterator[dict]:
+    """Read IRVE rows from a CSV/JSON export, given as a local path or an URL."""
+    if source.startswith(("http://", "https://")):
+        response = requests.get(source, timeout=600)
+        response.raise_for_status()
+        content = response.content
+    else:
+        content = Path(source).read_bytes()
+
+    text = content.decode("utf-8-sig")
+    if text.lstrip().startswith(("[", "{")):
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = data.get("results", [])
+        yield from data
+    else:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=";,")
+        yield from csv.DictReader(io.StringIO(text), dialect=dialect)
+
+
+def _arrays_path(path: Path, version: int) -> Path:
+    return path / f"v{version}"
+
+
+def _write_arrays(
+    arrays_path: Path,
+    keys: list[str],
+    hashes: list[int],
+    offsets: np.ndarray,
+    coords: list[tuple[float, float]],
+    power: list[float],
+    t2: list[bool],
+) -> None:
+    arrays_path.mkdir(parents=True)
+    np.save(arrays_path / OFFSETS_FILE, offsets)
+    np.save(
+        arrays_path / COORDS_FILE, np.array(coords, dtype=np.float64).reshape(-1, 2)
+    )
+    np.save(arrays_path / POWER_FILE, np.array(power, dtype=np.float64))
+    np.save(arrays_path / T2_FILE, np.array(t2, dtype=bool))
+    np.save(arrays_path / HASHES_FILE, np.array(hashes, dtype=np.uint64))
+    (arrays_path / KEYS_FILE).write_text(json.dumps(keys))
+
+
+def _write_manifest(path: Path, manifest: dict) -> None:
+    tmp_file = path / (MANIFEST_FILE + ".tmp")
+    tmp_file.write_text(json.dumps(manifest))
+    os.replace(tmp_file, path / MANIFEST_FILE)
+
+
+class StationIndex:
+    """On-disk, memory-mapped index of the IRVE charging-station dataset.
+
+    Records are stored as JSON lines in an append-only file; the per-station
+    arrays of each version (spans into that file, coordinates, power, ...)
+    live in their own `v<version>` directory, named by the manifest.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        manifest = json.loads((self.path / MANIFEST_FILE).read_text())
+        self.version: int = manifest["version"]
+        self.updated_at: float = manifest["updated_at"]
+
+        arrays_path = _arrays_path(self.path, self.version)
+        self.coords = np.load(arrays_path / COORDS_FILE, mmap_mode="r")
+        self.power = np.load(arrays_path / POWER_FILE, mmap_mode="r")
+        self.t2 = np.load(arrays_path / T2_FILE, mmap_mode="r")
+        self.offsets = np.load(arrays_path / OFFSETS_FILE, mmap_mode="r")
+
+        self._records_file = open(self.path / RECORDS_FILE, "rb")
+        self._records = (
+            mmap.mmap(self._records_file.fileno(), 0, access=mmap.ACCESS_READ)
+            if manifest["records_size"]
+            else b""
+        )
+
+        points = np.asarray(shapely.points(np.asarray(self.coords)))
+        self.tree = STRtree(points)
+
+    def __len__(self) -> int:
+        return len(self.power)
+
+    def close(self) -> None:
+        if isinstance(self._records, mmap.mmap):
+            self._records.close()
+        self._records_file.close()
+
+    def record(self, i: int) -> dict:
+        start, end = int(self.offsets[i, 0]), int(self.offsets[i, 1])
+        return json.loads(self._records[start:end])
+
+    def query_indices(self, area: BaseGeometry, max_power: float) -> np.ndarray:
+        """Indices of T2 stations within `area` (WGS84) with puiss_max <= max_power."""
+        candidates = self.tree.query(area, predicate="contains")
+        mask = self.t2[candidates] & (self.power[candidates] <= max_power)
+        return np.sort(candidates[mask])
+
+    def query(self, area: BaseGeometry, max_power: float) -> list[dict]:
+        return [self.record(i) for i in self.query_indices(area, max_power)]
+
+
+def build_station_index(
+    path: str | Path, rows: Iterable[dict], incremental: bool = True
+) -> dict:
+    """Write (or refresh) the station index at `path` from IRVE rows.
+
+    In incremental mode, rows are diffed by key and content hash against the
+    previous build: only added and changed rows are appended to the records
+    file, unchanged ones keep their stored bytes, and the per-station arrays
+    are written as a new version. The records file is rewritten as a whole
+    on a full import, or once replaced rows take up more than half of it.
+    """
+    path = Path(path)
+    previous: dict[str, tuple[int, int, int]] = {}
+    manifest: dict = {}
+
+    if (path / MANIFEST_FILE).exists():
+        manifest = json.loads((path / MANIFEST_FILE).read_text())
+    arrays_path = _arrays_path(path, manifest.get("version", 0))
+    if incremental and arrays_path.exists():
+        previous_keys = json.loads((arrays_path / KEYS_FILE).read_text())
+        previous_hashes = np.load(arrays_path / HASHES_FILE).tolist()
+        previous_offsets = np.load(arrays_path / OFFSETS_FILE).tolist()
+        previous = {
+            key: (row_hash, start, end)
+            for key, row_hash, (start, end) in zip(
+                previous_keys, previous_hashes, previous_offsets
+            )
+        }
+    version = manifest.get("version", 0) + 1
+    records_size = manifest.get("records_size", 0) if previous else 0
+
+    keys: list[str] = []
+    hashes: list[int] = []
+    spans: list[tuple[int, int]] = []
+    lines: list[bytes] = []  # every row, kept for a full rewrite
+    appended: list[bytes] = []
+    coords: list[tuple[float, float]] = []
+    power: list[float] = []
+    t2: list[bool] = []
+    stats = {"added": 0, "changed": 0, "unchanged": 0, "removed": 0, "skipped": 0}
+
+    seen = set()
+    end = records_size
+    for row in rows:
+        key = _row_key(row)
+        lon, lat = _row_coordinates(row)
+        if not key or key in seen or np.isnan(lon) or np.isnan(lat):
+            stats["skipped"] += 1
+            continue
+        seen.add(key)
+
+        line = _encode_row(row)
+        row_hash = _row_hash(line)
+        previous_row = previous.get(key)
+        if previous_row is not None and previous_row[0] == row_hash:
+            stats["unchanged"] += 1
+            spans.append(previous_row[1:])
+        else:
+            stats["added" if previous_row is None else "changed"] += 1
+            spans.append((end, end + len(line)))
+            end += len(line)
+            appended.append(line)
+
+        keys.append(key)
+        hashes.append(row_hash)
+        lines.append(line)
+        coords.append((lon, lat))
+        power.append(_to_float(row.get("puiss_max")))
+        t2.append("T2" in str(row.get("type_prise", "")).upper())
+
+    stats["removed"] = len(previous.keys() - seen)
+
+    if previous and not (stats["added"] or stats["changed"] or stats["removed"]):
+        logger.info("Station index is up to date, nothing to apply")
+        return stats
+
+    live_size = sum(len(line) for line in lines)
+    if previous and end - live_size <= live_size:
+        # Append the changed records after the ones in use, dropping any
+        # leftover of an interrupted refresh, then publish the new version
+        with open(path / RECORDS_FILE, "r+b") as f:
+            f.truncate(records_size)
+            f.seek(records_size)
+            f.writelines(appended)
+            f.flush()
+            os.fsync(f.fileno())
+        shutil.rmtree(_arrays_path(path, version), ignore_errors=True)
+        _write_arrays(
+            _arrays_path(path, version),
+            keys,
+            hashes,
+            np.array(spans, dtype=np.int64).reshape(-1, 2),
+            coords,
+            power,
+            t2,
+        )
+        _write_manifest(
+            path,
+            {
+                "version": version,
+                "updated_at": time.time(),
+                "records_size": end,
+                **stats,
+            },
+        )
+        # Readers may still be opening the previous version, keep it
+        for old_arrays_path in path.glob("v*"):
+            if old_arrays_path.name not in (f"v{version}", f"v{version - 1}"):
+                shutil.rmtree(old_arrays_path, ignore_errors=True)
+        return stats
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+
+    offsets = np.zeros((len(lines), 2), dtype=np.int64)
+    position = 0
+    with open(tmp_path / RECORDS_FILE, "wb") as f:
+        for i, line in enumerate(lines):
+            f.write(line)
+            offsets[i] = position, position + len(line)
+            position += len(line)
+
+    _write_arrays(
+        _arrays_path(tmp_path, version), keys, hashes, offsets, coords, power, t2
+    )
+    _write_manifest(
+        tmp_path,
+        {
+            "version": version,
+            "updated_at": time.time(),
+            "records_size": position,
+            **stats,
+        },
+    )
+
+    old_path = path.with_name(path.name + ".old")
+    shutil.rmtree(old_path, ignore_errors=True)
+    if path.exists():
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+    return stats
+
+
+_station_index: Optional[StationIndex] = None
+_station_index_mtime: Optional[float] = None
+_station_index_lock = threading.Lock()
+_refresh_listeners: list[Callable[[], None]] = []
+
+
+def on_station_index_refresh(listener: Callable[[], None]) -> None:
+    """Register a callback run whenever a new station index version is loaded."""
+    _refresh_listeners.append(listener)
+
+
+def get_station_index() -> Optional[StationIndex]:
+    """Return the configured local station index, or None if there is none.
+
+    The index is reloaded when its manifest changes on disk, i.e. after an
+    import or refresh ran. The previous index is not closed: queries still
+    running on it keep it alive, and it is unmapped once they dropped it.
+    """
+    global _station_index, _station_index_mtime
+    if not config.station_index_path:
+        return None
+
+    try:
+        mtime = (Path(config.station_index_path) / MANIFEST_FILE).stat().st_mtime
+    except FileNotFoundError:
+        mtime = None
+
+    with _station_index_lock:
+        if mtime is None:
+            if _station_index_mtime is None:
+                logger.warning(
+                    f"Station index not found at {config.station_index_path}, "
+                    "falling back to the bornes-irve API"
+                )
+                _station_index_mtime = -1.0
+            return _station_index
+
+        if mtime == _station_index_mtime:
+            return _station_index
+
+        station_index = StationIndex(config.station_index_path)
+        _station_index = station_index
+        _station_index_mtime = mtime
+        logger.info(
+            f"Loaded station index version {station_index.version}, "
+            f"{len(station_index)} stations"
+        )
+
+    for listener in _refresh_listeners:
+        listener()
+    return station_index
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Build or refresh the local IRVE charging-station index."
+    )
+    parser.add_argument("command", choices=["import", "refresh"])
+    parser.add_argument(
+        "--source",
+        default=IRVE_EXPORT_URL.format(format="json"),
+        help="Path or URL of a bornes-irve CSV/JSON export",
+    )
+    parser.add_argument("--path", default=config.station_index_path)
+    args = parser.parse_args(argv)
+
+    if not args.path:
+        parser.error("--path is required when OUFOALER_STATION_INDEX_PATH is unset")
+
+    logging.basicConfig(level=logging.INFO)
+    stats = build_station_index(
+        args.path, read_irve_rows(args.source), incremental=args.command == "refresh"
+    )
+    logger.info(f"Station index {args.command} done: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+import numpy as np
+import shapely
+from shapely import Polygon
+from shapely.geometry.base import BaseGeometry
+
+from oufoaler.config import config
+from oufoaler.services.metrics import Counter, Gauge
+
+MAX_TILE_ZOOM = 16
+
+STATION_TILE_CACHE_REQUESTS = Counter(
+    "oufoaler_station_tile_cache_requests_total",
+    "Station tile cache lookups, by result",
+    ("result",),
+)
+
+
+class Tile(NamedTuple):
+    """Slippy-map (web mercator) tile."""
+
+    zoom: int
+    x: int
+    y: int
+
+    @property
+    def bounds(self) -> tuple[float, float, float, float]:
+        """(west, south, east, north) in degrees"""
+        n = 2**self.zoom
+
+        def latitude(y: int) -> float:
+            return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+
+        return (
+            self.x / n * 360.0 - 180.0,
+            latitude(self.y + 1),
+            (self.x + 1) / n * 360.0 - 180.0,
+            latitude(self.y),
+        )
+
+    @property
+    def box(self) -> Polygon:
+        return shapely.box(*self.bounds)
+
+    def ancestor(self, zoom: int) -> "Tile":
+        """Tile of a lower (or the same) zoom level containing this one."""
+        shift = self.zoom - zoom
+        return Tile(zoom, self.x >> shift, self.y >> shift)
+
+    def children(self) -> list["Tile"]:
+        return [
+            Tile(self.zoom + 1, 2 * self.x + dx, 2 * self.y + dy)
+            for dy in (0, 1)
+            for dx in (0, 1)
+        ]
+
+
+def tile_indices(lon, lat, zoom: int) -> tuple[np.ndarray, np.ndarray]:
+    """Column and row of the zoom level tiles containing each point, -1 for
+    points without coordinates."""
+    n = 2**zoom
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -85.0511, 85.0511)
+    x = np.floor((np.asarray(lon, dtype=np.float64) + 180.0) / 360.0 * n)
+    y = np.floor((1.0 - np.arcsinh(np.tan(np.radians(lat))) / math.pi) / 2.0 * n)
+    valid = np.isfinite(x) & np.isfinite(y)
+    return (
+        np.where(valid, np.clip(x, 0, n - 1), -1).astype(np.int64),
+        np.where(valid, np.clip(y, 0, n - 1), -1).astype(np.int64),
+    )
+
+
+def tiles_covering(area: BaseGeometry, zoom: int) -> list[Tile]:
+    """Tiles of the zoom level intersecting `area`, column by column."""
+    minx, miny, maxx, maxy = area.bounds
+    (x0, x1), (y1, y0) = tile_indices([minx, maxx], [miny, maxy], zoom)
+    tiles = [
+        Tile(zoom, int(x), int(y)) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)
+    ]
+    boxes = shapely.box(*np.array([tile.bounds for tile in tiles]).T)
+    shapely.prepare(area)
+    return [tile for tile, hit in zip(tiles, shapely.intersects(area, boxes)) if hit]
+
+
+class CachedTile(NamedTuple):
+    created_at: float
+    stations: list[dict]
+
+
+class StationTileCache:
+    """In-memory LRU of the charging stations within each tile, with a TTL.
+
+    Entries are keyed by tile and by the power class of the query, the
+    smallest of `power_classes` at or above the car's power: cars of similar
+    power share entries, and are served the stations up to that class, to
+    be filtered down to their own power.
+    """
+
+    def __init__(
+        self, zoom: int, ttl: float, max_stations: int, power_classes: list[float]
+    ) -> None:
+        self.zoom = zoom
+        self.ttl = ttl
+        self.max_stations = max_stations
+        self.power_classes = sorted(power_classes)
+        self._tiles: OrderedDict[tuple, CachedTile] = OrderedDict()
+        self.station_count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_stations > 0 and self.ttl > 0
+
+    def power_class(self, power: float) -> float:
+        for power_class in self.power_classes:
+            if power <= power_class:
+                return power_class
+        return power
+
+    def tiles_covering(self, area: BaseGeometry) -> list[Tile]:
+        return tiles_covering(area, self.zoom)
+
+    def get(self, tile: Tile, power_class: float) -> Optional[list[dict]]:
+        key = (tile, power_class)
+        with self._lock:
+            entry = self._tiles.get(key)
+            if entry is not None and time.time() - entry.created_at >= self.ttl:
+                del self._tiles[key]
+                self.station_count -= len(entry.stations)
+                entry = None
+            if entry is not None:
+                self._tiles.move_to_end(key)
+        STATION_TILE_CACHE_REQUESTS.inc(result="miss" if entry is None else "hit")
+        return None if entry is None else entry.stations
+
+    def set(self, tile: Tile, power_class: float, stations: list[dict]) -> None:
+        key = (tile, power_class)
+        with self._lock:
+            previous = self._tiles.pop(key, None)
+            if previous is not None:
+                self.station_count -= len(previous.stations)
+            self._tiles[key] = CachedTile(time.time(), stations)
+            self.station_count += len(stations)
+            while self.station_count > self.max_stations and self._tiles:
+                _, evicted = self._tiles.popitem(last=False)
+                self.station_count -= len(evicted.stations)
+
+    def invalidate(self) -> None:
+        """Drop every cached tile, e.g. when the station dataset changes."""
+        with self._lock:
+            self._tiles.clear()
+            self.station_count = 0
+
+
+station_tile_cache = StationTileCache(
+    zoom=config.station_tile_zoom,
+    ttl=config.station_tile_cache_ttl,
+    max_stations=config.station_tile_cache_max_stations,
+    power_classes=config.station_tile_power_classes,
+)
+
+STATION_TILE_CACHE_STATIONS = Gauge(
+    "oufoaler_station_tile_cache_stations",
+    "Charging stations held in the station tile cache",
+    function=lambda: station_tile_cache.station_count,
+)
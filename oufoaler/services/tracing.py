@@ -0,0 +1,101 @@
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional
+
+from oufoaler.config import config
+from oufoaler.services.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+STAGE_SECONDS = Histogram(
+    "oufoaler_stage_duration_seconds",
+    "Time spent in each stage of itinerary planning",
+    ("stage",),
+)
+
+
+class Span:
+    """Timed stage of a request, in the manner of an OpenTelemetry span.
+
+    Spans opened while another is current become its children, and share
+    its trace id; asyncio tasks inherit the span current when created.
+    """
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "attributes",
+        "start_time",
+        "duration",
+        "_start",
+    )
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: dict) -> None:
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = attributes
+        self.start_time = time.time()
+        self.duration = 0.0
+        self._start = time.perf_counter()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def add(self, key: str, amount: float = 1) -> None:
+        """Add to a counting attribute, e.g. pages fetched during the span."""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def end(self) -> None:
+        self.duration = time.perf_counter() - self._start
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration * 1000.0, 3),
+            "attributes": self.attributes,
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """Time a stage into the stage histogram, logging it as a JSON span when
+    tracing is enabled."""
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set_attribute("error", type(e).__name__)
+        raise
+    finally:
+        current.end()
+        _current_span.reset(token)
+        STAGE_SECONDS.observe(current.duration, stage=name)
+        if config.tracing_enabled:
+            logger.info(json.dumps(current.to_dict(), default=str))
+
+
+def add_to_span(key: str, amount: float = 1) -> None:
+    """Add to a counting attribute of the current span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.add(key, amount)
@@ -0,0 +1,148 @@
+"""Compact itinerary format for map clients.
+
+The ORS GeoJSON itinerary carries every step and thousands of [lon, lat]
+float pairs. The compact form keeps the summary, the segment distances
+and durations and the way points, and encodes the geometry as a Google
+encoded polyline (zigzag delta integers in printable ASCII), optionally
+simplified with Douglas-Peucker down to what is visible at a zoom level.
+"""
+
+from typing import Optional
+
+import numpy as np
+
+POLYLINE_PRECISION = 5  # decimal places, ~1 m
+EARTH_RADIUS_M = 6378137.0
+TILE_SIZE_PX = 256
+SIMPLIFY_TOLERANCE_PX = 0.5  # at the requested zoom level
+
+
+def web_mercator(coordinates: np.ndarray) -> np.ndarray:
+    """[lon, lat] coordinates in EPSG:3857 metres."""
+    lon, lat = np.radians(coordinates[:, 0]), np.radians(coordinates[:, 1])
+    return np.column_stack(
+        (EARTH_RADIUS_M * lon, EARTH_RADIUS_M * np.log(np.tan(np.pi / 4 + lat / 2)))
+    )
+
+
+def zoom_tolerance(zoom: int) -> float:
+    """Simplification tolerance in EPSG:3857 metres at a slippy-map zoom."""
+    metres_per_px = 2 * np.pi * EARTH_RADIUS_M / (TILE_SIZE_PX * 2**zoom)
+    return SIMPLIFY_TOLERANCE_PX * metres_per_px
+
+
+def radial_thinning(
+    points: np.ndarray, tolerance: float, keep: Optional[list[int]] = None
+) -> np.ndarray:
+    """Mask keeping the first point of every `tolerance` long stretch of
+    line, the ends and the `keep` indices."""
+    lengths = np.hypot(*np.diff(points, axis=0).T)
+    stretch = np.floor(np.concatenate(([0.0], np.cumsum(lengths))) / tolerance)
+    mask = np.concatenate(([True], np.diff(stretch) > 0))
+    mask[[-1, *(keep or [])]] = True
+    return mask
+
+
+def douglas_peucker(
+    points: np.ndarray, tolerance: float, keep: Optional[list[int]] = None
+) -> np.ndarray:
+    """Mask of the points kept by Douglas-Peucker simplification.
+
+    The ends and the `keep` indices are always kept, each stretch between
+    them being simplified on its own. Every pass splits all the stretches
+    left at once, at their point furthest from the chord.
+    """
+    mask = np.zeros(len(points), dtype=bool)
+    if len(points) == 0:
+        return mask
+    anchors = np.unique(np.concatenate(([0, len(points) - 1], keep or []))).astype(
+        np.intp
+    )
+    mask[anchors] = True
+    starts, ends = anchors[:-1], anchors[1:]
+    while True:
+        inner_sizes = ends - starts - 1
+        stretching = inner_sizes > 0
+        starts, ends, sizes = (
+            starts[stretching],
+            ends[stretching],
+            inner_sizes[stretching],
+        )
+        if len(starts) == 0:
+            return mask
+
+        # Every inner point of every stretch, with its stretch number
+        stretch = np.repeat(np.arange(len(starts)), sizes)
+        offsets = np.cumsum(sizes) - sizes
+        indices = starts[stretch] + 1 + np.arange(sizes.sum()) - offsets[stretch]
+
+        # Distance to the chord, as a segment
+        start = points[starts][stretch]
+        chord = points[ends][stretch] - start
+        inner = points[indices] - start
+        length2 = np.einsum("ij,ij->i", chord, chord)
+        t = np.einsum("ij,ij->i", inner, chord) / np.where(length2 > 0, length2, 1.0)
+        t = np.clip(t, 0.0, 1.0)
+        distances = np.hypot(*(inner - t[:, None] * chord).T)
+
+        furthest = np.maximum.reduceat(distances, offsets)
+        split = furthest > tolerance
+        # First point of each stretch at its furthest distance
+        at_max = np.flatnonzero(distances == furthest[stretch])
+        _, first = np.unique(stretch[at_max], return_index=True)
+        splits = indices[at_max[first]][split]
+        mask[splits] = True
+        starts = np.concatenate((starts[split], splits))
+        ends = np.concatenate((splits, ends[split]))
+
+
+def encode_polyline(
+    coordinates: np.ndarray, precision: int = POLYLINE_PRECISION
+) -> str:
+    """Google encoded polyline of [lon, lat] coordinates, stored lat first."""
+    ints = np.round(coordinates[:, ::-1] * 10**precision).astype(np.int64)
+    deltas = np.diff(ints, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    values = (deltas << 1) ^ (deltas >> 63)  # zigzag: small magnitudes, small ints
+
+    # Each value in 5-bit chunks, least significant first, all but the
+    # last one flagged with 0x20
+    chunks = (values[:, None] >> (5 * np.arange(7))) & 0x1F
+    sizes = 1 + (values[:, None] >= (1 << (5 * np.arange(1, 7)))).sum(axis=1)
+    used = np.arange(7) < sizes[:, None]
+    more = np.arange(7) < sizes[:, None] - 1
+    encoded = (chunks | np.where(more, 0x20, 0)) + 63
+    return encoded[used].astype(np.uint8).tobytes().decode("ascii")
+
+
+def compact_itinerary(itinerary: dict, zoom: Optional[int] = None) -> dict:
+    """The compact form of an ORS GeoJSON itinerary, simplified for `zoom`
+    when given."""
+    feature = itinerary["features"][0]
+    properties = feature["properties"]
+    coordinates = np.asarray(feature["geometry"]["coordinates"], dtype=np.float64)
+    way_points = properties.get("way_points", [0, max(len(coordinates) - 1, 0)])
+
+    if zoom is not None and len(coordinates) > 2:
+        points = web_mercator(coordinates)
+        tolerance = zoom_tolerance(zoom)
+        # Thin out runs of close points first, leaving far fewer to search
+        mask = radial_thinning(points, tolerance, keep=way_points)
+        (kept,) = np.nonzero(mask)
+        mask[kept] = douglas_peucker(
+            points[kept], tolerance, keep=np.searchsorted(kept, way_points).tolist()
+        )
+        coordinates = coordinates[mask]
+        way_points = (np.cumsum(mask) - 1)[way_points].tolist()
+
+    return {
+        "format": "polyline",
+        "precision": POLYLINE_PRECISION,
+        "bbox": itinerary.get("bbox", feature.get("bbox")),
+        "geometry": encode_polyline(coordinates),
+        "summary": properties.get("summary", {}),
+        "segments": [
+            {"distance": segment["distance"], "duration": segment["duration"]}
+            for segment in properties.get("segments", [])
+        ],
+        "way_points": way_points,
+    }
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable, NamedTuple, Optional, TypeVar
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from oufoaler.config import config
+from oufoaler.models.route import DistanceMode, Route
+
+logger = logging.getLogger(__name__)
+
+SHARED_MEMORY_MIN_BYTES = 64 * 1024  # smaller arrays are cheaper to pickle
+
+T = TypeVar("T")
+
+
+class SharedArray(NamedTuple):
+    """Handle to a numpy array placed in shared memory, sent instead of its data."""
+
+    name: str
+    shape: tuple
+    dtype: str
+
+    @classmethod
+    def create(
+        cls, array: np.ndarray
+    ) -> tuple["SharedArray", shared_memory.SharedMemory]:
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        return cls(shm.name, array.shape, array.dtype.str), shm
+
+    def attach(self) -> tuple[np.ndarray, shared_memory.SharedMemory]:
+        shm = shared_memory.SharedMemory(name=self.name)
+        array = np.ndarray(self.shape, dtype=np.dtype(self.dtype), buffer=shm.buf)
+        return array, shm
+
+
+def _init_worker() -> None:
+    """Warm a worker: transformers and station index are built once per process."""
+    from oufoaler.services.projections import transformers
+    from oufoaler.services.station_index import get_station_index
+
+    transformers.warm(config.prebuilt_utm_zones)
+    get_station_index()
+
+
+class SharedRoute(NamedTuple):
+    """Route sent to a worker, its arrays possibly in shared memory."""
+
+    coordinates: Any
+    distance_mode: DistanceMode
+    cumulative_distances: Any
+
+
+def _share(arg: Any, shared: list[shared_memory.SharedMemory]) -> Any:
+    if isinstance(arg, np.ndarray) and arg.nbytes >= SHARED_MEMORY_MIN_BYTES:
+        handle, shm = SharedArray.create(arg)
+        shared.append(shm)
+        return handle
+    if isinstance(arg, Route):
+        return SharedRoute(
+            _share(arg.coordinates, shared),
+            arg.distance_mode,
+            _share(arg._cumulative_distances, shared),
+        )
+    return arg
+
+
+def _resolve(
+    arg: Any, attached: list[tuple[np.ndarray, shared_memory.SharedMemory]]
+) -> Any:
+    if isinstance(arg, SharedArray):
+        array, shm = arg.attach()
+        attached.append((array, shm))
+        return array
+    if isinstance(arg, SharedRoute):
+        return Route(
+            _resolve(arg.coordinates, attached),
+            arg.distance_mode,
+            _resolve(arg.cumulative_distances, attached),
+        )
+    return arg
+
+
+def _detach(result: Any, views: list[np.ndarray]) -> Any:
+    """`result` with its arrays viewing shared memory copied out of it."""
+    if isinstance(result, np.ndarray):
+        if any(np.may_share_memory(result, view) for view in views):
+            return np.array(result, copy=True)
+        return result
+    if isinstance(result, tuple):
+        items = [_detach(item, views) for item in result]
+        return type(result)(*items) if hasattr(result, "_fields") else tuple(items)
+    if isinstance(result, list):
+        return [_detach(item, views) for item in result]
+    return result
+
+
+def _call_in_worker(function: Callable[..., T], args: tuple) -> T:
+    """Resolve shared arrays into zero-copy views, then call `function`,
+    copying the arrays of its result still viewing them."""
+    attached: list[tuple[np.ndarray, shared_memory.SharedMemory]] = []
+    resolved = [_resolve(arg, attached) for arg in args]
+    try:
+        return _detach(function(*resolved), [view for view, _ in attached])
+    finally:
+        # Drop every view before closing, a segment still viewed cannot be
+        segments = [shm for _, shm in attached]
+        del resolved, attached
+        for shm in segments:
+            shm.close()
+
+
+class WorkerPool:
+    """Optional process pool for the CPU-bound geometry and planning stages.
+
+    With no workers configured, work runs in the threadpool as before. Large
+    numpy arguments, and the arrays of Route arguments, are handed to workers
+    through shared memory rather than pickled; callables and other arguments
+    must be picklable.
+    """
+
+    def __init__(self, processes: int = 0) -> None:
+        self.processes = processes
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._executor is not None
+
+    async def start(self) -> None:
+        if self.processes <= 0 or self._executor is not None:
+            return
+        # Workers are spawned, forking a process running an event loop and
+        # threads is unsafe
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        # Start and warm every worker before serving requests
+        await asyncio.gather(
+            *(
+                asyncio.wrap_future(self._executor.submit(int))
+                for _ in range(self.processes)
+            )
+        )
+        logger.info(f"Started {self.processes} planning worker processes")
+
+    def stop(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, function: Callable[..., T], *args: Any) -> T:
+        if self._executor is None:
+            return await run_in_threadpool(function, *args)
+
+        shared: list[shared_memory.SharedMemory] = []
+        try:
+            sent_args = tuple(_share(arg, shared) for arg in args)
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, _call_in_worker, function, sent_args
+            )
+        finally:
+            for shm in shared:
+                shm.close()
+                shm.unlink()
+
+
+worker_pool = WorkerPool(processes=config.worker_processes)
@@ -1,4 +1,5 @@
-import requests
+import anyio.from_thread
+from pydantic import ValidationError
 from spyne import (
     Application,
     Array,
@@ -12,6 +13,14 @@ from spyne import (
 from spyne.protocol.soap import Soap11
 from spyne.server.wsgi import WsgiApplication
 
+from oufoaler.controllers.car_controller import CarNotFoundError
+from oufoaler.models.api import Coordinates, ItineraryRequest, ItineraryResponse
+from oufoaler.services.itinerary_planner import (
+    NoAccessibleStationError,
+    itinerary_planner,
+)
+from oufoaler.views.responses import error_content
+
 
 # SOAP Models
 class CoordinatesModel(ComplexModel):
@@ -73,100 +82,92 @@ class ItineraryRequestModel(ComplexModel):
     arrival_lon = Float
 
 
+def step_model(step: dict) -> StepModel:
+    return StepModel(
+        distance=step.get("distance"),
+        duration=step.get("duration"),
+        type=step.get("type"),
+        instruction=step.get("instruction"),
+        name=step.get("name"),
+        exit_number=step.get("exit_number"),
+        way_points=step.get("way_points", []),
+    )
+
+
+def segment_model(segment: dict) -> SegmentModel:
+    return SegmentModel(
+        distance=segment.get("distance"),
+        duration=segment.get("duration"),
+        steps=[step_model(step) for step in segment.get("steps", [])],
+    )
+
+
+def feature_model(feature: dict) -> FeatureModel:
+    properties = feature["properties"]
+    summary = properties.get("summary", {})
+    return FeatureModel(
+        properties=FeaturePropertiesModel(
+            segments=[
+                segment_model(segment) for segment in properties.get("segments", [])
+            ],
+            summary=ItinerarySummaryModel(
+                distance=summary.get("distance"), duration=summary.get("duration")
+            ),
+            way_points=properties.get("way_points", []),
+        )
+    )
+
+
+def response_model(response: ItineraryResponse) -> ItineraryResponseModel:
+    return ItineraryResponseModel(
+        status=response.status,
+        message="",
+        total_charging_time_minutes=response.total_charging_time_minutes,
+        itinerary=ItineraryModel(
+            features=[
+                feature_model(feature) for feature in response.itinerary["features"]
+            ]
+        ),
+        recharge_stops=[
+            CoordinatesModel(lat=lat, lon=lon) for lon, lat in response.recharge_stops
+        ],
+    )
+
+
 # SOAP Service
 class ItineraryService(ServiceBase):
     @rpc(ItineraryRequestModel, _returns=ItineraryResponseModel)
     def get_itinerary(ctx, request):
-        # Transform SOAP request to REST request
-        rest_payload = {
-            "car_id": request.car_id,
-            "soc_start": request.soc_start,
-            "soc_min": request.soc_min,
-            "soc_max": request.soc_max,
-            "departure": {"lat": request.departure_lat, "lon": request.departure_lon},
-            "arrival": {"lat": request.arrival_lat, "lon": request.arrival_lon},
-        }
-
-        # Call REST API
+        """Plan the itinerary with the same planner as the REST API.
+
+        The WSGI app is mounted in the FastAPI app, which runs it in a
+        worker thread: the plan is awaited on the app's event loop, so the
+        SOAP call shares the REST API's caches and HTTP client.
+        """
         try:
-            response = requests.post(
-                "http://localhost:8000/api/v1/itinerary", json=rest_payload
+            itinerary_request = ItineraryRequest(
+                car_id=request.car_id,
+                soc_start=request.soc_start,
+                soc_min=request.soc_min,
+                soc_max=request.soc_max,
+                departure=Coordinates(
+                    lat=request.departure_lat, lon=request.departure_lon
+                ),
+                arrival=Coordinates(lat=request.arrival_lat, lon=request.arrival_lon),
             )
-            data = response.json()
-
-            # Transform REST response to SOAP response
-
-            # Build recharge_stops
-            recharge_stops_data = data.get("recharge_stops", [])
-            recharge_stops = []
-            for coord in recharge_stops_data:
-                lon, lat = coord
-                recharge_stops.append(CoordinatesModel(lat=lat, lon=lon))
-
-            # Build itinerary
-            features_data = data["itinerary"]["features"]
-            features = []
-            for feature_data in features_data:
-                properties_data = feature_data["properties"]
-                segments_data = properties_data.get("segments", [])
-                summary_data = properties_data.get("summary", {})
-                way_points_data = properties_data.get("way_points", [])
-
-                # Build segments
-                segments = []
-                for segment_data in segments_data:
-                    steps_data = segment_data.get("steps", [])
-                    steps = []
-                    for step_data in steps_data:
-                        step = StepModel(
-                            distance=step_data.get("distance"),
-                            duration=step_data.get("duration"),
-                            type=step_data.get("type"),
-                            instruction=step_data.get("instruction"),
-                            name=step_data.get("name"),
-                            exit_number=step_data.get("exit_number"),
-                            way_points=step_data.get("way_points", []),
-                        )
-                        steps.append(step)
-
-                    segment = SegmentModel(
-                        distance=segment_data.get("distance"),
-                        duration=segment_data.get("duration"),
-                        steps=steps,
-                    )
-                    segments.append(segment)
-
-                # Build summary
-                summary = ItinerarySummaryModel(
-                    distance=summary_data.get("distance"),
-                    duration=summary_data.get("duration"),
-                )
-
-                # Build properties
-                properties = FeaturePropertiesModel(
-                    segments=segments,
-                    summary=summary,
-                    way_points=way_points_data,
-                )
-
-                # Build feature
-                feature = FeatureModel(properties=properties)
-
-                features.append(feature)
-
-            itinerary = ItineraryModel(features=features)
-
+            response = anyio.from_thread.run(itinerary_planner.plan, itinerary_request)
+        except ValidationError as e:
             return ItineraryResponseModel(
-                status=data.get("status", "error"),
-                message=data.get("message", ""),
-                total_charging_time_minutes=data.get("total_charging_time_minutes", 0),
-                itinerary=itinerary,
-                recharge_stops=recharge_stops,
+                status="error", message=str(e), total_charging_time_minutes=0
             )
-        except Exception as e:
+        except (CarNotFoundError, RuntimeError, NoAccessibleStationError) as e:
+            _, content = error_content(e)
             return ItineraryResponseModel(
-                status="error", message=str(e), total_charging_time_minutes=0
+                status="error",
+                message=content["message"],
+                total_charging_time_minutes=0,
             )
+        return response_model(response)
 
 
 # Create SOAP Application
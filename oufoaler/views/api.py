@@ -1,123 +1,172 @@
-import pandas as pd
-import requests
-from fastapi import APIRouter
-from fastapi.responses import JSONResponse
-
-from oufoaler.controllers.car_controller import CarController
-from oufoaler.controllers.charging_station_controller import (
-    ChargingStationsController,
+from typing import Literal, Optional
+
+import orjson
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import JSONResponse, Response
+
+from oufoaler.config import config
+from oufoaler.controllers.car_controller import CarController, CarNotFoundError
+from oufoaler.models.api import (
+    ItineraryBatchRequest,
+    ItineraryRequest,
+    ItineraryResponse,
+    ReachabilityRequest,
+)
+from oufoaler.services.itinerary_planner import (
+    NoAccessibleStationError,
+    itinerary_planner,
+)
+from oufoaler.services.reachability import reachability_service
+from oufoaler.services.wire_format import compact_itinerary
+from oufoaler.views.responses import (
+    accepted_encoding,
+    error_content,
+    json_response,
+    ndjson_response,
 )
-from oufoaler.controllers.itinerary_controller import ItineraryController
-from oufoaler.models.api import ItineraryRequest
 
 router = APIRouter(prefix="/api/v1", tags=["api"])
 
-itinerary_ctrl = ItineraryController()
 car_ctrl = CarController()
-charging_stations_ctrl = ChargingStationsController()
 
 
-@router.post("/itinerary", status_code=200, response_class=JSONResponse)
-def get_itinerary(request: ItineraryRequest):
-    try:
-        car = car_ctrl.get_car_by_id(request.car_id)
-    except ValueError as e:
-        return JSONResponse(
-            status_code=404, content={"status": "error", "message": str(e)}
+@router.get("/cars", status_code=200)
+async def get_cars(
+    request: Request, make: Optional[str] = None, model: Optional[str] = None
+):
+    catalogue_index = car_ctrl.catalogue.get_index()
+    if make is not None:
+        cars = catalogue_index.find(make, model)
+        return JSONResponse(content=[car._asdict() for car in cars])
+
+    # Full catalogue, served pre-serialized and pre-compressed
+    if accepted_encoding(request, ("gzip",)) == "gzip":
+        return Response(
+            content=catalogue_index.json_gzip,
+            media_type="application/json",
+            headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
         )
-    except RuntimeError:
-        return JSONResponse(
-            status_code=500,
-            content={"status": "error", "message": "Internal server error"},
-        )
-    start_coords = request.departure
-    end_coords = request.arrival
+    return Response(
+        content=catalogue_index.json,
+        media_type="application/json",
+        headers={"Vary": "Accept-Encoding"},
+    )
 
-    # Step 1: Calculate itinerary
-    initial_itinerary = itinerary_ctrl.get_driving_route(start_coords, end_coords)
 
-    # Step 2: Fetch route details
-    waypoints = itinerary_ctrl.extract_waypoints_from_geojson(initial_itinerary)
+GeometryFormat = Literal["geojson", "polyline"]
+FORMAT_QUERY = Query(
+    "geojson",
+    alias="format",
+    description="`polyline` for a compact itinerary with an encoded polyline",
+)
+ZOOM_QUERY = Query(
+    None,
+    ge=0,
+    le=22,
+    description="Map zoom level the polyline is simplified for, none to keep it all",
+)
 
-    # Step 3: Fetch route distance
-    cumulative_distances, total_distance = itinerary_ctrl.compute_cumulative_distances(
-        waypoints
-    )
 
-    # Step 4: Create a pd DataFrame
-    route_df = pd.DataFrame(
-        {"waypoint": waypoints, "cumulative_distance_km": cumulative_distances}
-    )
+def encode_itinerary(
+    itinerary: dict, geometry_format: GeometryFormat, zoom: Optional[int]
+) -> dict:
+    if geometry_format == "polyline":
+        return compact_itinerary(itinerary, zoom)
+    return itinerary
 
-    # Step 5: Calculate SoC per km
-    soc_per_km = car_ctrl.calculate_soc_per_km(car)
 
-    # Step 6: Calculate max distance without charging
-    max_distance_without_charging = car_ctrl.calculate_max_distance_without_charging(
-        request.soc_start, request.soc_min, soc_per_km
-    )
+def response_content(
+    response: ItineraryResponse, geometry_format: GeometryFormat, zoom: Optional[int]
+) -> dict:
+    # The itinerary is not copied by model_dump, only serialized
+    content = response.model_dump(exclude={"itinerary"})
+    content["itinerary"] = encode_itinerary(response.itinerary, geometry_format, zoom)
+    return content
 
-    # Step 7: Check if charging is necessary
-    if max_distance_without_charging >= total_distance:
-        return JSONResponse(
-            status_code=200,
-            content={
-                "status": "ok",
-                "itinerary": initial_itinerary,
-                "recharge_stops": [],
-                "total_charging_time_minutes": 0,
-            },
-        )
-    else:
-        session = requests.Session()
 
-        # Fetch charging stations near the route
-        stations = charging_stations_ctrl.find_charging_stations_near_route(
-            waypoints, car, session
-        )
+def ndjson_line(line: dict) -> bytes:
+    return orjson.dumps(line, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n"
+
+
+@router.post("/itinerary", status_code=200)
+async def get_itinerary(
+    request: ItineraryRequest,
+    http_request: Request,
+    geometry_format: GeometryFormat = FORMAT_QUERY,
+    zoom: Optional[int] = ZOOM_QUERY,
+):
+    try:
+        response = await itinerary_planner.plan(request)
+    except (CarNotFoundError, RuntimeError, NoAccessibleStationError) as e:
+        status_code, content = error_content(e)
+        return JSONResponse(status_code=status_code, content=content)
+    return json_response(
+        http_request, response_content(response, geometry_format, zoom)
+    )
 
-        # Compute positions of stations along the route
-        stations_df = itinerary_ctrl.compute_station_positions_along_route(
-            stations, waypoints
-        )
 
-        # Plan recharge stops
+@router.post("/itinerary:stream", status_code=200)
+async def stream_itinerary(
+    request: ItineraryRequest,
+    http_request: Request,
+    geometry_format: GeometryFormat = FORMAT_QUERY,
+    zoom: Optional[int] = ZOOM_QUERY,
+):
+    """Plan one itinerary, streamed back as NDJSON events as planning goes:
+    {"event": "route", "itinerary"} with the direct route, {"event": "stop",
+    "location"} for each recharge stop, then {"event": "itinerary", ...}
+    with the final response, or {"event": "error", "status_code", ...}."""
+
+    async def events():
         try:
-            recharge_stops = itinerary_ctrl.plan_recharge_stops(
-                route_df,
-                stations_df,
-                request.soc_start,
-                request.soc_min,
-                request.soc_max,
-                soc_per_km,
-            )
+            async for event, data in itinerary_planner.plan_stream(request):
+                if event == "route":
+                    itinerary = encode_itinerary(data, geometry_format, zoom)
+                    line = {"event": event, "itinerary": itinerary}
+                elif event == "stop":
+                    line = {"event": event, "location": data}
+                else:
+                    content = response_content(data, geometry_format, zoom)
+                    line = {"event": event, **content}
+                yield ndjson_line(line)
         except Exception as e:
-            return JSONResponse(
-                status_code=422,
-                content={
-                    "status": "error",
-                    "message": "No accessible charging stations found before reaching minimum battery level.",
-                },
-            )
-
-        total_charging_time = itinerary_ctrl.calculate_total_charging_time(
-            recharge_stops, car, request.soc_min, request.soc_max
-        )
-        charging_stations_waypoints = [
-            tuple([station["xlongitude"], station["ylatitude"]])
-            for station in recharge_stops
-        ]
+            status_code, content = error_content(e)
+            yield ndjson_line({"event": "error", "status_code": status_code, **content})
 
-        final_itinerary_waypoints = itinerary_ctrl.get_driving_route(
-            start_coords, end_coords, charging_stations_waypoints
-        )
-        # Prepare response
+    return ndjson_response(http_request, events())
+
+
+@router.post("/itineraries:batch", status_code=200)
+async def get_itineraries_batch(batch: ItineraryBatchRequest, http_request: Request):
+    """Plan many itineraries at once, streamed back as NDJSON in completion
+    order: one {"index", "status_code", ...} object per request."""
+    if len(batch.requests) > config.itinerary_batch_max_size:
         return JSONResponse(
-            status_code=200,
+            status_code=413,
             content={
-                "status": "ok",
-                "itinerary": final_itinerary_waypoints,
-                "recharge_stops": charging_stations_waypoints,
-                "total_charging_time_minutes": total_charging_time,
+                "status": "error",
+                "message": f"At most {config.itinerary_batch_max_size} requests per batch",
             },
         )
+
+    async def results():
+        async for index, result in itinerary_planner.plan_batch(batch.requests):
+            if isinstance(result, Exception):
+                status_code, content = error_content(result)
+            else:
+                status_code, content = 200, result.model_dump()
+            yield ndjson_line({"index": index, "status_code": status_code, **content})
+
+    return ndjson_response(http_request, results())
+
+
+@router.post("/reachability", status_code=200)
+async def get_reachability(request: ReachabilityRequest, http_request: Request):
+    """Areas reachable from an origin on the charge left, and with one stop
+    at a fast charger, as GeoJSON geometries."""
+    try:
+        response = await reachability_service.reachable(request)
+    except (CarNotFoundError, RuntimeError) as e:
+        status_code, content = error_content(e)
+        return JSONResponse(status_code=status_code, content=content)
+    return json_response(http_request, response.model_dump())
@@ -0,0 +1,99 @@
+import gzip
+import zlib
+from types import ModuleType
+from typing import Any, AsyncIterator, Optional, Union
+
+import orjson
+from fastapi import Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from oufoaler.controllers.car_controller import CarNotFoundError
+from oufoaler.controllers.itinerary_controller import NoAccessibleStationError
+
+brotli: Optional[ModuleType]
+try:
+    import brotli
+except ImportError:  # optional, responses are then gzipped
+    brotli = None
+
+MIN_COMPRESSED_BYTES = 1024  # smaller bodies are sent as is
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def error_content(error: Exception) -> tuple[int, dict]:
+    """Status code and body reported for a failed itinerary request."""
+    if isinstance(error, CarNotFoundError):
+        return 404, {"status": "error", "message": str(error)}
+    if isinstance(error, NoAccessibleStationError):
+        return 422, {"status": "error", "message": str(error)}
+    return 500, {"status": "error", "message": "Internal server error"}
+
+
+def accepted_encoding(
+    request: Request, encodings: tuple[str, ...] = ("br", "gzip")
+) -> Optional[str]:
+    """The first of `encodings` (brotli and gzip by default) the client
+    accepts, if any."""
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, *params = [token.strip() for token in part.split(";")]
+        quality = next((param[2:] for param in params if param.startswith("q=")), "1")
+        try:
+            if float(quality) > 0:
+                accepted.add(coding.lower())
+        except ValueError:
+            continue
+    for encoding in encodings:
+        if encoding in accepted and (encoding != "br" or brotli is not None):
+            return encoding
+    return None
+
+
+def compress(body: Union[bytes, memoryview], encoding: str) -> bytes:
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def json_response(request: Request, content: Any, status_code: int = 200):
+    """orjson-serialized JSON response, compressed as the client accepts."""
+    response = ORJSONResponse(content=content, status_code=status_code)
+    response.headers["Vary"] = "Accept-Encoding"
+    encoding = accepted_encoding(request)
+    if encoding is not None and len(response.body) >= MIN_COMPRESSED_BYTES:
+        response.body = compress(response.body, encoding)
+        response.headers["Content-Encoding"] = encoding
+        response.headers["Content-Length"] = str(len(response.body))
+    return response
+
+
+async def compress_stream(
+    chunks: AsyncIterator[bytes], encoding: str
+) -> AsyncIterator[bytes]:
+    """Compress a stream, flushing after every chunk so the client can
+    decode each one as soon as it arrives."""
+    if encoding == "br" and brotli is not None:
+        compressor = brotli.Compressor(quality=5)
+        async for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+        return
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip
+    async for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def ndjson_response(request: Request, lines: AsyncIterator[bytes]) -> StreamingResponse:
+    """Streamed NDJSON response, compressed as the client accepts."""
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = accepted_encoding(request)
+    if encoding is not None:
+        lines = compress_stream(lines, encoding)
+        headers["Content-Encoding"] = encoding
+    return StreamingResponse(lines, media_type="application/x-ndjson", headers=headers)
@@ -1,6 +1,9 @@
 // Initialize the map
 var map;
 
+// Zoom levels above the whole-trip view that routes are detailed enough for
+const ROUTE_ZOOM_MARGIN = 2;
+
 // Step 1: Define custom icons at the top of main.js
 const markerIcons = {
     departure: L.icon({
@@ -206,96 +209,68 @@ document.getElementById('itinerary-form').addEventListener('submit', async funct
             arrival: arrival
         };
 
-        // Send payload to API
-        const response = await fetch('/api/v1/itinerary', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify(payload)
-        });
-
-        if (!response.ok) {
-            throw new Error(`API Error ${response.status}`);
-        }
-
-        const data = await response.json();
-
-        if (data.status !== 'ok') {
-            throw new Error('Error from API: ' + JSON.stringify(data));
-        }
-
-        // Display total charging time
-        document.getElementById('result').innerHTML = `<p class="text-lg font-medium">Total Charging Time: ${data.total_charging_time_minutes} minutes</p>`;
-
         // Clear existing layers (except the base tile layer)
-        map.eachLayer(function(layer){
-            if (layer instanceof L.Marker || layer instanceof L.Polyline || layer instanceof L.GeoJSON) {
-                map.removeLayer(layer);
-            }
-        });
-
-        // Add GeoJSON route
-        const routeGeoJSON = L.geoJSON(data.itinerary, {
-            style: {
-                color: 'blue',
-                weight: 4,
-                opacity: 0.8
-            }
-        }).addTo(map);
-
-        // Add markers for used charging stations
-        const recharge_stops = data.recharge_stops;
-
-        if (recharge_stops && recharge_stops.length > 0) {
-            recharge_stops.forEach(stop => {
-                let lat, lon;
-
-                // Check if stop is an array [lon, lat]
-                if (Array.isArray(stop) && stop.length >= 2) {
-                    lon = parseFloat(stop[0]);
-                    lat = parseFloat(stop[1]);
-                } else if (stop.xlongitude && stop.ylatitude) {
-                    // If stop is an object with xlongitude and ylatitude properties
-                    lon = parseFloat(stop.xlongitude);
-                    lat = parseFloat(stop.ylatitude);
-                } else {
-                    console.error('Invalid format for recharge stop:', stop);
-                    return;
-                }
-
-                if (isNaN(lat) || isNaN(lon)) {
-                    console.error('Invalid coordinates for recharge stop:', stop);
-                    return;
-                }
+        clearItineraryLayers();
 
-                const marker = L.marker([lat, lon], { 
-                    icon: markerIcons.charging 
-                }).addTo(map);
-
-                marker.bindPopup('Charging Station');
-            });
-        }
-
-        // Add departure marker
+        // Add departure and arrival markers
         const departureMarker = L.marker(
             [departure.lat, departure.lon], 
             { icon: markerIcons.departure }
         ).addTo(map);
         departureMarker.bindPopup('Departure: ' + departure_address);
 
-        // Add arrival marker
         const arrivalMarker = L.marker(
             [arrival.lat, arrival.lon], 
             { icon: markerIcons.arrival }
         ).addTo(map);
         arrivalMarker.bindPopup('Arrival: ' + arrival_address);
 
-        // Fit map to bounds
-        const bounds = routeGeoJSON.getBounds();
-        bounds.extend([departure.lat, departure.lon]);
-        bounds.extend([arrival.lat, arrival.lon]);
-        map.fitBounds(bounds);
+        // Stream the itinerary, rendering each step as soon as it is planned:
+        // the direct route, then the recharge stops, then the final route
+        let routeLayer = null;
+        let itineraryReceived = false;
+
+        // Compact polyline routes, simplified for the zoom the trip will be
+        // shown at, with some room to zoom in
+        const tripBounds = L.latLngBounds([[departure.lat, departure.lon], [arrival.lat, arrival.lon]]);
+        const zoom = Math.min(map.getBoundsZoom(tripBounds) + ROUTE_ZOOM_MARGIN, map.getMaxZoom());
+
+        await streamItinerary(payload, zoom, function(event) {
+            if (event.event === 'error') {
+                throw new Error('Error from API: ' + JSON.stringify(event));
+            }
+
+            if (event.event === 'route') {
+                hideLoader();
+                document.getElementById('result').innerHTML = '<p class="text-lg font-medium">Planning charging stops...</p>';
+                routeLayer = addRouteLayer(event.itinerary, { color: 'gray', weight: 4, opacity: 0.6, dashArray: '8 8' });
+                fitItinerary(routeLayer, departure, arrival);
+            } else if (event.event === 'stop') {
+                addChargingMarker(event.location);
+            } else if (event.event === 'itinerary') {
+                if (event.status !== 'ok') {
+                    throw new Error('Error from API: ' + JSON.stringify(event));
+                }
+                itineraryReceived = true;
+
+                // Display total charging time
+                document.getElementById('result').innerHTML = `<p class="text-lg font-medium">Total Charging Time: ${event.total_charging_time_minutes} minutes</p>`;
+
+                // Replace the direct route with the final one
+                if (routeLayer) {
+                    map.removeLayer(routeLayer);
+                } else {
+                    // Served from the cache, stops were not streamed
+                    (event.recharge_stops || []).forEach(addChargingMarker);
+                }
+                routeLayer = addRouteLayer(event.itinerary, { color: 'blue', weight: 4, opacity: 0.8 });
+                fitItinerary(routeLayer, departure, arrival);
+            }
+        });
+
+        if (!itineraryReceived) {
+            throw new Error('Itinerary stream ended unexpectedly');
+        }
 
     } catch (error) {
         console.error(error);
@@ -305,6 +280,121 @@ document.getElementById('itinerary-form').addEventListener('submit', async funct
         hideLoader();
     }
 });
+// Post an itinerary request to the streaming endpoint, calling onEvent with
+// each NDJSON event as it arrives; routes come as polylines simplified for
+// the given zoom level
+async function streamItinerary(payload, zoom, onEvent) {
+    const response = await fetch(`/api/v1/itinerary:stream?format=polyline&zoom=${zoom}`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(payload)
+    });
+
+    if (!response.ok) {
+        throw new Error(`API Error ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { done, value } = await reader.read();
+        buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.filter(line => line.trim()).forEach(line => onEvent(JSON.parse(line)));
+
+        if (done) {
+            if (buffer.trim()) {
+                onEvent(JSON.parse(buffer));
+            }
+            return;
+        }
+    }
+}
+
+// Remove markers and routes, keeping the base tile layer
+function clearItineraryLayers() {
+    map.eachLayer(function(layer){
+        if (layer instanceof L.Marker || layer instanceof L.Polyline || layer instanceof L.GeoJSON) {
+            map.removeLayer(layer);
+        }
+    });
+}
+
+// Draw a route given as GeoJSON or in the compact polyline format
+function addRouteLayer(itinerary, style) {
+    if (itinerary.format === 'polyline') {
+        return L.polyline(decodePolyline(itinerary.geometry, itinerary.precision), style).addTo(map);
+    }
+    return L.geoJSON(itinerary, { style: style }).addTo(map);
+}
+
+// Decode a Google encoded polyline into [lat, lon] pairs
+function decodePolyline(encoded, precision) {
+    const factor = Math.pow(10, precision);
+    const latlngs = [];
+    let index = 0, lat = 0, lon = 0;
+
+    while (index < encoded.length) {
+        // Each coordinate is a zigzag-encoded delta, in 5-bit chunks
+        const deltas = [0, 0];
+        for (let i = 0; i < 2; i++) {
+            let result = 0, shift = 0, byte;
+            do {
+                byte = encoded.charCodeAt(index++) - 63;
+                result |= (byte & 0x1f) << shift;
+                shift += 5;
+            } while (byte >= 0x20);
+            deltas[i] = (result & 1) ? ~(result >> 1) : (result >> 1);
+        }
+        lat += deltas[0];
+        lon += deltas[1];
+        latlngs.push([lat / factor, lon / factor]);
+    }
+    return latlngs;
+}
+
+// Add a marker for a recharge stop, given as [lon, lat] or as a station
+function addChargingMarker(stop) {
+    let lat, lon;
+
+    // Check if stop is an array [lon, lat]
+    if (Array.isArray(stop) && stop.length >= 2) {
+        lon = parseFloat(stop[0]);
+        lat = parseFloat(stop[1]);
+    } else if (stop.xlongitude && stop.ylatitude) {
+        // If stop is an object with xlongitude and ylatitude properties
+        lon = parseFloat(stop.xlongitude);
+        lat = parseFloat(stop.ylatitude);
+    } else {
+        console.error('Invalid format for recharge stop:', stop);
+        return;
+    }
+
+    if (isNaN(lat) || isNaN(lon)) {
+        console.error('Invalid coordinates for recharge stop:', stop);
+        return;
+    }
+
+    const marker = L.marker([lat, lon], { 
+        icon: markerIcons.charging 
+    }).addTo(map);
+
+    marker.bindPopup('Charging Station');
+}
+
+// Fit map to the route, departure and arrival
+function fitItinerary(routeLayer, departure, arrival) {
+    const bounds = routeLayer.getBounds();
+    bounds.extend([departure.lat, departure.lon]);
+    bounds.extend([arrival.lat, arrival.lon]);
+    map.fitBounds(bounds);
+}
+
 // Function to geocode an address
 async function geocodeAddress(address) {
     const url = `https://nominatim.openstreetmap.org/search?format=json&q=${encodeURIComponent(address)}`;
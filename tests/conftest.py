@@ -0,0 +1,2 @@
+# offline sets up the environment, before any oufoaler import
+from benchmarks import offline  # noqa: F401
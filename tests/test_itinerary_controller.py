@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from oufoaler.controllers.itinerary_controller import ItineraryController
+from oufoaler.models.car import Car
+from oufoaler.models.route import Route
+from oufoaler.services.charging_optimizer import ChargingStopOptimizer
+
+CAR = Car("car", "Make", "Model", "1", 150.0, 77.0, 450.0, 350.0)
+SOC_PER_KM = 0.25
+
+
+@pytest.fixture
+def route():
+    # About 670 km due east along the equator
+    return Route(np.column_stack([np.linspace(0.0, 6.0, 601), np.zeros(601)]))
+
+
+def stations(route: Route, powers: list[float]) -> pd.DataFrame:
+    """Stations on the route, evenly spaced between its ends."""
+    distances = np.linspace(0.0, route.total_distance, len(powers) + 2)[1:-1]
+    return pd.DataFrame(
+        {
+            "xlongitude": np.interp(
+                distances, route.cumulative_distances, route.coordinates[:, 0]
+            ),
+            "ylatitude": 0.0,
+            "puiss_max": powers,
+            "distance_along_route_km": distances,
+            "distance_from_route_km": 0.0,
+        }
+    )
+
+
+def reaches_arrival(route, stops, soc_start, soc_min, soc_max) -> bool:
+    """Whether charging to soc_max at each stop keeps above soc_min."""
+    positions = [0.0] + [stop["distance_along_route_km"] for stop in stops]
+    hops = np.diff(positions + [route.total_distance]) * SOC_PER_KM
+    return hops[0] <= soc_start - soc_min and bool(
+        np.all(hops[1:] <= soc_max - soc_min)
+    )
+
+
+@pytest.mark.parametrize(
+    "powers",
+    [
+        [150.0] * 12,
+        [22.0, 150.0, 50.0, 22.0, 150.0, 50.0, 22.0, 150.0, 50.0, 22.0, 150.0, 50.0],
+    ],
+)
+def test_optimal_plan_charges_no_longer_than_greedy(route, powers):
+    ctrl = ItineraryController()
+    df_stations = stations(route, powers)
+    cumulative_soc = route.cumulative_distances * SOC_PER_KM
+    args = (route, df_stations, 80.0, 10.0, 80.0, cumulative_soc)
+
+    greedy_stops = ctrl.plan_recharge_stops(*args)
+    greedy_minutes = ctrl.calculate_total_charging_time(greedy_stops, CAR, 10.0, 80.0)
+    stops, minutes, outcome = ctrl.plan_optimal_recharge_stops(
+        route,
+        df_stations,
+        CAR,
+        80.0,
+        10.0,
+        80.0,
+        cumulative_soc,
+        SOC_PER_KM,
+        optimizer=ChargingStopOptimizer(soc_step=1.0, time_budget=10.0),
+    )
+
+    assert reaches_arrival(route, greedy_stops, 80.0, 10.0, 80.0)
+    assert reaches_arrival(route, stops, 80.0, 10.0, 80.0)
+    assert outcome in ("optimal", "fallback_greedy")
+    assert 0 < minutes <= greedy_minutes
+
+
+def test_optimal_plan_without_charging(route):
+    ctrl = ItineraryController()
+    cumulative_soc = route.cumulative_distances * 0.05
+    stops, minutes, outcome = ctrl.plan_optimal_recharge_stops(
+        route, stations(route, [150.0]), CAR, 80.0, 10.0, 80.0, cumulative_soc, 0.05
+    )
+    assert (stops, minutes, outcome) == ([], 0, "optimal")
@@ -0,0 +1,60 @@
+import pytest
+
+from oufoaler.config import config
+from oufoaler.models.api import Coordinates, ItineraryRequest
+from oufoaler.services.itinerary_planner import ItineraryPlanner
+
+
+@pytest.fixture
+def planner():
+    return ItineraryPlanner(
+        cache_size=16, ttl=60.0, soc_step=5.0, temperature_step=5.0, precision=3
+    )
+
+
+def request(**values) -> ItineraryRequest:
+    return ItineraryRequest(
+        car_id="car",
+        soc_start=80.0,
+        soc_min=10.0,
+        soc_max=80.0,
+        departure=Coordinates(lat=48.39, lon=-4.49),
+        arrival=Coordinates(lat=48.86, lon=2.35),
+    ).model_copy(update=values)
+
+
+@pytest.mark.parametrize(
+    "planned, requested, covered",
+    [
+        (request(), request(), True),
+        (request(soc_start=76.0), request(soc_start=79.0), True),
+        (request(soc_start=79.0), request(soc_start=76.0), False),
+        (request(soc_min=14.0), request(soc_min=11.0), True),
+        (request(soc_min=11.0), request(soc_min=14.0), False),
+        (request(soc_max=76.0), request(soc_max=79.0), True),
+        (request(soc_max=79.0), request(soc_max=76.0), False),
+    ],
+)
+def test_covers_by_soc(planner, planned, requested, covered):
+    assert planner.covers(planned, requested) is covered
+
+
+@pytest.mark.parametrize(
+    "planned_c, requested_c, covered",
+    [
+        (11.0, 14.0, True),  # colder costs more
+        (14.0, 11.0, False),
+        (29.9, 25.0, True),  # hotter costs more past the heat threshold
+        (25.0, 29.9, False),
+        # Unknown temperatures are planned at the configured default
+        (None, config.consumption_temperature_c, True),
+        (config.consumption_temperature_c, None, True),
+    ],
+)
+def test_covers_by_temperature(planner, planned_c, requested_c, covered):
+    planned = request(temperature_c=planned_c)
+    requested = request(temperature_c=requested_c)
+    assert planner.cache_key(planner.canonicalize(planned)) == planner.cache_key(
+        planner.canonicalize(requested)
+    )
+    assert planner.covers(planned, requested) is covered
@@ -0,0 +1,16 @@
+import numpy as np
+
+from oufoaler.services.station_tile_cache import Tile, tile_indices
+
+
+def test_tile_indices_of_points_without_coordinates():
+    x, y = tile_indices([2.35, np.nan, 2.35], [48.85, 48.85, np.nan], 10)
+    assert x.tolist() == [518, -1, -1]
+    assert y.tolist() == [352, -1, -1]
+
+
+def test_tile_indices_contain_their_points():
+    x, y = tile_indices([2.35], [48.85], 10)
+    minx, miny, maxx, maxy = Tile(10, int(x[0]), int(y[0])).bounds
+    assert minx <= 2.35 < maxx
+    assert miny <= 48.85 < maxy
@@ -0,0 +1,13 @@
+import numpy as np
+
+from oufoaler.services.wire_format import encode_polyline
+
+
+def test_encode_polyline_matches_the_reference_vector():
+    # From Google's encoded polyline algorithm format documentation
+    coordinates = np.array([[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]])
+    assert encode_polyline(coordinates) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+
+def test_encode_polyline_of_no_coordinates_is_empty():
+    assert encode_polyline(np.empty((0, 2))) == ""